@@ -0,0 +1,161 @@
+# /libs/assets.py
+# -*- coding: utf-8 -*-
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Asset normalisation: images stored as RGBA at the size they are drawn, so drawing never
+converts or resamples an image it has seen before.
+
+Resource images are normalised in place by `normalize_resources`. User-supplied images
+(`-B`/`-C`) are normalised on first use into a cache keyed by the hash of the file, held in
+memory and on disk as raw RGBA pixels.
+"""
+from collections import OrderedDict as _OrderedDict
+import os as _os
+import threading as _threading
+
+import PIL.Image as _Image
+
+from .bundle import normalize_key as _normalize_key
+from .cache import file_digest as _file_digest
+from .utils import open_image as _open_image
+
+ASSET_CACHE_DIR = ".cache/assets"
+ASSET_MEMORY_BYTES = 64 * 1048576
+
+def normalize_image(image: _Image.Image, size: tuple[int, int] | None = None) -> _Image.Image:
+    """Convert an image to RGBA and resize it, skipping the steps that are not needed.
+    Params:
+        image (PIL.Image.Image): The image.
+        size (tuple[int, int] | None): The size to draw it at. `None` keeps its size.
+    Returns:
+        PIL.Image.Image: The image itself if it is already RGBA at that size, a new one otherwise.
+    """
+    if image.mode != "RGBA":
+        image = image.convert("RGBA")
+    if size is not None and image.size != size:
+        image = image.resize(size)
+    return image
+
+class AssetCache:
+    """User-supplied images normalised to RGBA at a given size, keyed by the hash of the file.
+    The least recently used ones are dropped from memory beyond a size limit; the disk copies
+    stay. Safe to share between threads."""
+
+    def __init__(self, directory: str = ASSET_CACHE_DIR, max_bytes: int = ASSET_MEMORY_BYTES) -> None:
+        """Open the cache.
+        Params:
+            directory (str): The cache directory. It is created on first write.
+            max_bytes (int): The size limit of the images kept in memory.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._images: _OrderedDict[str, tuple[tuple[int, int], bytes]] = _OrderedDict()
+        self._bytes = 0
+        self._lock = _threading.Lock()
+
+    def key(self, path: str, size: tuple[int, int]) -> str | None:
+        """Name a normalised image.
+        Params:
+            path (str): The image path.
+            size (tuple[int, int]): The size it is drawn at.
+        Returns:
+            str | None: The key, e.g. `<sha256>-768x1052`, or `None` if the file is not on
+            the disk.
+        """
+        digest = _file_digest(path)
+        return f"{digest}-{size[0]}x{size[1]}" if digest else None
+
+    def _path(self, key: str) -> str:
+        return _os.path.join(self.directory, key[:2], key + ".rgba")
+
+    def _remember(self, key: str, entry: tuple[tuple[int, int], bytes]) -> None:
+        with self._lock:
+            if key not in self._images:
+                self._images[key] = entry
+                self._bytes += len(entry[1])
+            while self._bytes > self.max_bytes and len(self._images) > 1:
+                _, (_, data) = self._images.popitem(last=False)
+                self._bytes -= len(data)
+
+    def _load(self, key: str, size: tuple[int, int]) -> bytes | None:
+        try:
+            with open(self._path(key), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        return data if len(data) == size[0] * size[1] * 4 else None
+
+    def _store(self, key: str, data: bytes) -> None:
+        path = self._path(key)
+        tmp_path = f"{path}.{_os.getpid()}.{_threading.get_ident()}.tmp"
+        try:
+            _os.makedirs(_os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            _os.replace(tmp_path, path)
+        except OSError:
+            pass # The disk copy only saves work for the next process.
+
+    def get(self, path: str, size: tuple[int, int]) -> _Image.Image:
+        """Get a user-supplied image as RGBA at the given size.
+        Params:
+            path (str): The image path.
+            size (tuple[int, int]): The size it is drawn at.
+        Returns:
+            PIL.Image.Image: A read-only RGBA image. Pillow copies it on first write.
+        Raises:
+            OSError: If the image cannot be opened.
+        """
+        if (key := self.key(path, size)) is None:
+            # Not on the disk, maybe served by the asset store or the bundle.
+            with _open_image(path) as image:
+                return normalize_image(image, size).copy()
+        with self._lock:
+            entry = self._images.get(key)
+            if entry is not None:
+                self._images.move_to_end(key)
+        if entry is None:
+            if (data := self._load(key, size)) is None:
+                with _open_image(path) as image:
+                    data = normalize_image(image, size).tobytes()
+                self._store(key, data)
+            entry = (size, data)
+            self._remember(key, entry)
+        return _Image.frombuffer("RGBA", entry[0], entry[1], "raw", "RGBA", 0, 1)
+
+ASSETS = AssetCache()
+
+def normalize_resources(root: str = "resources", *, check: bool = False) -> list[str]:
+    """Rewrite the resource images that are not RGBA as RGBA PNG files.
+    Params:
+        root (str): The resource directory.
+        check (bool): Only list the images, without rewriting them.
+    Returns:
+        list[str]: The paths of the images that were not RGBA.
+    """
+    paths = []
+    for directory, _, files in sorted(_os.walk(root)):
+        for name in sorted(files):
+            if not name.endswith(".png"):
+                continue
+            path = _os.path.join(directory, name)
+            with _Image.open(path) as image:
+                if image.mode == "RGBA":
+                    continue
+                paths.append(_normalize_key(path))
+                if check:
+                    continue
+                rgba = image.convert("RGBA")
+            rgba.save(path + ".tmp", format="PNG")
+            _os.replace(path + ".tmp", path)
+    return paths
@@ -0,0 +1,136 @@
+# /libs/atlas.py
+# -*- coding: utf-8 -*-
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Sprite atlas of the small UI images in `resources/general`.
+"""
+import json as _json
+import os as _os
+
+import PIL.Image as _Image
+
+from .bundle import normalize_key as _normalize_key, resource_key as _resource_key
+from .log import logger as _logger
+
+ATLAS_PATH = "resources/atlas.png"
+ATLAS_INDEX_PATH = "resources/atlas.json"
+ATLAS_WIDTH = 1024
+
+# Full-card layers (the pass frames, the holographic source) are not sprites.
+_CARD_SIZE = (768, 1052)
+
+def build_atlas(root: str = "resources/general",
+                path: str = ATLAS_PATH, index_path: str = ATLAS_INDEX_PATH) -> int:
+    """Pack the small images into one atlas image with a coordinate index.
+    Params:
+        root (str): The directory of the images.
+        path (str): The output atlas image path.
+        index_path (str): The output coordinate index path.
+    Returns:
+        int: The number of packed images.
+    Raises:
+        ValueError: If the directory is outside the working directory.
+    """
+    _resource_key(root)
+    sprites = []
+    for file in sorted(_os.listdir(root)):
+        if not file.endswith(".png"):
+            continue
+        with _Image.open(_os.path.join(root, file)) as image:
+            if image.size == _CARD_SIZE:
+                continue
+            sprites.append((_resource_key(_os.path.join(root, file)), image.convert("RGBA")))
+    # Shelf packing, tallest images first.
+    sprites.sort(key=lambda sprite: (-sprite[1].height, sprite[0]))
+    boxes = {}
+    x = y = shelf_height = 0
+    for name, image in sprites:
+        if x + image.width > ATLAS_WIDTH:
+            x, y = 0, y + shelf_height
+            shelf_height = 0
+        boxes[name] = (x, y, x + image.width, y + image.height)
+        x += image.width
+        shelf_height = max(shelf_height, image.height)
+    atlas = _Image.new("RGBA", (ATLAS_WIDTH, max(1, y + shelf_height)), (0, 0, 0, 0))
+    for name, image in sprites:
+        atlas.paste(image, boxes[name][:2])
+    # The index is replaced last and removed first, so an interrupted build leaves no index
+    # pointing into a different image.
+    tmp_path, tmp_index_path = path + ".tmp", index_path + ".tmp"
+    atlas.save(tmp_path, format="PNG")
+    with open(tmp_index_path, "w", encoding="utf-8") as f:
+        _json.dump(boxes, f, ensure_ascii=False, indent=4)
+    if _os.path.exists(index_path):
+        _os.remove(index_path)
+    _os.replace(tmp_path, path)
+    _os.replace(tmp_index_path, index_path)
+    return len(boxes)
+
+class Atlas:
+    """A preloaded sprite atlas."""
+
+    def __init__(self, path: str = ATLAS_PATH, index_path: str = ATLAS_INDEX_PATH) -> None:
+        """Decode the atlas image and read its index.
+        Params:
+            path (str): The atlas image path.
+            index_path (str): The coordinate index path.
+        Raises:
+            OSError: If the atlas image cannot be read.
+            ValueError: If the index or the image is not valid.
+        """
+        with open(index_path, "r", encoding="utf-8") as f:
+            self.boxes: dict[str, list[int]] = _json.load(f)
+        if not isinstance(self.boxes, dict):
+            raise ValueError(f"Invalid atlas index: {index_path}.")
+        with _Image.open(path) as image:
+            self.image = image.convert("RGBA")
+
+    def __contains__(self, name: str) -> bool:
+        return _normalize_key(name) in self.boxes
+
+    def get(self, name: str) -> _Image.Image | None:
+        """Crop a sprite from the atlas.
+        Params:
+            name (str): The resource path of the sprite.
+        Returns:
+            PIL.Image.Image | None: The sprite, or `None` if it is not in the atlas.
+        """
+        box = self.boxes.get(_normalize_key(name))
+        if box is None:
+            return None
+        return self.image.crop(tuple(box))
+
+    def discard(self, name: str) -> bool:
+        """Stop serving a sprite, e.g. one changed on the disk since the atlas was built.
+        Params:
+            name (str): The resource path of the sprite.
+        Returns:
+            bool: True if the sprite was in the atlas.
+        """
+        return self.boxes.pop(_normalize_key(name), None) is not None
+
+def load_atlas(path: str = ATLAS_PATH, index_path: str = ATLAS_INDEX_PATH) -> Atlas | None:
+    """Load the sprite atlas if it exists.
+    Params:
+        path (str): The atlas image path.
+        index_path (str): The coordinate index path.
+    Returns:
+        Atlas | None: The loaded atlas, or `None` if there is no usable atlas.
+    """
+    if not (_os.path.exists(path) and _os.path.exists(index_path)):
+        return None
+    try:
+        return Atlas(path, index_path)
+    except (OSError, ValueError):
+        _logger.warning("图集 '%s' 已损坏，将直接读取资源文件。请重新构建图集。", path)
+        return None
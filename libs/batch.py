@@ -0,0 +1,311 @@
+# /libs/batch.py
+# -*- coding: utf-8 -*-
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Batch rendering of a CSV/JSONL manifest.
+"""
+import argparse as _argparse
+import csv as _csv
+from functools import partial as _partial
+import json as _json
+import multiprocessing as _multiprocessing
+import multiprocessing.util as _multiprocessing_util
+import os as _os
+from random import Random as _Random
+from typing import Iterator as _Iterator
+
+from .parse import argparser as _argparser
+from .cache import OutputCache as _OutputCache
+from .log import logger as _logger, card_context as _card_context,\
+    share_logging as _share_logging, worker_logging as _worker_logging
+from .render import Renderer as _Renderer, check_card as _check_card
+from .sink import SinkWriter as _SinkWriter, open_sink as _open_sink
+from .pipeline import run_pipeline as _run_pipeline
+from .memory import MemoryBudget as _MemoryBudget, RssMonitor as _RssMonitor,\
+    card_footprint as _card_footprint, current_rss as _current_rss, peak_rss as _peak_rss,\
+    format_size as _format_size
+from .shm import SharedAssetStore as _SharedAssetStore
+from .shard import Checkpoint as _Checkpoint, in_shard as _in_shard
+from .utils import is_existing as _is_existing
+
+# Options taking several values. In CSV cells, the values are separated by whitespace.
+_MULTI_VALUE_KEYS = {"icon"}
+
+def read_manifest(path: str) -> _Iterator[dict]:
+    """Read the rows of a manifest.
+    Params:
+        path (str): The manifest path. `.jsonl` files hold a JSON object per line, `.json`
+            files hold a single row (as written by --write-spec), anything else is read as
+            CSV with a header row.
+    Returns:
+        Iterator[dict]: The rows, keyed by long option names.
+    """
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if path.endswith(".json"):
+            yield _json.load(f)
+        elif path.endswith(".jsonl"):
+            for line in f:
+                if line.strip():
+                    yield _json.loads(line)
+        else:
+            yield from _csv.DictReader(f)
+
+def row_to_argv(row: dict) -> list[str]:
+    """Convert a manifest row into command line arguments.
+    Params:
+        row (dict): The row. `true`/`false` toggle flags, empty values are skipped.
+    Returns:
+        list[str]: The arguments accepted by `parse.argparser`.
+    """
+    argv = []
+    for key, value in row.items():
+        if not key:
+            continue
+        option = "--" + key.lstrip("-")
+        if isinstance(value, str) and value.lower() in ("true", "false"):
+            value = value.lower() == "true"
+        if value is None or value is False or value == "":
+            continue
+        if value is True:
+            argv.append(option)
+        elif isinstance(value, list):
+            argv += [option, *map(str, value)]
+        elif key in _MULTI_VALUE_KEYS:
+            argv += [option, *str(value).split()]
+        else:
+            argv += [option, str(value)]
+    return argv
+
+def output_path(template: str, index: int) -> str:
+    """Name the output of a row after the output template.
+    Params:
+        template (str): The output template, e.g. `output.png`.
+        index (int): The row number, starting from 1.
+    Returns:
+        str: The output path, e.g. `output1.png`.
+    """
+    stem, ext = _os.path.splitext(template)
+    return f"{stem}{index}{ext}"
+
+def row_seed(seed: int, index: int) -> int:
+    """Derive the seed of a row from the batch seed.
+    Params:
+        seed (int): The batch seed.
+        index (int): The row number.
+    Returns:
+        int: The row seed.
+    """
+    return _Random(f"{seed}:{index}").getrandbits(32)
+
+def parse_rows(path: str, batch_args: _argparse.Namespace) -> \
+        tuple[list[tuple[int, _argparse.Namespace]], list[tuple[int, str]]]:
+    """Parse every row of a manifest.
+    Params:
+        path (str): The manifest path.
+        batch_args (argparse.Namespace): The command line arguments of the batch. Its output
+            names rows without `output`, its seed derives the seeds of rows without `seed`,
+            and its `--now`, `--write-spec` and `--numpy-compositor` apply to every row.
+            Rows outside its `--shard` are left out.
+    Returns:
+        tuple: The parsed `(row number, args)` pairs and the `(row number, error)` pairs.
+    """
+    specs, errors = [], []
+    for index, row in enumerate(read_manifest(path), 1):
+        if not _in_shard(index, batch_args.shard):
+            continue
+        try:
+            args = _argparser(row_to_argv(row))
+        except SystemExit:
+            errors.append((index, "Invalid arguments."))
+            continue
+        if not row.get("output"):
+            args.output = output_path(batch_args.output, index)
+        if args.seed is None and batch_args.seed is not None:
+            args.seed = row_seed(batch_args.seed, index)
+        args.now = args.now or batch_args.now
+        args.write_spec = args.write_spec or batch_args.write_spec
+        args.numpy_compositor = args.numpy_compositor or batch_args.numpy_compositor
+        specs.append((index, args))
+    return specs, errors
+
+def batch_assets(specs: list[tuple[int, _argparse.Namespace]]) -> list[str]:
+    """List the resource images a batch is going to use.
+    Params:
+        specs (list[tuple[int, argparse.Namespace]]): The parsed rows.
+    Returns:
+        list[str]: The image paths. Randomly picked images are not included.
+    """
+    paths = [f"resources/general/{f}" for f in sorted(_os.listdir("resources/general/"))
+             if f.endswith(".png")]
+    for _, args in specs:
+        paths += [args.pass_type.value[0], args.pass_type.value[0][:-4] + "Icon.png"]
+        if isinstance(args.background, int):
+            paths.append(f"resources/background/CardBase{str(args.background).zfill(6)}.png")
+        if isinstance(args.chara, int):
+            paths.append(f"resources/character/CardChara{str(args.chara).zfill(7)}.png")
+            if args.holographic:
+                paths.append(f"resources/holograph/CardCharaMask{str(args.chara).zfill(6)}.png")
+        if args.holographic:
+            paths.append(args.holo_from)
+    return paths
+
+_RENDERER = _Renderer()
+
+def _init_worker(manifest: dict, lock, cache: _OutputCache | None, log_queue, log_level: int) -> None:
+    global _RENDERER # pylint: disable=global-statement
+    _worker_logging(log_queue, log_level)
+    store = _SharedAssetStore.attach(manifest, lock)
+    # Pool workers skip atexit handlers, but run multiprocessing finalizers.
+    _multiprocessing_util.Finalize(store, store.close, exitpriority=10)
+    _RENDERER = _Renderer(cache, store)
+
+def render_row(spec: tuple[int, _argparse.Namespace], *, collect: bool = False, sink: bool = False) -> \
+        tuple[int, str | None, list[tuple[str, bytes]] | None, int | None]:
+    """Render and save a single row.
+    Params:
+        spec (tuple[int, argparse.Namespace]): The row number and the parsed row.
+        collect (bool): Return the files instead of writing them.
+        sink (bool): The files go to a sink, so existing files at the output paths do not matter.
+    Returns:
+        tuple: The row number, the error message (`None` on success), the `(path, content)`
+        pairs of the files if `collect` (`None` otherwise) and the resident set size of the
+        worker in bytes (`None` if unknown).
+    """
+    index, args = spec
+    files = None
+    with _card_context(index) as card:
+        try:
+            if not sink and args.no_override and _is_existing(args.output):
+                raise FileExistsError(f"Output file '{args.output}' already exists.")
+            if collect:
+                files, _ = _RENDERER.files(args)
+            else:
+                _RENDERER.save(args)
+        except (ValueError, OSError) as e:
+            return index, str(e), None, _current_rss()
+    rss = _current_rss()
+    _logger.info("第 %d 行绘制完成，用时 %.2f 秒。", index, card.elapsed,
+                 extra={"durations": card.durations, "rss": rss})
+    return index, None, files, rss
+
+def budget_workers(limit: int, workers: int, specs: list[tuple[int, _argparse.Namespace]]) -> int:
+    """Cap the number of worker processes by a memory budget. Every worker is assumed to need
+    as much as this process does now, plus the largest card.
+    Params:
+        limit (int): The budget in bytes.
+        workers (int): The number of workers asked for.
+        specs (list[tuple[int, argparse.Namespace]]): The parsed rows.
+    Returns:
+        int: The number of workers fitting in the budget, at least 1.
+    """
+    footprint = (_current_rss() or 0) + max((_card_footprint(args) for _, args in specs), default=0)
+    fitting = max(1, min(workers, limit // max(footprint, 1)))
+    if fitting < workers:
+        _logger.warning("内存预算 %d MiB 只够 %d 个进程（每个约 %s），将少用 %d 个进程。",
+                        limit // 1048576, fitting, _format_size(footprint), workers - fitting)
+    return fitting
+
+def check_rows(args: _argparse.Namespace) -> list[tuple[int, str]]:
+    """Validate every row of the manifest given by `--batch` without rendering.
+    Params:
+        args (argparse.Namespace): The parsed command line arguments.
+    Returns:
+        list[tuple[int, str]]: The `(row number, error)` pairs of the invalid rows.
+    """
+    specs, errors = parse_rows(args.batch, args)
+    _logger.info("检查模式：共 %d 行。", len(specs) + len(errors))
+    for index, row_args in specs:
+        with _card_context(index):
+            try:
+                _check_card(row_args)
+            except (ValueError, OSError) as e:
+                errors.append((index, str(e)))
+    errors.sort()
+    for index, error in errors:
+        _logger.error("第 %d 行检查未通过：%s", index, error)
+    return errors
+
+def run_batch(args: _argparse.Namespace) -> list[tuple[int, str]]:
+    """Render every row of the manifest given by `--batch`.
+    Params:
+        args (argparse.Namespace): The parsed command line arguments.
+    Returns:
+        list[tuple[int, str]]: The `(row number, error)` pairs of the failed rows.
+    """
+    specs, errors = parse_rows(args.batch, args)
+    if args.shard is not None:
+        _logger.info("分片 %d/%d。", *args.shard)
+    _logger.info("批量模式：共 %d 行，%d 个进程。", len(specs) + len(errors), args.workers)
+    cache = None if args.no_cache else _OutputCache(args.cache_dir, args.cache_size * 1048576)
+    checkpoint = None
+    if args.checkpoint is not None:
+        checkpoint = _Checkpoint(args.checkpoint, args.sharded_dir)
+        specs, skipped = checkpoint.resume(specs)
+    sink = _open_sink(args.archive, args.sharded_dir)
+    writer = _SinkWriter(sink, checkpoint=checkpoint) if sink is not None else None
+    if writer is not None and checkpoint is not None:
+        writer.entries += skipped # The manifest lists the rows of the earlier runs too.
+    # The checkpoint needs the content of the files, so the workers hand them back.
+    render = _partial(render_row, collect=writer is not None or checkpoint is not None,
+                      sink=writer is not None)
+    budget = _MemoryBudget(args.memory_budget * 1048576) if args.memory_budget is not None else None
+    monitor = _RssMonitor()
+
+    def collect(results):
+        for index, error, files, rss in results:
+            monitor.sample(rss)
+            if error is not None:
+                errors.append((index, error))
+            elif writer is not None:
+                for path, data in files:
+                    writer.put(index, path, data)
+            elif files is not None:
+                for path, data in files:
+                    with open(path, "wb") as f:
+                        f.write(data)
+                checkpoint.record_files(index, files)
+
+    try:
+        if args.workers <= 1:
+            errors += _run_pipeline(specs, cache, writer, args.threads, budget, monitor, checkpoint)
+            peak = _peak_rss()
+        else:
+            workers = args.workers
+            if budget is not None:
+                workers = budget_workers(budget.limit, workers, specs)
+            lock = _multiprocessing.Lock()
+            store = _SharedAssetStore.create(batch_assets(specs), lock)
+            try:
+                with _multiprocessing.Pool(
+                    workers, _init_worker,
+                    (store.manifest, lock, cache, _share_logging(), _logger.level)
+                ) as pool:
+                    collect(pool.imap_unordered(render, specs, chunksize=4))
+                    pool.close()
+                    pool.join()
+                _logger.info(store.report(workers))
+            finally:
+                store.close()
+            peak = _peak_rss(children=True)
+    finally:
+        if writer is not None:
+            writer.close()
+        if checkpoint is not None:
+            checkpoint.close()
+    # The kernel's peak and the samples are counted slightly differently, keep the larger.
+    peak = max((size for size in (peak, monitor.peak) if size is not None), default=None)
+    _logger.info("内存占用：峰值 %s，稳定 %s。", _format_size(peak), _format_size(monitor.steady))
+    errors.sort()
+    for index, error in errors:
+        _logger.error("第 %d 行绘制失败：%s", index, error)
+    return errors
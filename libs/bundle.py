@@ -0,0 +1,174 @@
+# /libs/bundle.py
+# -*- coding: utf-8 -*-
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Compiled asset bundle: every resource image decoded once into a single memory-mappable file.
+
+Layout:
+    magic (8 bytes) | index offset (u64) | index length (u64) | blobs... | index (JSON)
+Every blob starts at a 64-byte aligned offset and holds raw RGBA pixels (or zlib-compressed
+RGBA pixels if the bundle is built with compression).
+"""
+import json as _json
+import mmap as _mmap
+import os as _os
+import struct as _struct
+import zlib as _zlib
+
+import PIL.Image as _Image
+
+from .log import logger as _logger
+
+BUNDLE_PATH = "resources/assets.bundle"
+
+_MAGIC = b"DXPBNDL1"
+_HEADER = _struct.Struct("<8sQQ")
+_ALIGN = 64
+
+def normalize_key(path: str) -> str:
+    """Normalize a resource path into a bundle key.
+    Params:
+        path (str): The resource path, e.g. `resources/general/Num0.png`.
+    Returns:
+        str: The normalized key using forward slashes.
+    """
+    return _os.path.normpath(path).replace(_os.sep, "/")
+
+def resource_key(path: str) -> str:
+    """Key a file found under a resource directory like `open_image` looks it up: relative to
+    the working directory, e.g. `resources/general/Num0.png` for `./resources/general/Num0.png`
+    or its absolute path.
+    Params:
+        path (str): The file path.
+    Returns:
+        str: The normalized key.
+    Raises:
+        ValueError: If the file is outside the working directory.
+    """
+    key = normalize_key(_os.path.relpath(path))
+    if key == ".." or key.startswith("../"):
+        raise ValueError(f"Resource '{path}' is outside the working directory.")
+    return key
+
+def build_bundle(root: str = "resources", path: str = BUNDLE_PATH, *, compress: bool = False) -> int:
+    """Compile all PNG files under the resource directory into a bundle.
+    Params:
+        root (str): The resource directory to compile.
+        path (str): The output bundle path.
+        compress (bool): Whether to zlib-compress the blobs. Compressed blobs cannot be zero-copy.
+    Returns:
+        int: The number of images in the bundle.
+    Raises:
+        ValueError: If the resource directory is outside the working directory.
+    """
+    resource_key(root)
+    entries = {}
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, 0, 0))
+        for directory, _, files in sorted(_os.walk(root)):
+            for file in sorted(files):
+                if not file.endswith(".png"):
+                    continue
+                key = resource_key(_os.path.join(directory, file))
+                with _Image.open(key) as image:
+                    data = image.convert("RGBA").tobytes()
+                    size = image.size
+                if compress:
+                    data = _zlib.compress(data, 1)
+                f.write(b"\0" * (-f.tell() % _ALIGN))
+                entries[key] = {
+                    "offset": f.tell(),
+                    "length": len(data),
+                    "size": size,
+                    "codec": "zlib" if compress else "raw",
+                }
+                f.write(data)
+        index = _json.dumps({"entries": entries}, ensure_ascii=False).encode("utf-8")
+        index_offset = f.tell()
+        f.write(index)
+        f.seek(0)
+        f.write(_HEADER.pack(_MAGIC, index_offset, len(index)))
+    _os.replace(tmp_path, path)
+    return len(entries)
+
+class AssetBundle:
+    """A read-only, memory-mapped asset bundle."""
+
+    def __init__(self, path: str = BUNDLE_PATH) -> None:
+        """Map the bundle into memory.
+        Params:
+            path (str): The bundle path.
+        Raises:
+            ValueError: If the file is not a valid bundle.
+        """
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = _mmap.mmap(f.fileno(), 0, access=_mmap.ACCESS_READ)
+        magic, index_offset, index_length = _HEADER.unpack_from(self._mmap, 0)
+        if magic != _MAGIC:
+            self._mmap.close()
+            raise ValueError(f"Invalid asset bundle: {path}.")
+        self._view = memoryview(self._mmap)
+        self.entries: dict[str, dict] = _json.loads(
+            bytes(self._view[index_offset:index_offset + index_length]).decode("utf-8")
+        )["entries"]
+
+    def __contains__(self, name: str) -> bool:
+        return normalize_key(name) in self.entries
+
+    def get(self, name: str) -> _Image.Image | None:
+        """Get an image from the bundle.
+        Params:
+            name (str): The resource path of the image.
+        Returns:
+            PIL.Image.Image | None: A read-only RGBA image, or `None` if it is not bundled.
+            Raw blobs are zero-copy views of the mapped file; Pillow copies them on first write.
+        """
+        entry = self.entries.get(normalize_key(name))
+        if entry is None:
+            return None
+        blob = self._view[entry["offset"]:entry["offset"] + entry["length"]]
+        size = tuple(entry["size"])
+        if entry["codec"] == "zlib":
+            return _Image.frombytes("RGBA", size, _zlib.decompress(blob))
+        return _Image.frombuffer("RGBA", size, blob, "raw", "RGBA", 0, 1)
+
+    def discard(self, name: str) -> bool:
+        """Stop serving an image, e.g. one changed on the disk since the bundle was built.
+        Params:
+            name (str): The resource path of the image.
+        Returns:
+            bool: True if the image was bundled.
+        """
+        return self.entries.pop(normalize_key(name), None) is not None
+
+    def close(self) -> None:
+        """Unmap the bundle. Images handed out must be released before this."""
+        self._view.release()
+        self._mmap.close()
+
+def load_bundle(path: str = BUNDLE_PATH) -> AssetBundle | None:
+    """Load the asset bundle if it exists.
+    Params:
+        path (str): The bundle path.
+    Returns:
+        AssetBundle | None: The loaded bundle, or `None` if there is no usable bundle.
+    """
+    if not _os.path.exists(path):
+        return None
+    try:
+        return AssetBundle(path)
+    except (ValueError, _struct.error):
+        _logger.warning("资源包 '%s' 已损坏，将直接读取资源文件。请重新构建资源包。", path)
+        return None
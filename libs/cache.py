@@ -0,0 +1,231 @@
+# /libs/cache.py
+# -*- coding: utf-8 -*-
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Content-addressed on-disk cache of encoded outputs.
+"""
+import argparse as _argparse
+import hashlib as _hashlib
+import json as _json
+import os as _os
+import threading as _threading
+
+import PIL as _PIL
+
+from .utils import aime_process as _aime_process, to_full_width as _to_full_width
+
+CACHE_DIR = ".cache/output"
+CACHE_SIZE = 512 * 1048576
+
+# Bump this whenever the rendering result changes for the same input.
+_CACHE_VERSION = 1
+
+_DIGESTS: dict[tuple[str, int, int], str] = {}
+_DIGESTS_LOCK = _threading.Lock()
+
+def file_digest(path: str) -> str:
+    """Hash a file, memorized by its path, size and modification time.
+    Params:
+        path (str): The file path.
+    Returns:
+        str: The SHA-256 hex digest, or an empty string if the file does not exist.
+    """
+    try:
+        stat = _os.stat(path)
+    except FileNotFoundError:
+        return ""
+    memo = (path, stat.st_size, stat.st_mtime_ns)
+    with _DIGESTS_LOCK:
+        digest = _DIGESTS.get(memo)
+    if digest is None:
+        # Hashed outside the lock, a file hashed twice at once gets the same digest.
+        with open(path, "rb") as f:
+            digest = _hashlib.file_digest(f, "sha256").hexdigest()
+        with _DIGESTS_LOCK:
+            _DIGESTS[memo] = digest
+    return digest
+
+def forget_digests(paths: list[str]) -> int:
+    """Drop the memorized digests of changed files, so a file rewritten within the resolution
+    of its modification time is hashed again.
+    Params:
+        paths (list[str]): The file paths.
+    Returns:
+        int: The number of dropped digests.
+    """
+    paths = set(paths)
+    with _DIGESTS_LOCK:
+        memos = [memo for memo in _DIGESTS if memo[0] in paths]
+        for memo in memos:
+            del _DIGESTS[memo]
+    return len(memos)
+
+def spec_assets(args: _argparse.Namespace) -> list[str]:
+    """List the asset files a resolved spec depends on.
+    Params:
+        args (argparse.Namespace): The resolved spec, see `render.resolve_spec`.
+    Returns:
+        list[str]: The asset paths.
+    """
+    paths = [f"resources/general/{f}" for f in sorted(_os.listdir("resources/general/"))]
+    paths += ["resources/font/SEGA_MARUGOTHICDB.ttf", "resources/index/chara.json"]
+    if isinstance(args.background, int):
+        paths.append(f"resources/background/CardBase{str(args.background).zfill(6)}.png")
+    else:
+        paths.append(args.background)
+    if isinstance(args.chara, int):
+        paths.append(f"resources/character/CardChara{str(args.chara).zfill(7)}.png")
+    else:
+        paths.append(args.chara)
+    if args.holographic:
+        paths += [args.holo_from, f"resources/holograph/CardCharaMask{str(args.chara).zfill(6)}.png"]
+    return paths
+
+def spec_key(args: _argparse.Namespace) -> str:
+    """Compute the cache key of a resolved spec.
+    Params:
+        args (argparse.Namespace): The resolved spec, see `render.resolve_spec`.
+    Returns:
+        str: The hex key. Equal keys always render to the same output.
+    Raises:
+        ValueError: If the Aime ID is invalid.
+    """
+    player_name = _to_full_width(args.player_name) if args.full_width else args.player_name
+    if isinstance(args.aime, int) and not args.raw_aime:
+        aime = _aime_process(args.aime)
+    else:
+        aime = str(args.aime)
+    spec = {
+        "version": (_CACHE_VERSION, _PIL.__version__),
+        "format": _os.path.splitext(args.output)[1].lower(),
+        "pass": args.pass_type.name,
+        "background": args.background,
+        "chara": args.chara,
+        "holographic": args.holographic and args.holo_from,
+        "chara_name": None if args.skip_name else (args.chara_name, args.discard_comment),
+        "player_name": None if args.skip_player_name else player_name,
+        "rating": None if args.skip_rating else (args.rating, args.override_rating),
+        "friend_code": None if args.skip_friend_code else args.friend_code,
+        "aime": aime,
+        "version_text": args.version,
+        "qr_code": None if args.skip_qr_code else (args.qr_code, args.empty_qr_code),
+        "icon": args.icon and [icon.name for icon in args.icon],
+        "info_plate": not args.skip_info_plate,
+        "date": None if args.skip_date else args.date,
+        "assets": [file_digest(path) for path in spec_assets(args)],
+    }
+    if args.holographic and args.holo_frames:
+        spec["animation"] = (args.holo_frames, args.frame_duration)
+    return _hashlib.sha256(_json.dumps(spec, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+class OutputCache:
+    """Size-bounded on-disk cache of encoded outputs. The least recently used entries
+    are evicted first. Safe to share between threads."""
+
+    def __init__(self, directory: str = CACHE_DIR, max_bytes: int = CACHE_SIZE) -> None:
+        """Open the cache.
+        Params:
+            directory (str): The cache directory. It is created on first write.
+            max_bytes (int): The size limit of the cache.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._total: int | None = None
+        self._lock = _threading.Lock()
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._lock = _threading.Lock()
+
+    def _path(self, key: str) -> str:
+        return _os.path.join(self.directory, key[:2], key)
+
+    def get(self, key: str) -> bytes | None:
+        """Get a cached output.
+        Params:
+            key (str): The cache key, see `spec_key`.
+        Returns:
+            bytes | None: The encoded output, or `None` on a miss.
+        """
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            _os.utime(path)
+        except FileNotFoundError:
+            return None
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        """Store an output, evicting old entries if the cache grows too large.
+        Params:
+            key (str): The cache key, see `spec_key`.
+            data (bytes): The encoded output.
+        """
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        _os.makedirs(_os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{_os.getpid()}.{_threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        with self._lock:
+            # A key put again replaces its entry, only the difference in size is added.
+            try:
+                replaced = _os.stat(path).st_size
+            except FileNotFoundError:
+                replaced = 0
+            _os.replace(tmp_path, path)
+            if self._total is None:
+                self._total = sum(size for _, size, _ in self._entries())
+            else:
+                self._total += len(data) - replaced
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def _entries(self) -> list[tuple[str, int, float]]:
+        entries = []
+        for directory, _, files in _os.walk(self.directory):
+            for file in files:
+                if file.endswith(".tmp"):
+                    continue
+                path = _os.path.join(directory, file)
+                try:
+                    stat = _os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def evict(self) -> None:
+        """Evict the least recently used entries until the cache is below 90% of its limit."""
+        with self._lock:
+            self._evict()
+
+    def _evict(self) -> None:
+        entries = sorted(self._entries(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= self.max_bytes * 0.9:
+                break
+            try:
+                _os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._total = total
@@ -0,0 +1,67 @@
+# /libs/cli.py
+# -*- coding: utf-8 -*-
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+The command of `main.py` on parsed arguments, shared by the command line and the daemon.
+"""
+import argparse as _argparse
+from time import time as _time
+
+from .utils import is_existing as _is_existing
+from .log import logger as _logger, card_context as _card_context
+from .render import Renderer as _Renderer, check_card as _check_card
+from .cache import OutputCache as _OutputCache
+from .batch import run_batch as _run_batch, check_rows as _check_rows
+from .memory import peak_rss as _peak_rss
+
+def run_command(args: _argparse.Namespace, start: float, cache: _OutputCache | None = None) -> None:
+    """Check or render the card or the batch given by the parsed arguments.
+    Params:
+        args (argparse.Namespace): The parsed arguments, see `parse.argparser`.
+        start (float): The time the command started, for the log.
+        cache (OutputCache | None): The output cache of a single card. Opened from the
+            arguments if `None`, unless `--no-cache` is given.
+    Raises:
+        SystemExit: With status 1 if a check or a row of the batch fails.
+        FileExistsError: If the output exists and `--no-override` is given.
+        ValueError: If any part of the card is invalid.
+    """
+    _logger.info("绘制开始！正在进行准备...")
+    if args.check:
+        if args.batch is not None:
+            if _check_rows(args):
+                raise SystemExit(1)
+        else:
+            _check_card(args)
+        _logger.info("检查通过，用时 %.2f 秒。", _time() - start)
+        return
+    if args.batch is not None:
+        errors = _run_batch(args)
+        _logger.info("批量绘制结束，用时 %.2f 秒。", _time() - start)
+        if errors:
+            raise SystemExit(1)
+        return
+    if args.no_override and _is_existing(args.output):
+        _logger.error("输出文件 '%s' 已存在，如果你想覆盖它，请不要使用 --no-override 选项。", args.output)
+        raise FileExistsError(f"Output file '{args.output}' already exists.")
+    if args.no_cache:
+        cache = None
+    elif cache is None:
+        cache = _OutputCache(args.cache_dir, args.cache_size * 1048576)
+    with _card_context(args.output) as card:
+        hit = _Renderer(cache).save(args)
+    if hit:
+        _logger.info("命中输出缓存，用时 %.2f 秒。", _time() - start)
+    else:
+        _logger.info("绘制结束，用时 %.2f 秒。", _time() - start,
+                     extra={"durations": card.durations, "rss": _peak_rss()})
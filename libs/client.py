@@ -0,0 +1,101 @@
+# /libs/client.py
+# -*- coding: utf-8 -*-
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+The client of the rendering daemon, see `daemon`. It only uses the standard library, so
+`main.py` can hand its command line over before loading the fonts and the renderer.
+
+The protocol is one JSON object per line. The client sends
+    {"argv": ["-c", "550105", ...], "cwd": "/path/to/the/working/directory"}
+and the daemon answers with any number of `{"log": "..."}`, `{"stdout": "..."}` and
+`{"stderr": "..."}` lines, then `{"exit": status}`, or `{"refused": "reason"}` if the
+command has to run in its own process.
+"""
+import json as _json
+import os as _os
+import socket as _socket
+import sys as _sys
+
+DAEMON_SOCKET = ".cache/daemon.sock"
+# Seconds to wait for the daemon to accept the connection, and for each reply line. A card
+# logs every stage, so a longer silence means the daemon hangs.
+CONNECT_TIMEOUT = 5.0
+REPLY_TIMEOUT = 120.0
+
+def _connect(path: str) -> _socket.socket | None:
+    if not hasattr(_socket, "AF_UNIX") or not _os.path.exists(path):
+        return None
+    sock = _socket.socket(_socket.AF_UNIX, _socket.SOCK_STREAM)
+    sock.settimeout(CONNECT_TIMEOUT)
+    try:
+        sock.connect(path)
+    except OSError: # A socket left behind by a daemon that was killed, or a hung daemon.
+        sock.close()
+        return None
+    sock.settimeout(REPLY_TIMEOUT)
+    return sock
+
+def daemon_running(path: str = DAEMON_SOCKET) -> bool:
+    """Tell whether a daemon is listening.
+    Params:
+        path (str): The socket path.
+    Returns:
+        bool: True if a daemon accepts connections on the socket.
+    """
+    sock = _connect(path)
+    if sock is None:
+        return False
+    sock.close()
+    return True
+
+def forward(argv: list[str], path: str = DAEMON_SOCKET) -> int | None:
+    """Run a command line of `main.py` in the daemon, if one is running.
+    Params:
+        argv (list[str]): The command line arguments.
+        path (str): The socket path.
+    Returns:
+        int | None: The exit status, or `None` if the command has to run in this process:
+        there is no daemon, it could not be sent the command or it refused it. A daemon that
+        goes away or hangs after receiving the command may have written outputs already, so
+        the command is not run again and the status is 1.
+    """
+    if "--no-daemon" in argv or (sock := _connect(path)) is None:
+        return None
+    request = {"argv": argv, "cwd": _os.getcwd()}
+    with sock:
+        try:
+            sock.sendall((_json.dumps(request, ensure_ascii=False) + "\n").encode("utf-8"))
+        except OSError:
+            return None
+        try:
+            with sock.makefile("r", encoding="utf-8") as replies:
+                for line in replies:
+                    reply = _json.loads(line)
+                    if "log" in reply:
+                        print(reply["log"], flush=True)
+                    elif "stdout" in reply:
+                        _sys.stdout.write(reply["stdout"])
+                    elif "stderr" in reply:
+                        _sys.stderr.write(reply["stderr"])
+                    elif "exit" in reply:
+                        _sys.stdout.flush()
+                        return reply["exit"]
+                    elif "refused" in reply:
+                        return None
+            error = "连接已断开"
+        except (OSError, ValueError) as e:
+            error = str(e) or type(e).__name__
+    _sys.stdout.flush()
+    print(f"渲染守护进程未能完成命令（{error}），输出可能不完整。请检查后使用 --no-daemon 重试。",
+          file=_sys.stderr, flush=True)
+    return 1
@@ -0,0 +1,254 @@
+# /libs/composite.py
+# -*- coding: utf-8 -*-
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Numpy compositor for a stack of static layers, bit-exact with successive `alpha_composite` calls.
+
+Every layer is analysed once and kept in a cache: its opaque pixels are copied over the canvas
+with a single masked copy, its transparent pixels are skipped and only the few translucent
+pixels are blended, with Pillow's integer arithmetic. The canvas is converted to an image
+once at the end, instead of allocating a crop and a result per layer.
+"""
+from collections import OrderedDict as _OrderedDict
+from time import perf_counter as _perf_counter
+import threading as _threading
+from typing import Callable as _Callable, Sequence as _Sequence
+
+import numpy as _np
+import PIL.Image as _Image
+
+from .bundle import normalize_key as _normalize_key
+from .utils import open_image as _open_image
+
+LAYER_CACHE_BYTES = 64 * 1048576
+
+# Fixed-point precision of Pillow's AlphaComposite.c.
+_PRECISION_BITS = 7
+
+def _div255(value: _np.ndarray) -> _np.ndarray:
+    # Pillow's SHIFTFORDIV255: (value + (value >> 8)) >> 8, exact for the rounded products.
+    return ((value >> 8) + value) >> 8
+
+def blend_weights(src_alpha: _np.ndarray, dst_alpha: _np.ndarray) -> \
+        tuple[_np.ndarray, _np.ndarray, _np.ndarray]:
+    """Compute how `blend_over` weighs the colors of pixels with the given alphas, so pixels
+    whose alphas stay the same can be blended again without recomputing them.
+    Params:
+        src_alpha (numpy.ndarray): The source alphas, `(n, 1)` as uint32. They must not be 0.
+        dst_alpha (numpy.ndarray): The destination alphas, `(n, 1)` as uint32.
+    Returns:
+        tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]: The `(n, 1)` weights of the source
+        and the destination colors, see `round_blend`, and the `(n,)` blended alphas.
+    """
+    out_alpha = src_alpha * 255 + dst_alpha * (255 - src_alpha)
+    coef1 = src_alpha * (255 * 255 << _PRECISION_BITS) // out_alpha
+    coef2 = (255 << _PRECISION_BITS) - coef1
+    return coef1, coef2, _div255(out_alpha[:, 0] + 0x80)
+
+def round_blend(weighted: _np.ndarray) -> _np.ndarray:
+    """Round the sum of the weighted source and destination colors to the blended colors.
+    Params:
+        weighted (numpy.ndarray): `src * coef1 + dst * coef2` with the weights of
+            `blend_weights`, as uint32.
+    Returns:
+        numpy.ndarray: The blended colors, as uint32.
+    """
+    return _div255(weighted + (0x80 << _PRECISION_BITS)) >> _PRECISION_BITS
+
+def blend_over(src: _np.ndarray, dst: _np.ndarray) -> _np.ndarray:
+    """Blend translucent source pixels over destination pixels like `Image.alpha_composite`.
+    Params:
+        src (numpy.ndarray): The source pixels, `(n, 4)` RGBA as uint32. Alpha must not be 0.
+        dst (numpy.ndarray): The destination pixels, `(n, 4)` RGBA as uint32.
+    Returns:
+        numpy.ndarray: The blended pixels, `(n, 4)` RGBA as uint32.
+    """
+    coef1, coef2, alpha = blend_weights(src[:, 3:], dst[:, 3:])
+    out = _np.empty_like(src)
+    out[:, :3] = round_blend(src[:, :3] * coef1 + dst[:, :3] * coef2)
+    out[:, 3] = alpha
+    return out
+
+class PreparedLayer:
+    """A layer split into its opaque and translucent pixels."""
+
+    def __init__(self, image: _Image.Image, position: tuple[int, int] = (0, 0)) -> None:
+        """Analyse a layer.
+        Params:
+            image (PIL.Image.Image): The layer.
+            position (tuple[int, int]): The top left corner of the layer on the canvas.
+        """
+        if image.mode != "RGBA":
+            image = image.convert("RGBA")
+        rgba = _np.array(image)
+        alpha = rgba[..., 3]
+        x, y = position
+        self.position = position
+        self.size = image.size
+        self.pixels = rgba.view(_np.uint32)[..., 0]
+        self.opaque = alpha == 255
+        rows, cols = _np.nonzero((alpha != 0) & (alpha != 255))
+        self.translucent = (rows + y, cols + x)
+        self.translucent_pixels = rgba[rows, cols].astype(_np.uint32)
+        self.nbytes = self.pixels.nbytes + self.opaque.nbytes + self.translucent_pixels.nbytes \
+            + rows.nbytes * 2
+
+    def composite(self, canvas: _np.ndarray) -> None:
+        """Composite the layer onto a canvas in place.
+        Params:
+            canvas (numpy.ndarray): The canvas, `(height, width, 4)` RGBA as uint8. The parts
+                of the layer outside it are left out.
+        """
+        x, y = self.position
+        width, height = self.size
+        canvas_height, canvas_width = canvas.shape[:2]
+        packed = canvas.view(_np.uint32)[..., 0]
+        translucent, translucent_pixels = self.translucent, self.translucent_pixels
+        if x < 0 or y < 0 or x + width > canvas_width or y + height > canvas_height:
+            # Clipped to the canvas like `Image.alpha_composite`.
+            left, top = max(x, 0), max(y, 0)
+            right, bottom = min(x + width, canvas_width), min(y + height, canvas_height)
+            if left >= right or top >= bottom:
+                return
+            source = (slice(top - y, bottom - y), slice(left - x, right - x))
+            _np.copyto(packed[top:bottom, left:right], self.pixels[source], where=self.opaque[source])
+            rows, cols = translucent
+            inside = (rows >= 0) & (rows < canvas_height) & (cols >= 0) & (cols < canvas_width)
+            translucent, translucent_pixels = (rows[inside], cols[inside]), translucent_pixels[inside]
+        else:
+            _np.copyto(packed[y:y + height, x:x + width], self.pixels, where=self.opaque)
+        if len(translucent_pixels):
+            dst = canvas[translucent].astype(_np.uint32)
+            canvas[translucent] = blend_over(translucent_pixels, dst)
+
+class LayerCache:
+    """Prepared layers keyed by path and position, the least recently used ones dropped beyond
+    a size limit. Safe to share between threads."""
+
+    def __init__(self, max_bytes: int = LAYER_CACHE_BYTES) -> None:
+        self.max_bytes = max_bytes
+        self._layers: _OrderedDict[tuple[str, tuple[int, int]], PreparedLayer] = _OrderedDict()
+        self._bytes = 0
+        self._lock = _threading.Lock()
+
+    def get(self, path: str, position: tuple[int, int] = (0, 0),
+            opener: _Callable[[str], _Image.Image] = _open_image, key: str | None = None) -> PreparedLayer:
+        """Get a prepared layer, preparing it on first use.
+        Params:
+            path (str): The image path.
+            position (tuple[int, int]): The top left corner of the layer on the canvas.
+            opener (Callable[[str], PIL.Image.Image]): Opens the image, `utils.open_image`
+                by default.
+            key (str | None): Identifies the image instead of its path, e.g. the hash of a
+                user-supplied file that may change.
+        Returns:
+            PreparedLayer: The layer.
+        Raises:
+            OSError: If the image cannot be opened.
+        """
+        key = (key or _normalize_key(path), position)
+        with self._lock:
+            if (layer := self._layers.get(key)) is not None:
+                self._layers.move_to_end(key)
+                return layer
+        with opener(path) as image:
+            layer = PreparedLayer(image, position)
+        with self._lock:
+            if key not in self._layers:
+                self._layers[key] = layer
+                self._bytes += layer.nbytes
+            while self._bytes > self.max_bytes and len(self._layers) > 1:
+                _, dropped = self._layers.popitem(last=False)
+                self._bytes -= dropped.nbytes
+        return layer
+
+    def discard(self, path: str) -> int:
+        """Drop the prepared layers of an image at every position, e.g. one changed on the disk.
+        Params:
+            path (str): The image path.
+        Returns:
+            int: The number of dropped layers.
+        """
+        name = _normalize_key(path)
+        with self._lock:
+            keys = [key for key in self._layers if key[0] == name]
+            for key in keys:
+                self._bytes -= self._layers.pop(key).nbytes
+        return len(keys)
+
+    def clear(self) -> None:
+        """Drop every prepared layer."""
+        with self._lock:
+            self._layers.clear()
+            self._bytes = 0
+
+_LAYERS = LayerCache()
+
+def composite_stack(base: PreparedLayer, layers: _Sequence[PreparedLayer]) -> _Image.Image:
+    """Composite layers over a base in one pass.
+    Params:
+        base (PreparedLayer): The bottom layer, copied as it is.
+        layers (Sequence[PreparedLayer]): The layers from bottom to top.
+    Returns:
+        PIL.Image.Image: The result. It shares the canvas and is read-only, Pillow copies it on
+        first write.
+    """
+    width, height = base.size
+    canvas = base.pixels.copy().view(_np.uint8).reshape(height, width, 4)
+    for layer in layers:
+        layer.composite(canvas)
+    return _Image.frombuffer("RGBA", (width, height), canvas, "raw", "RGBA", 0, 1)
+
+def prepared_layer(path: str, position: tuple[int, int] = (0, 0),
+                   opener: _Callable[[str], _Image.Image] = _open_image, key: str | None = None) \
+        -> PreparedLayer:
+    """Get a layer from the shared layer cache, see `LayerCache.get`."""
+    return _LAYERS.get(path, position, opener, key)
+
+def discard_layers(path: str) -> int:
+    """Drop the layers of an image from the shared layer cache, see `LayerCache.discard`."""
+    return _LAYERS.discard(path)
+
+def benchmark_stack(base: str, layers: _Sequence[tuple[str, tuple[int, int]]], rounds: int = 50) \
+        -> tuple[float, float, int]:
+    """Time the Pillow chain against the numpy compositor and compare their results.
+    Params:
+        base (str): The path of the bottom layer.
+        layers (Sequence[tuple[str, tuple[int, int]]]): The path and the position of every layer.
+        rounds (int): The number of times each compositor runs.
+    Returns:
+        tuple[float, float, int]: The milliseconds per stack of Pillow and of numpy, and the
+        largest channel difference between their results.
+    """
+    with _open_image(base) as image:
+        base_image = image.convert("RGBA")
+    images = []
+    for path, position in layers:
+        with _open_image(path) as image:
+            images.append((image.convert("RGBA"), position))
+    start = _perf_counter()
+    for _ in range(rounds):
+        expected = base_image.copy()
+        for image, position in images:
+            expected.alpha_composite(image, position)
+    pillow = (_perf_counter() - start) * 1000 / rounds
+    cache = LayerCache()
+    for path, position in [(base, (0, 0)), *layers]:
+        cache.get(path, position) # Prepared once, outside the timing
+    start = _perf_counter()
+    for _ in range(rounds):
+        actual = composite_stack(cache.get(base),
+                                 [cache.get(path, position) for path, position in layers])
+    fused = (_perf_counter() - start) * 1000 / rounds
+    difference = _np.abs(_np.asarray(expected, dtype=_np.int16) - _np.asarray(actual, dtype=_np.int16))
+    return pillow, fused, int(difference.max())
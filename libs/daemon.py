@@ -0,0 +1,165 @@
+# /libs/daemon.py
+# -*- coding: utf-8 -*-
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+The rendering daemon: a process keeping the fonts, the resources and the caches loaded,
+rendering the cards `main.py` hands over through a Unix domain socket; see `client` for the
+protocol. The connections are served by a fixed set of threads, which keep their fonts loaded
+from one card to the next.
+
+Batches are refused and run in their own process, with their own workers.
+"""
+from concurrent.futures import ThreadPoolExecutor as _ThreadPoolExecutor
+from contextlib import redirect_stderr as _redirect_stderr, redirect_stdout as _redirect_stdout
+from io import StringIO as _SIO
+import json as _json
+import os as _os
+import socketserver as _socketserver
+import threading as _threading
+from time import time as _time
+import traceback as _traceback
+
+from .cache import OutputCache as _OutputCache
+from .cli import run_command as _run_command
+from .client import DAEMON_SOCKET, daemon_running as _daemon_running
+from .log import logger as _logger, serve_sessions as _serve_sessions, session_logging as _session_logging
+from .parse import argparser as _argparser
+from .watch import ResourceWatcher as _ResourceWatcher, invalidate_resources as _invalidate_resources
+
+class _RequestHandler(_socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        try:
+            request = _json.loads(self.rfile.readline())
+        except ValueError:
+            return
+        self.server.daemon.handle(request, self._reply)
+
+    def _reply(self, **message) -> None:
+        self.wfile.write((_json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8"))
+        self.wfile.flush()
+
+class _PooledServer(_socketserver.ThreadingMixIn, _socketserver.UnixStreamServer):
+    # A thread per connection would load the fonts of `utils.get_font` for every card.
+    def __init__(self, path: str, threads: int) -> None:
+        self.pool = _ThreadPoolExecutor(threads, thread_name_prefix="daemon")
+        super().__init__(path, _RequestHandler)
+
+    def process_request(self, request, client_address) -> None:
+        self.pool.submit(self.process_request_thread, request, client_address)
+
+    def server_close(self) -> None:
+        super().server_close()
+        self.pool.shutdown()
+
+class RenderDaemon:
+    """A warm renderer serving the command lines of `main.py` on a Unix domain socket."""
+
+    def __init__(self, path: str = DAEMON_SOCKET, *, threads: int = 2, watch: bool = True,
+                 polling: bool = False) -> None:
+        """Listen on the socket.
+        Params:
+            path (str): The socket path. It is only accessible to the current user.
+            threads (int): The number of cards rendered at once.
+            watch (bool): Reload the changed resources, see `watch.ResourceWatcher`.
+            polling (bool): Watch the resources by scanning them even if inotify is available.
+        Raises:
+            OSError: If another daemon is listening on the socket, or if the platform has no
+                Unix domain sockets.
+        """
+        if not hasattr(_socketserver, "UnixStreamServer"):
+            raise OSError("Unix domain sockets are not supported on this platform.")
+        if _daemon_running(path):
+            raise OSError(f"A daemon is already listening on '{path}'.")
+        if _os.path.exists(path):
+            _os.remove(path) # Left behind by a daemon that was killed.
+        _os.makedirs(_os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.cwd = _os.getcwd()
+        self._caches: dict[tuple[str, int], _OutputCache] = {}
+        self._lock = _threading.Lock()
+        self.watcher = _ResourceWatcher(_invalidate_resources, polling=polling).start() if watch else None
+        # Bound with its final permissions, no other user can connect before a chmod.
+        umask = _os.umask(0o177)
+        try:
+            self.server = _PooledServer(path, threads)
+        finally:
+            _os.umask(umask)
+        self.server.daemon = self
+        _serve_sessions()
+
+    def _cache(self, directory: str, size: int) -> _OutputCache:
+        # Kept open, so its size is only counted once.
+        with self._lock:
+            return self._caches.setdefault((directory, size), _OutputCache(directory, size * 1048576))
+
+    def handle(self, request: dict, reply) -> None:
+        """Run a command line and send its log and its exit status.
+        Params:
+            request (dict): The `argv` and the `cwd` of the client.
+            reply (Callable): Sends a reply line, given as keyword arguments.
+        """
+        start = _time()
+        try:
+            same_cwd = _os.path.samefile(request["cwd"], self.cwd)
+        except (KeyError, OSError):
+            same_cwd = False
+        if not same_cwd:
+            reply(refused="cwd") # Relative resource and output paths would point elsewhere.
+            return
+        with _session_logging(lambda text: reply(log=text)):
+            stdout, stderr = _SIO(), _SIO()
+            # Usage errors and `--help` are printed to the process-wide streams.
+            with self._lock, _redirect_stdout(stdout), _redirect_stderr(stderr):
+                try:
+                    args, status = _argparser(request["argv"], "main.py"), None
+                except SystemExit as e:
+                    args, status = None, e.code or 0
+            if stdout.getvalue():
+                reply(stdout=stdout.getvalue())
+            if stderr.getvalue():
+                reply(stderr=stderr.getvalue())
+        if args is None:
+            reply(exit=status)
+            return
+        if args.batch is not None:
+            reply(refused="batch")
+            return
+        status = 0
+        with _session_logging(lambda text: reply(log=text), quiet=args.quiet, json_format=args.log_json):
+            try:
+                _run_command(args, start, None if args.no_cache else self._cache(args.cache_dir, args.cache_size))
+            except SystemExit as e:
+                status = e.code if isinstance(e.code, int) else 1
+            except Exception: # pylint: disable=broad-exception-caught
+                reply(stderr=_traceback.format_exc())
+                status = 1
+        reply(exit=status)
+
+    def serve_forever(self) -> None:
+        """Serve until interrupted, then close the daemon."""
+        _logger.info("渲染守护进程已启动，正在监听 '%s'。", self.path)
+        try:
+            self.server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
+        _logger.info("渲染守护进程已停止。")
+
+    def close(self) -> None:
+        """Stop listening, remove the socket and stop watching the resources."""
+        self.server.server_close()
+        if _os.path.exists(self.path):
+            _os.remove(self.path)
+        if self.watcher is not None:
+            self.watcher.stop()
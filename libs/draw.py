@@ -24,39 +24,104 @@ import qrcode.exceptions as _qrcode_exceptions
 from .utils import get_font as _get_font, aime_process as _aime_process,\
     find_chara_name as _find_chara_name, date_process as _date_process,\
     find_rating_background as _find_ra_bg, open_image as _open_image,\
-    text_width_validate as _text_width_validate
+    text_width_validate as _text_width_validate, text_width as _text_width, get_plate as _get_plate
+from .assets import ASSETS as _ASSETS, normalize_image as _normalize_image
+from .composite import composite_stack as _composite_stack, prepared_layer as _prepared_layer
 from .consts import DXPass as _Pass, Icon as _Icon
+from .log import logger as _logger
+from .plates import Plate as _Plate
 
 
-def draw_basic(base: int | str, chara: int | str, pass_type: _Pass, /) -> _Image.Image:
+def _open_layer(path: str) -> _Image.Image:
+    """Open a user-supplied background or character image as a card-sized RGBA layer,
+    normalised once per file content."""
+    return _ASSETS.get(path, (768, 1052))
+
+def _composite_file(base: _Image.Image, path: str, position: tuple[int, int]) -> None:
+    """Composite an image file onto the base, closing it right after. Normalised resources
+    are already RGBA and composited as they are."""
+    with _open_image(path) as image, _normalize_image(image) as layer:
+        base.alpha_composite(layer, position)
+
+def _composite_pass(base_image: _Image.Image, pass_type: _Pass) -> None:
+    """Composite the DX Pass frame, its icon and the serial code."""
+    _composite_file(base_image, pass_type.value[0], (0, 0))
+    _composite_file(base_image, pass_type.value[0][:-4] + "Icon.png", pass_type.value[1])
+    _composite_file(base_image, "resources/general/SerialCode.png", (141, 1000))
+
+def _draw_basic_numpy(base: int | str, chara: int | str, pass_type: _Pass) -> _Image.Image:
+    """Draw the same stack as `draw_basic` with the numpy compositor."""
+    if isinstance(base, int):
+        base_layer = _prepared_layer(f"resources/background/CardBase{str(base).zfill(6)}.png")
+    else:
+        # User-supplied files are identified by their content, they may change between cards.
+        base_layer = _prepared_layer(base, opener=_open_layer, key=_ASSETS.key(base, (768, 1052)))
+    if isinstance(chara, int):
+        chara_layer = _prepared_layer(f"resources/character/CardChara{str(chara).zfill(7)}.png")
+    else:
+        chara_layer = _prepared_layer(chara, opener=_open_layer, key=_ASSETS.key(chara, (768, 1052)))
+    _logger.info("绘制背景、角色和 DX Pass 基底...", extra={"stage": 1})
+    return _composite_stack(base_layer, [
+        chara_layer,
+        _prepared_layer(pass_type.value[0]),
+        _prepared_layer(pass_type.value[0][:-4] + "Icon.png", pass_type.value[1]),
+        _prepared_layer("resources/general/SerialCode.png", (141, 1000)),
+    ])
+
+def draw_basic(base: int | str, chara: int | str, pass_type: _Pass, /, *,
+               numpy_compositor: bool = False) -> _Image.Image:
     """Draw basic character image.
     Params:
         base (str): The base image file name.
         chara (str): The character image file name.
+        numpy_compositor (bool): Composite the layers with the numpy compositor. The result
+            is the same.
     Returns:
         PIL.Image.Image: The generated image.
     """
+    if numpy_compositor:
+        return _draw_basic_numpy(base, chara, pass_type)
     if isinstance(base, int):
         base_image = _open_image(f"resources/background/CardBase{str(base).zfill(6)}.png")
     else:
-        base_image = _open_image(base).convert("RGBA").resize((768, 1052))
+        base_image = _open_layer(base)
 
     if isinstance(chara, int):
         chara_image = _open_image(f"resources/character/CardChara{str(chara).zfill(7)}.png")
     else:
-        chara_image = _open_image(chara).convert("RGBA").resize((768, 1052))
-
-    pass_image = _open_image(pass_type.value[0])
-    icon_image = _open_image(pass_type.value[0][:-4] + "Icon.png")
-    serial_image = _open_image("resources/general/SerialCode.png")
-    print("[1/10] 绘制背景、角色和 DX Pass 基底...")
-    base_image.alpha_composite(chara_image, (0, 0))
-    base_image.alpha_composite(pass_image, (0, 0))
-    base_image.alpha_composite(icon_image, pass_type.value[1])
-    base_image.alpha_composite(serial_image, (141, 1000))
+        chara_image = _open_layer(chara)
+
+    _logger.info("绘制背景、角色和 DX Pass 基底...", extra={"stage": 1})
+    with chara_image:
+        base_image.alpha_composite(chara_image, (0, 0))
+    _composite_pass(base_image, pass_type)
     return base_image
 
 # pylint: disable=line-too-long, too-many-locals
+def _holo_mask(chara: int | str) -> _Image.Image:
+    """Open the holographic mask of a character as the L opacity of the holo layer."""
+    # Each full-size intermediate is closed as soon as the next one is made from it
+    with _Image.new("RGBA", (768, 1052), (255, 255, 255, 255)) as black_image, \
+            _open_image(f"resources/holograph/CardCharaMask{str(chara).zfill(6)}.png") as mask_image, \
+            _Image.alpha_composite(black_image, mask_image) as masked, \
+            masked.convert("L") as mask_gray:
+        return _Image.eval(mask_gray, lambda px: 255 - px)
+
+def _draw_holo_under(base: int | str, chara: int | str) -> _Image.Image:
+    """Draw the background and the character, the layers under the holo."""
+    if isinstance(base, int):
+        base_image = _open_image(f"resources/background/CardBase{str(base).zfill(6)}.png")
+    else:
+        base_image = _open_layer(base)
+
+    if isinstance(chara, int):
+        chara_image = _open_image(f"resources/character/CardChara{str(chara).zfill(7)}.png")
+    else:
+        chara_image = _open_layer(chara)
+    with chara_image:
+        base_image.alpha_composite(chara_image, (0, 0))
+    return base_image
+
 def draw_basic_holographic(
         base: int | str,
         chara: int | str,
@@ -70,38 +135,44 @@ def draw_basic_holographic(
     Returns:
         PIL.Image.Image: The generated image.
     """
-    print("[WARN] 镭射效果是实验性功能。")
-    if isinstance(base, int):
-        base_image = _open_image(f"resources/background/CardBase{str(base).zfill(6)}.png")
-    else:
-        base_image = _open_image(base).convert("RGBA").resize((768, 1052))
-
-    if isinstance(chara, int):
-        chara_image = _open_image(f"resources/character/CardChara{str(chara).zfill(7)}.png")
-    else:
-        chara_image = _open_image(chara).convert("RGBA").resize((768, 1052))
-
-    black_image = _Image.new("RGBA", (768, 1052), (255, 255, 255, 255))
-    chara_mask = _Image.eval(_Image.alpha_composite(
-        black_image,
-        _open_image(f"resources/holograph/CardCharaMask{str(chara).zfill(6)}.png")
-    ).convert("L"), lambda px: 255 - px)
-
-    holo_img = _open_image(holo)
-    chara_holo = holo_img.copy()
-    chara_holo.putalpha(chara_mask)
-
-    pass_image = _open_image(pass_type.value[0])
-    icon_image = _open_image(pass_type.value[0][:-4] + "Icon.png")
-    serial_image = _open_image("resources/general/SerialCode.png")
-    print("[1/10] 绘制背景、角色和 DX Pass 基底...")
-    base_image.alpha_composite(chara_image, (0, 0))
-    base_image.alpha_composite(chara_holo, (0, 0))
-    base_image.alpha_composite(pass_image, (0, 0))
-    base_image.alpha_composite(icon_image, pass_type.value[1])
-    base_image.alpha_composite(serial_image, (141, 1000))
+    _logger.warning("镭射效果是实验性功能。")
+    with _open_image(holo) as holo_img:
+        chara_holo = holo_img.copy()
+    with _holo_mask(chara) as chara_mask:
+        chara_holo.putalpha(chara_mask)
+
+    _logger.info("绘制背景、角色和 DX Pass 基底...", extra={"stage": 1})
+    base_image = _draw_holo_under(base, chara)
+    with chara_holo:
+        base_image.alpha_composite(chara_holo, (0, 0))
+    _composite_pass(base_image, pass_type)
     return base_image
 
+def draw_holo_layers(
+        base: int | str,
+        chara: int | str,
+        pass_type: _Pass,
+        /, *,
+        holo: str) -> tuple[_Image.Image, _Image.Image, _Image.Image, _Image.Image]:
+    """Draw the static layers of an animated holographic card, see `holo.HoloAnimation`.
+    Params:
+        base (int | str): The background ID or image file name.
+        chara (int | str): The character ID or image file name.
+        pass_type (DXPass): The DX Pass.
+        holo (str): The holo image file name.
+    Returns:
+        tuple[PIL.Image.Image, PIL.Image.Image, PIL.Image.Image, PIL.Image.Image]: The layers
+        under the holo, the DX Pass on a transparent canvas to draw the rest of the card on,
+        the L mask of the holo and the holo image.
+    """
+    _logger.warning("镭射效果是实验性功能。")
+    mask = _holo_mask(chara)
+    holo_image = _open_image(holo)
+    _logger.info("绘制背景、角色和 DX Pass 基底...", extra={"stage": 1})
+    under = _draw_holo_under(base, chara)
+    overlay = _Image.new("RGBA", (768, 1052), (0, 0, 0, 0))
+    _composite_pass(overlay, pass_type)
+    return under, overlay, mask, holo_image
 
 def draw_rating(rating: int | None, base: _Image.Image, /, *, override: int | None) -> _Image.Image:
     """Draw DX Rating.
@@ -112,31 +183,27 @@ def draw_rating(rating: int | None, base: _Image.Image, /, *, override: int | No
     Returns:
         PIL.Image.Image: The generated image.
     """
-    print("[2/10] 绘制 DX Rating...")
+    _logger.info("绘制 DX Rating...", extra={"stage": 2})
     x = 690
 
     # Get the background
     if rating is not None:
 
-        rating_bg = _open_image(f"resources/general/Ra{_find_ra_bg(override or rating)}.png")
-        base.alpha_composite(rating_bg, (461, 32))
+        _composite_file(base, f"resources/general/Ra{_find_ra_bg(override or rating)}.png", (461, 32))
         # Draw the rating digit by digit, starting from the right
         if rating < 0:
-            print("[ERROR] DX Rating 值不可以是负数。")
+            _logger.error("DX Rating 值不可以是负数。")
             raise ValueError(f"Rating must be non-negative, but got {rating}.")
         while rating:
             digit = rating % 10
             rating //= 10
-            digit_img = _open_image(f"resources/general/Num{digit}.png")
-            base.alpha_composite(digit_img, (x, 52))
+            _composite_file(base, f"resources/general/Num{digit}.png", (x, 52))
             x -= 29
     else:
-        print("[2/10] DX rating 将被隐藏。")
-        rating_bg = _open_image(f"resources/general/Ra{_find_ra_bg(override or 0)}.png")
-        base.alpha_composite(rating_bg, (461, 32))
+        _logger.info("DX rating 将被隐藏。", extra={"stage": 2})
+        _composite_file(base, f"resources/general/Ra{_find_ra_bg(override or 0)}.png", (461, 32))
         for _ in range(5):
-            digit_img = _open_image("resources/general/Num-.png")
-            base.alpha_composite(digit_img, (x, 52))
+            _composite_file(base, "resources/general/Num-.png", (x, 52))
             x -= 29
 
     return base
@@ -152,8 +219,8 @@ def draw_name(name: str, base: _Image.Image, /) -> _Image.Image:
         ValueError: If the name is too long (longer than 273 pixels a.k.a. 9.75 `Ａ`s).
     """
     # Prepare for the drawing
-    print("[3/10] 绘制玩家名...")
-    base.alpha_composite(_open_image("resources/general/Player.png"), (457, 107))
+    _logger.info("绘制玩家名...", extra={"stage": 3})
+    _composite_file(base, "resources/general/Player.png", (457, 107))
     font = _get_font(28)
     space_width = 182 # Length of 6.5 'Ａ's, also the length of available space
     max_width = 273 # 1.5 * SPACE_WIDTH, longer than this will cause an exception
@@ -161,7 +228,9 @@ def draw_name(name: str, base: _Image.Image, /) -> _Image.Image:
 
     # Measure width of name
     # We are not using utils.text_width_validate because player name is scalable
-    name_bbox = draw.textbbox((0, 0), name, font=font, anchor="lt") # (0, 0, width, height)
+    # The height only sizes the temporary image below; the line height is enough with the padding
+    ascent, descent = font.getmetrics()
+    name_bbox = (0, 0, _text_width(name, 28), ascent + descent)
 
     # Do not need the rescaling - directly draw
     if name_bbox[2] <= space_width:
@@ -169,25 +238,26 @@ def draw_name(name: str, base: _Image.Image, /) -> _Image.Image:
         return base
     # Too long - raise an exception
     if name_bbox[2] > max_width:
-        print(f"[ERROR] 文本过宽，超出限制值 {name_bbox[2] - max_width} 像素。")
+        _logger.error("文本过宽，超出限制值 %d 像素。", name_bbox[2] - max_width)
         raise ValueError(f"Text '{name}' is too wide (width: {name_bbox[2]}, max: {max_width})")
 
-    print("[3/10] 文本较长，需要横向压缩...")
+    _logger.info("文本较长，需要横向压缩...", extra={"stage": 3})
     # Draw the name on a temporary image
     pad = 4 # Compensate for the difference caused by different text rendering method
     tmp_w = int(name_bbox[2]) + pad * 2
     tmp_h = int(name_bbox[3]) + pad * 2
-    tmp = _Image.new("RGBA", (max(1, tmp_w), max(1, tmp_h)), (0, 0, 0, 0))
-    tmp_draw = _Draw.Draw(tmp)
-    tmp_draw.text((pad, pad), name, font=font, fill=(0, 0, 0, 255), anchor="lt")
+    with _Image.new("RGBA", (max(1, tmp_w), max(1, tmp_h)), (0, 0, 0, 0)) as tmp:
+        tmp_draw = _Draw.Draw(tmp)
+        tmp_draw.text((pad, pad), name, font=font, fill=(0, 0, 0, 255), anchor="lt")
 
-    # Scale the name
-    new_w = max(1, space_width + pad * 2)
-    new_h = tmp_h
-    scaled = tmp.resize((new_w, new_h), _Image.Resampling.LANCZOS)
+        # Scale the name
+        new_w = max(1, space_width + pad * 2)
+        new_h = tmp_h
+        scaled = tmp.resize((new_w, new_h), _Image.Resampling.LANCZOS)
 
     # Draw the scaled name
-    base.alpha_composite(scaled, (470 - pad, 118 - pad))
+    with scaled:
+        base.alpha_composite(scaled, (470 - pad, 118 - pad))
     return base
 
 def draw_friend_code(code: int | str | None, base: _Image.Image, /) -> _Image.Image:
@@ -198,8 +268,8 @@ def draw_friend_code(code: int | str | None, base: _Image.Image, /) -> _Image.Im
     Returns:
         PIL.Image.Image: The generated image.
     """
-    print("[4/10] 绘制好友码...")
-    base.alpha_composite(_open_image("resources/general/Friend.png"), (457, 148))
+    _logger.info("绘制好友码...", extra={"stage": 4})
+    _composite_file(base, "resources/general/Friend.png", (457, 148))
     max_width = 195
     font = _get_font(20)
     _text_width_validate(f"{code}", font, max_width)
@@ -209,8 +279,8 @@ def draw_friend_code(code: int | str | None, base: _Image.Image, /) -> _Image.Im
         # Draw the friend code
         draw.text((628, 156), f"{code}", font=font, fill=(0, 0, 0), anchor="mt")
     else:
-        print("[4/10] 好友码将被隐藏。")
-        base.alpha_composite(_open_image("resources/general/NoFriendCode.png"), (533, 160))
+        _logger.info("好友码将被隐藏。", extra={"stage": 4})
+        _composite_file(base, "resources/general/NoFriendCode.png", (533, 160))
 
     return base
 
@@ -231,7 +301,7 @@ def draw_aime(aime: int | str, base: _Image.Image, /, *, raw: bool = False) -> _
     else:
         aime = str(aime)
 
-    print("[5/10] 绘制 Aime ID...")
+    _logger.info("绘制 Aime ID...", extra={"stage": 5})
     max_width = 270
     font = _get_font(16)
     _text_width_validate(aime, font, max_width)
@@ -249,7 +319,7 @@ def draw_version(version: str, base: _Image.Image, /) -> _Image.Image:
     Returns:
         PIL.Image.Image: The generated image.
     """
-    print("[6/10] 绘制版本...")
+    _logger.info("绘制版本...", extra={"stage": 6})
     max_width = 190
     font = _get_font(16)
     _text_width_validate(version, font, max_width)
@@ -257,28 +327,15 @@ def draw_version(version: str, base: _Image.Image, /) -> _Image.Image:
     draw.text((425, 1006), version, font=font, fill=(255, 255, 255), anchor="lt")
     return base
 
-def draw_qr_code(data: str | None, base: _Image.Image, /, *, empty: bool = False) -> _Image.Image:
-    """Draw QR Code. Error correction level: Medium.
+def qr_version(data: str) -> tuple[int, int]:
+    """Find the smallest QR Code version holding the data. Error correction level: Medium.
     Params:
-        data (str | None): The data to encode in the QR code. Dummy QR code will be used if None.
-        base (PIL.Image.Image): The input image to draw on.
+        data (str): The data to encode in the QR code.
     Returns:
-        PIL.Image.Image: The generated image with the QR code.
+        tuple[int, int]: The version and the number of boxes per side, including the border.
     Raises:
         ValueError: If the data overflows. The maximum version is QR Code 6.
     """
-    print("[7/10] 绘制二维码...")
-    base.alpha_composite(_open_image("resources/general/QRCodeBase.png"), (556, 841))
-    if empty:
-        print("[7/10] 二维码绘制将只保留空白背景。")
-        return base
-
-    if data is None:
-        print("[7/10] 二维码将使用占位符绘制。")
-        dummy_qr_code = _open_image("resources/general/DummyQRCode.png")
-        base.alpha_composite(dummy_qr_code, (581, 866))
-        return base
-
     for version in range(1, 7):
         qr = _qrcode.QRCode(
             version=version,
@@ -291,11 +348,32 @@ def draw_qr_code(data: str | None, base: _Image.Image, /, *, empty: bool = False
             qr.make(fit=False)
         except _qrcode_exceptions.DataOverflowError:
             continue
-        box_count = len(qr.get_matrix())
-        break
-    else:
-        print("[ERROR] 尝试让二维码编码的内容过多。")
-        raise ValueError(f"Data overflow. {len(data.encode('utf-8'))} bytes received.")
+        return version, len(qr.get_matrix())
+    _logger.error("尝试让二维码编码的内容过多。")
+    raise ValueError(f"Data overflow. {len(data.encode('utf-8'))} bytes received.")
+
+def draw_qr_code(data: str | None, base: _Image.Image, /, *, empty: bool = False) -> _Image.Image:
+    """Draw QR Code. Error correction level: Medium.
+    Params:
+        data (str | None): The data to encode in the QR code. Dummy QR code will be used if None.
+        base (PIL.Image.Image): The input image to draw on.
+    Returns:
+        PIL.Image.Image: The generated image with the QR code.
+    Raises:
+        ValueError: If the data overflows. The maximum version is QR Code 6.
+    """
+    _logger.info("绘制二维码...", extra={"stage": 7})
+    _composite_file(base, "resources/general/QRCodeBase.png", (556, 841))
+    if empty:
+        _logger.info("二维码绘制将只保留空白背景。", extra={"stage": 7})
+        return base
+
+    if data is None:
+        _logger.info("二维码将使用占位符绘制。", extra={"stage": 7})
+        _composite_file(base, "resources/general/DummyQRCode.png", (581, 866))
+        return base
+
+    version, box_count = qr_version(data)
     box_size = 5 if version == 1 else 4 if version <= 3 else 3
     offset = (158 - box_count * box_size) // 2
 
@@ -308,19 +386,28 @@ def draw_qr_code(data: str | None, base: _Image.Image, /, *, empty: bool = False
     qr.add_data(data)
     qr.make(fit=False)
 
-    img = qr.make_image(fill_color="black", back_color="white").get_image().convert("RGBA")
-    qr_data = img.getdata()
-    temp = []
-    for pixel in qr_data:
-        if pixel >= (255, 255, 255):
-            temp.append((255, 255, 255, 0))
-        else:
-            temp.append(pixel)
-    img.putdata(temp)
-    base.alpha_composite(img, (556 + offset, 841 + offset))
+    # Build the code straight as black modules on a transparent RGBA image, one pixel per
+    # module scaled up, instead of converting a black and white image and keying out the white
+    matrix = qr.get_matrix()
+    side = len(matrix) * box_size
+    modules = bytes(255 if cell else 0 for row in matrix for cell in row)
+    with _Image.frombytes("L", (len(matrix), len(matrix)), modules) as small, \
+            small.resize((side, side), _Image.Resampling.NEAREST) as mask, \
+            _Image.new("RGBA", (side, side), (0, 0, 0, 255)) as img:
+        img.putalpha(mask)
+        base.alpha_composite(img, (556 + offset, 841 + offset))
 
     return base
 
+def max_icons(qr: bool) -> int:
+    """Get the maximum number of icons.
+    Params:
+        qr (bool): Whether the QR code is drawn.
+    Returns:
+        int: 4 if the QR code is drawn, or 6 if the icons may take its space.
+    """
+    return 4 + (0 if qr else 2)
+
 def draw_icon(icons: list[_Icon] | None, base: _Image.Image, /, *, qr: bool = True) -> _Image.Image:
     """Draw icons.
     Params:
@@ -329,19 +416,19 @@ def draw_icon(icons: list[_Icon] | None, base: _Image.Image, /, *, qr: bool = Tr
     Returns:
         PIL.Image.Image: The generated image.
     Raises:
-        ValueError: If too many icons are provided. At most 4 icons are allowed.
+        ValueError: If too many icons are provided. At most 4 icons are allowed, or 6 without
+        the QR code.
     """
-    print("[8/10] 绘制增益图标...")
+    _logger.info("绘制增益图标...", extra={"stage": 8})
     if icons is None:
-        print("[8/10] 无增益图标。")
+        _logger.info("无增益图标。", extra={"stage": 8})
         return base
 
-    if (count := len(icons)) > 4 + 0 if qr else 2:
-        print("[ERROR] 图标数量超出限制。过多图标会向右溢出。")
+    if (count := len(icons)) > max_icons(qr):
+        _logger.error("图标数量超出限制。过多图标会向右溢出。")
         raise ValueError(f"Icons exceed the limit. {count} icons provided.")
     for i, icon in enumerate(icons):
-        icon_image = _open_image(icon.value).convert("RGBA")
-        base.alpha_composite(icon_image, (28 + i * 107, 870))
+        _composite_file(base, icon.value, (28 + i * 107, 870))
     return base
 
 def draw_info_plate(base: _Image.Image, /) -> _Image.Image:
@@ -351,9 +438,75 @@ def draw_info_plate(base: _Image.Image, /) -> _Image.Image:
     Returns:
         PIL.Image.Image: The generated image.
     """
-    base.alpha_composite(_open_image("resources/general/Name.png"), (0, 790))
+    _composite_file(base, "resources/general/Name.png", (0, 790))
     return base
 
+def chara_name_text(name: str, /, *, discard: bool = False) -> str:
+    """Get the character name as drawn.
+    Params:
+        name (str): The character name.
+        discard (bool): Whether to discard the comment part (the part in []).
+    Returns:
+        str: The name, without the comment if it is discarded.
+    """
+    if discard and name.find("]") != -1:
+        return name.split("[", 1)[0].strip()
+    return name
+
+def fit_chara_name(name: str, /, *, discard: bool = False) -> tuple[int, list[str]]:
+    """Fit the character name into the info plate.
+    Params:
+        name (str): The character name.
+        discard (bool): Whether to discard the comment part (the part in []).
+    Returns:
+        tuple[int, list[str]]: The font size and the lines. Names too long for a single line
+        but containing "[]" are broken before the "[".
+    Raises:
+        ValueError: If the name is too wide.
+    """
+    name = chara_name_text(name, discard=discard)
+
+    max_width = 230
+    for size in (15, 14, 13, 12, 11):
+        text_width = _text_width(name, size)
+        if text_width <= max_width:
+            return size, [name]
+    if name.find("[") != -1 and name.find("]") != -1:
+        _logger.info("角色名过长但包含 “[]”，正在尝试折行...", extra={"stage": 9})
+        line1, line2 = name.split("[", 1)
+        line2 = "[" + line2
+        width1 = _text_width(line1, 10)
+        width2 = _text_width(line2, 10)
+        if width1 <= max_width and width2 <= max_width:
+            return 10, [line1, line2]
+        text_width = max(width1, width2)
+    _logger.error("文本过宽，超出限制值 %d 像素。", ceil(text_width) - max_width)
+    raise ValueError(f"Text '{name}' is too wide (width: {ceil(text_width)}, max: {max_width})")
+
+def chara_name_plate(name: str, /, *, discard: bool = False) -> _Plate:
+    """Render the character name into the coverage masks of its lines.
+    Params:
+        name (str): The character name.
+        discard (bool): Whether to discard the comment part (the part in []).
+    Returns:
+        Plate: The L masks, cropped to the text, and their top left corners on the card.
+        Pasting black through them draws exactly what `ImageDraw.text` would.
+    Raises:
+        ValueError: If the name is too wide.
+    """
+    size, lines = fit_chara_name(name, discard=discard)
+    font = _get_font(size)
+    anchors = [(140, 799), (140, 810)] if len(lines) == 2 else [(140, 802 + int(size < 13))]
+    plate = []
+    for line, (x, y) in zip(lines, anchors):
+        left, top, right, bottom = font.getbbox(line, anchor="mt")
+        # A margin, in case the rasterized glyphs reach out of the measured box.
+        mask = _Image.new("L", (right - left + 4, bottom - top + 4))
+        _Draw.Draw(mask).text((2 - left, 2 - top), line, font=font, fill=255, anchor="mt")
+        if (box := mask.getbbox()) is not None:
+            plate.append((mask.crop(box), (x + left - 2 + box[0], y + top - 2 + box[1])))
+    return plate
+
 def draw_chara_name(name_or_id: str | int, base: _Image.Image, /, *, discard: bool = False) -> _Image.Image:
     """Draw Character Name.
     Params:
@@ -365,49 +518,18 @@ def draw_chara_name(name_or_id: str | int, base: _Image.Image, /, *, discard: bo
     Raises:
         ValueError: If the character ID is not found.
     """
-    print("[9/10] 绘制角色名...")
+    _logger.info("绘制角色名...", extra={"stage": 9})
     if isinstance(name_or_id, int):
         name = _find_chara_name(name_or_id)
     else:
-        print("[9/10] 使用自定义角色名...")
+        _logger.info("使用自定义角色名...", extra={"stage": 9})
         name = name_or_id
 
-    if discard:
-        if name.find("]") != -1:
-            name = name.split("[", 1)[0].strip()
-
-    line_break = False
-    max_width = 230
-    for size in (15, 14, 13, 12, 11):
-        font = _get_font(size)
-        text_width = font.getbbox(name, anchor="lt")[2]
-        if text_width > max_width:
-            continue
-        break
-    else:
-        if name.find("[") != -1 and name.find("]") != -1:
-            print("[9/10] 角色名过长但包含 “[]”，正在尝试折行...")
-            font = _get_font(10)
-            line1, line2 = name.split("[", 1)
-            line2 = "[" + line2
-            width1 = font.getbbox(line1, anchor="lt")[2]
-            width2 = font.getbbox(line2, anchor="lt")[2]
-            if width1 <= max_width and width2 <= max_width:
-                line_break = True
-            else:
-                text_width = max(width1, width2)
-                print(f"[ERROR] 文本过宽，超出限制值 {ceil(text_width) - max_width} 像素。")
-                raise ValueError(f"Text '{name}' is too wide (width: {ceil(text_width)}, max: {max_width})")
-
-        else:
-            print(f"[ERROR] 文本过宽，超出限制值 {ceil(text_width) - max_width} 像素。")
-            raise ValueError(f"Text '{name}' is too wide (width: {ceil(text_width)}, max: {max_width})")
-    draw = _Draw.Draw(base)
-    if line_break:
-        draw.text((140, 799), line1, font=font, fill=(0, 0, 0), anchor="mt")
-        draw.text((140, 810), line2, font=font, fill=(0, 0, 0), anchor="mt")
-    else:
-        draw.text((140, 802 + int(size < 13)), name, font=font, fill=(0, 0, 0), anchor="mt")
+    plate = _get_plate(chara_name_text(name, discard=discard))
+    if plate is None:
+        plate = chara_name_plate(name, discard=discard)
+    for mask, (x, y) in plate:
+        base.paste((0, 0, 0, 255), (x, y, x + mask.width, y + mask.height), mask)
     return base
 
 def draw_date(date: str, base: _Image.Image, /) -> _Image.Image:
@@ -418,7 +540,7 @@ def draw_date(date: str, base: _Image.Image, /) -> _Image.Image:
     Returns:
         PIL.Image.Image: The generated image.
     """
-    print("[10/10] 绘制到期日期...")
+    _logger.info("绘制到期日期...", extra={"stage": 10})
     date = _date_process(date)
 
     font = _get_font(15)
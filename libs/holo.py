@@ -0,0 +1,138 @@
+# /libs/holo.py
+# -*- coding: utf-8 -*-
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Animated holographic cards. The layers under the holo and the rest of the card over it are
+drawn once; a frame only recomputes the holo pixels inside the character mask, the holo image
+shifted and hue-rotated as a whole with numpy, and blends them with Pillow's integer arithmetic.
+
+The card over the holo is flattened into one layer, so the translucent edges of the text and
+the plates over the character may differ from the static `-H` card by a rounding step.
+"""
+from math import cos as _cos, radians as _radians, sin as _sin
+from typing import IO as _IO
+
+import numpy as _np
+import PIL.Image as _Image
+
+from .composite import blend_weights as _blend_weights, round_blend as _round_blend
+
+def hue_rotation(degrees: float) -> _np.ndarray:
+    """Build the luminance-preserving hue rotation matrix of SVG's `feColorMatrix`.
+    Params:
+        degrees (float): The rotation angle.
+    Returns:
+        numpy.ndarray: The `(3, 3)` matrix to multiply RGB column vectors with.
+    """
+    c, s = _cos(_radians(degrees)), _sin(_radians(degrees))
+    return _np.array([
+        [0.213 + c * 0.787 - s * 0.213, 0.715 - c * 0.715 - s * 0.715, 0.072 - c * 0.072 + s * 0.928],
+        [0.213 - c * 0.213 + s * 0.143, 0.715 + c * 0.285 + s * 0.140, 0.072 - c * 0.072 - s * 0.283],
+        [0.213 - c * 0.213 - s * 0.787, 0.715 - c * 0.715 + s * 0.715, 0.072 + c * 0.928 + s * 0.072],
+    ], dtype=_np.float32)
+
+class HoloAnimation:
+    """The frames of an animated holographic card. Saved like an image, see `save`."""
+
+    def __init__(self, under: _Image.Image, overlay: _Image.Image, mask: _Image.Image,
+                 holo: _Image.Image, count: int, duration: int) -> None:
+        """Analyse the static layers. The images are closed.
+        Params:
+            under (PIL.Image.Image): The layers under the holo, RGBA.
+            overlay (PIL.Image.Image): The rest of the card over the holo, RGBA.
+            mask (PIL.Image.Image): The opacity of the holo, L.
+            holo (PIL.Image.Image): The holo image, placed at the top left corner.
+            count (int): The number of frames. The holo travels across its whole size and
+                around the hue circle once, so the animation loops seamlessly.
+            duration (int): The display duration of a frame in milliseconds.
+        """
+        self.size = under.size
+        self.count = count
+        self.duration = duration
+        with under, overlay, mask, holo:
+            with _Image.alpha_composite(under, overlay) as still:
+                self._still = _np.array(still)
+            with holo.convert("RGBA") as rgba:
+                self._holo = _np.array(rgba)
+            height, width = self._holo.shape[:2]
+            opacity = _np.array(mask)[:height, :width]
+            top = _np.array(overlay)[:height, :width]
+            # The pixels the card covers never change, the holo only shows through the others.
+            rows, cols = _np.nonzero((opacity != 0) & (top[..., 3] != 255))
+            bottom = _np.array(under)[rows, cols].astype(_np.uint32)
+            top = top[rows, cols].astype(_np.uint32)
+        # Only the holo colors change between frames: the weights of both blends and the
+        # alphas of the frames are computed once.
+        self._holo_pixels = rows * width + cols
+        self._pixels = rows * self.size[0] + cols
+        self._holo_weight, bottom_weight, alpha = _blend_weights(opacity[rows, cols, None].astype(_np.uint32),
+                                                                 bottom[:, 3:])
+        self._bottom = bottom[:, :3] * bottom_weight
+        self._blended = _np.nonzero(top[:, 3])[0]
+        top = top[self._blended]
+        top_weight, self._below_weight, alpha[self._blended] = _blend_weights(top[:, 3:], alpha[self._blended, None])
+        self._top = top[:, :3] * top_weight
+        self._alpha = alpha.astype(_np.uint8)
+
+    def frame(self, index: int) -> _Image.Image:
+        """Render a frame. Frame 0 shows the holo as the static card does.
+        Params:
+            index (int): The frame number, from 0.
+        Returns:
+            PIL.Image.Image: The frame. It shares its canvas and is read-only, Pillow copies
+            it on first write.
+        """
+        height, width = self._holo.shape[:2]
+        phase = index % self.count / self.count
+        # Whole pixels are gathered and scattered as uint32, much faster than their channels.
+        shifted = _np.roll(self._holo.view(_np.uint32)[..., 0], (round(phase * height), round(phase * width)), (0, 1))
+        rgb = shifted.reshape(-1)[self._holo_pixels].view(_np.uint8).reshape(-1, 4)[:, :3]
+        if phase:
+            rgb = rgb @ hue_rotation(phase * 360).T
+            _np.clip(_np.rint(rgb, out=rgb), 0, 255, out=rgb)
+        colors = _round_blend(rgb.astype(_np.uint32) * self._holo_weight + self._bottom)
+        if len(self._blended):
+            colors[self._blended] = _round_blend(self._top + colors[self._blended] * self._below_weight)
+        pixels = _np.empty((len(colors), 4), dtype=_np.uint8)
+        pixels[:, :3] = colors
+        pixels[:, 3] = self._alpha
+        canvas = self._still.copy()
+        canvas.view(_np.uint32).reshape(-1)[self._pixels] = pixels.view(_np.uint32)[:, 0]
+        return _Image.frombuffer("RGBA", self.size, canvas, "raw", "RGBA", 0, 1)
+
+    def frames(self) -> list[_Image.Image]:
+        """Render every frame.
+        Returns:
+            list[PIL.Image.Image]: The frames in order.
+        """
+        return [self.frame(index) for index in range(self.count)]
+
+    def save(self, fp: str | _IO[bytes], format: str | None = None) -> None: # pylint: disable=redefined-builtin
+        """Encode the looping animation, like `PIL.Image.Image.save`.
+        Params:
+            fp (str | IO[bytes]): The output file name or file object.
+            format (str | None): The format, `PNG` for APNG or `WEBP`. Implied by the file
+                name if `None`.
+        """
+        first, *rest = self.frames()
+        first.save(fp, format=format, save_all=True, append_images=rest, duration=self.duration, loop=0)
+
+    def close(self) -> None:
+        """Release the analysed layers."""
+        self._still = self._holo = self._bottom = self._top = self._holo_pixels = self._pixels = None
+
+    def __enter__(self) -> "HoloAnimation":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,142 @@
+# /libs/lint.py
+# -*- coding: utf-8 -*-
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Bulk linting of the text fields of a manifest. Only the font cmap and the glyph metrics are
+used, so hundreds of thousands of rows can be checked before a print run.
+"""
+import csv as _csv
+from itertools import islice as _islice
+import json as _json
+import multiprocessing as _multiprocessing
+from typing import Iterator as _Iterator
+
+from .utils import to_full_width as _to_full_width, missing_glyphs as _missing_glyphs,\
+    text_width as _text_width
+
+# Manifest column, font size and maximum width of the text fields. The sizes and widths are
+# the ones of the drawing functions; `None` means the field is only checked for glyphs.
+_FIELDS = (
+    ("player-name", 28, 273),
+    ("friend-code", 20, 195),
+    ("version", 16, 190),
+    ("name", None, None),
+)
+
+REPORT_COLUMNS = ("row", "field", "problem", "detail", "value")
+
+_CHUNK_SIZE = 2048
+
+def _is_true(value) -> bool:
+    return value is True or isinstance(value, str) and value.lower() == "true"
+
+def lint_row(index: int, row: dict | str) -> list[tuple]:
+    """Check the text fields of a manifest row.
+    Params:
+        index (int): The row number, starting from 1.
+        row (dict | str): The row, or the raw line of a JSONL manifest. Anything else, e.g.
+            the array of a `.json` manifest, is reported as not a JSON object.
+    Returns:
+        list[tuple]: The problems, one tuple per `REPORT_COLUMNS`. Empty if the row is fine.
+    """
+    if isinstance(row, str):
+        try:
+            row = _json.loads(row)
+        except ValueError as e:
+            return [(index, "", "json", str(e), row.strip())]
+    if not isinstance(row, dict): # e.g. a `.json` manifest holding an array, not a row
+        return [(index, "", "json", "Not a JSON object.", _json.dumps(row, ensure_ascii=False))]
+    row = {str(key).lstrip("-"): value for key, value in row.items() if key}
+    problems = []
+    for field, size, max_width in _FIELDS:
+        value = row.get(field)
+        if value is None or value == "":
+            continue
+        text = str(value)
+        if field == "player-name" and not _is_true(row.get("half-width")):
+            drawn = _to_full_width(text)
+        else:
+            drawn = text
+        if missing := _missing_glyphs(text + drawn):
+            detail = " ".join(f"U+{ord(c):04X}" for c in missing)
+            problems.append((index, field, "glyph", detail, text))
+        if size is not None and (width := _text_width(drawn, size)) > max_width:
+            detail = f"+{width - max_width} px ({width}/{max_width})"
+            problems.append((index, field, "width", detail, text))
+    return problems
+
+def _lint_chunk(chunk: list[tuple[int, dict | str]]) -> tuple[int, list[tuple]]:
+    problems = []
+    for index, row in chunk:
+        problems += lint_row(index, row)
+    return len(chunk), problems
+
+def _read_rows(path: str) -> _Iterator[dict | str]:
+    # JSONL lines are parsed by the workers, so a broken line only fails its own row.
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if path.endswith(".jsonl"):
+            yield from (line for line in f if line.strip())
+        elif path.endswith(".json"):
+            yield _json.load(f)
+        else:
+            yield from _csv.DictReader(f)
+
+def _chunks(path: str) -> _Iterator[list[tuple[int, dict | str]]]:
+    rows = enumerate(_read_rows(path), 1)
+    while chunk := list(_islice(rows, _CHUNK_SIZE)):
+        yield chunk
+
+class _ReportWriter:
+    def __init__(self, path: str) -> None:
+        self._file = open(path, "w", encoding="utf-8", newline="") # pylint: disable=consider-using-with
+        self._jsonl = path.endswith(".jsonl")
+        if not self._jsonl:
+            self._csv = _csv.writer(self._file)
+            self._csv.writerow(REPORT_COLUMNS)
+
+    def write(self, problems: list[tuple]) -> None:
+        if self._jsonl:
+            self._file.writelines(
+                _json.dumps(dict(zip(REPORT_COLUMNS, problem)), ensure_ascii=False) + "\n"
+                for problem in problems
+            )
+        else:
+            self._csv.writerows(problems)
+
+    def close(self) -> None:
+        self._file.close()
+
+def lint_manifest(path: str, report: str, workers: int = 1) -> tuple[int, int]:
+    """Lint every row of a manifest and write the problems to a report.
+    Params:
+        path (str): The manifest path, see `batch.read_manifest`.
+        report (str): The report path. `.jsonl` reports hold a JSON object per problem,
+            anything else is written as CSV with a header row.
+        workers (int): The number of worker processes.
+    Returns:
+        tuple[int, int]: The number of rows and the number of failing rows.
+    """
+    rows = failing = 0
+    writer = _ReportWriter(report)
+    pool = _multiprocessing.Pool(workers) if workers > 1 else None # pylint: disable=consider-using-with
+    try:
+        results = pool.imap(_lint_chunk, _chunks(path)) if pool else map(_lint_chunk, _chunks(path))
+        for count, problems in results:
+            rows += count
+            failing += len({problem[0] for problem in problems})
+            writer.write(problems)
+    finally:
+        writer.close()
+        if pool:
+            pool.terminate()
+    return rows, failing
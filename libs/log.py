@@ -0,0 +1,251 @@
+# /libs/log.py
+# -*- coding: utf-8 -*-
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Logging layer. Records are put on a queue and written by a background listener, so logging
+never blocks the rendering. Pass `extra={"stage": n}` to mark the stage a record belongs to.
+"""
+import atexit as _atexit
+from contextlib import contextmanager as _contextmanager
+from contextvars import ContextVar as _ContextVar
+import json as _json
+import logging as _logging
+import logging.handlers as _handlers
+import multiprocessing as _multiprocessing
+import queue as _queue
+import sys as _sys
+from time import perf_counter as _perf_counter
+from typing import Callable as _Callable, Iterator as _Iterator
+
+logger = _logging.getLogger("dxpass")
+
+STAGES = 10
+
+class CardContext:
+    """Timing of the card being rendered."""
+
+    def __init__(self, card_id: str | int) -> None:
+        self.card_id = card_id
+        self.start = _perf_counter()
+        self.durations: dict[int | str, float] = {}
+        self._stage: int | str | None = None
+        self._stage_start = self.start
+
+    def enter(self, stage: int | str) -> None:
+        """Mark the start of a stage, closing the previous one.
+        Params:
+            stage (int | str): The stage number, or the name of a stage outside the drawing.
+        """
+        now = _perf_counter()
+        if self._stage is not None and stage != self._stage:
+            self.durations[self._stage] = self.durations.get(self._stage, 0) + now - self._stage_start
+        if stage != self._stage:
+            self._stage, self._stage_start = stage, now
+
+    def finish(self) -> None:
+        """Close the last stage."""
+        if self._stage is not None:
+            self.enter(-1)
+            self._stage = None
+
+    @property
+    def elapsed(self) -> float:
+        """float: The seconds since the card started."""
+        return _perf_counter() - self.start
+
+_CARD: _ContextVar[CardContext | None] = _ContextVar("card", default=None)
+
+@_contextmanager
+def card_context(card_id: str | int) -> _Iterator[CardContext]:
+    """Attach the card ID and stage timing to the records logged inside.
+    Params:
+        card_id (str | int): The card ID, e.g. the row number or the output path.
+    Returns:
+        Iterator[CardContext]: The context. Its `durations` are complete after the block.
+    """
+    context = CardContext(card_id)
+    token = _CARD.set(context)
+    try:
+        yield context
+    finally:
+        context.finish()
+        _CARD.reset(token)
+
+@_contextmanager
+def attach_card(context: CardContext) -> _Iterator[CardContext]:
+    """Attach an existing card context, e.g. one handed over from another thread.
+    Params:
+        context (CardContext): The context created by `card_context`.
+    Returns:
+        Iterator[CardContext]: The context. It is not finished when the block ends.
+    """
+    token = _CARD.set(context)
+    try:
+        yield context
+    finally:
+        _CARD.reset(token)
+
+def mark_stage(stage: int | str) -> None:
+    """Mark the start of a stage of the current card without logging anything.
+    Params:
+        stage (int | str): The stage number or name.
+    """
+    context = _CARD.get()
+    if context is not None:
+        context.enter(stage)
+
+class _CardFilter(_logging.Filter):
+    def filter(self, record: _logging.LogRecord) -> bool:
+        context = _CARD.get()
+        record.card = context and context.card_id
+        stage = getattr(record, "stage", None)
+        if context is not None and stage is not None:
+            context.enter(stage)
+        return True
+
+class TextFormatter(_logging.Formatter):
+    """The human-readable format: `[ERROR]`, `[WARN]` or `[n/10]` followed by the message."""
+
+    def __init__(self, show_card: bool = False) -> None:
+        """Create the formatter.
+        Params:
+            show_card (bool): Prefix the records of a card with `<card ID>`.
+        """
+        super().__init__()
+        self.show_card = show_card
+
+    def format(self, record: _logging.LogRecord) -> str:
+        message = record.getMessage()
+        if record.levelno >= _logging.ERROR:
+            message = f"[ERROR] {message}"
+        elif record.levelno >= _logging.WARNING:
+            message = f"[WARN] {message}"
+        elif getattr(record, "stage", None) is not None:
+            message = f"[{record.stage}/{STAGES}] {message}"
+        if self.show_card and getattr(record, "card", None) is not None:
+            message = f"<{record.card}> {message}"
+        return message
+
+class JsonFormatter(_logging.Formatter):
+    """One JSON object per line, carrying the card ID, the stage, the stage durations and
+    the resident set size in bytes."""
+
+    def format(self, record: _logging.LogRecord) -> str:
+        data = {
+            "time": round(record.created, 6),
+            "level": record.levelname,
+            "process": record.process,
+            "card": getattr(record, "card", None),
+            "stage": getattr(record, "stage", None),
+            "message": record.getMessage(),
+        }
+        if (durations := getattr(record, "durations", None)) is not None:
+            data["durations"] = {str(k): round(v, 6) for k, v in durations.items()}
+        if (rss := getattr(record, "rss", None)) is not None:
+            data["rss"] = rss
+        return _json.dumps(data, ensure_ascii=False)
+
+_LISTENER: _handlers.QueueListener | None = None
+_HANDLER: _handlers.QueueHandler | None = None
+
+def setup_logging(*, quiet: bool = False, json_format: bool = False, show_card: bool = False) -> None:
+    """Route the logger through a queue to a background listener writing to stdout.
+    Params:
+        quiet (bool): Only log warnings and errors.
+        json_format (bool): Write JSON lines instead of human-readable text.
+        show_card (bool): Prefix human-readable records with the card ID.
+    """
+    global _LISTENER, _HANDLER # pylint: disable=global-statement
+    stream = _logging.StreamHandler(_sys.stdout)
+    stream.setFormatter(JsonFormatter() if json_format else TextFormatter(show_card))
+    log_queue = _queue.SimpleQueue()
+    _LISTENER = _handlers.QueueListener(log_queue, stream)
+    _LISTENER.start()
+    _atexit.register(_LISTENER.stop)
+    _HANDLER = _handlers.QueueHandler(log_queue)
+    _HANDLER.addFilter(_CardFilter())
+    logger.handlers = [_HANDLER]
+    logger.propagate = False
+    logger.setLevel(_logging.WARNING if quiet else _logging.INFO)
+
+def share_logging() -> _multiprocessing.Queue:
+    """Move the listener onto a queue worker processes can write to.
+    Returns:
+        multiprocessing.Queue: The queue to pass to `worker_logging`.
+    """
+    log_queue = _multiprocessing.Queue()
+    _LISTENER.stop()
+    _LISTENER.queue = _HANDLER.queue = log_queue
+    _LISTENER.start()
+    return log_queue
+
+def worker_logging(log_queue: _multiprocessing.Queue, level: int) -> None:
+    """Send the records of a worker process to the listener of the main process.
+    Params:
+        log_queue (multiprocessing.Queue): The queue returned by `share_logging`.
+        level (int): The logging level of the main process.
+    """
+    handler = _handlers.QueueHandler(log_queue)
+    handler.addFilter(_CardFilter())
+    logger.handlers = [handler]
+    logger.propagate = False
+    logger.setLevel(level)
+
+_SESSION: _ContextVar[tuple[_Callable[[str], None], _logging.Formatter, int] | None] = \
+    _ContextVar("log_session", default=None)
+
+class _SessionHandler(_logging.Handler):
+    """Sends the records logged inside a session to its writer, the others to the listener."""
+
+    def __init__(self, fallback: _logging.Handler) -> None:
+        super().__init__()
+        self.fallback = fallback
+
+    def emit(self, record: _logging.LogRecord) -> None:
+        session = _SESSION.get()
+        if session is None:
+            self.fallback.handle(record)
+            return
+        write, formatter, level = session
+        if record.levelno >= level:
+            try:
+                write(formatter.format(record))
+            except OSError:
+                pass # The client went away, the card is finished anyway.
+
+def serve_sessions() -> None:
+    """Let `session_logging` route records to their sessions, e.g. the clients of the daemon.
+    Records logged outside a session still go to the listener set up by `setup_logging`."""
+    _HANDLER.setLevel(logger.level) # The level of the listener, e.g. a quiet daemon.
+    handler = _SessionHandler(_HANDLER)
+    handler.addFilter(_CardFilter())
+    logger.handlers = [handler]
+    logger.setLevel(_logging.INFO)
+
+@_contextmanager
+def session_logging(write: _Callable[[str], None], *, quiet: bool = False,
+                    json_format: bool = False) -> _Iterator[None]:
+    """Send the records logged in the current thread inside the block to a writer.
+    Params:
+        write (Callable[[str], None]): Called with every formatted record.
+        quiet (bool): Only send warnings and errors.
+        json_format (bool): Send JSON lines instead of human-readable text.
+    Returns:
+        Iterator[None]: The block.
+    """
+    formatter = JsonFormatter() if json_format else TextFormatter()
+    token = _SESSION.set((write, formatter, _logging.WARNING if quiet else _logging.INFO))
+    try:
+        yield
+    finally:
+        _SESSION.reset(token)
@@ -0,0 +1,146 @@
+# /libs/memory.py
+# -*- coding: utf-8 -*-
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Memory accounting: resident set size tracking and a budget limiting the cards in flight.
+"""
+import argparse as _argparse
+import os as _os
+import sys as _sys
+import threading as _threading
+
+try:
+    import resource as _resource
+except ImportError: # Windows
+    _resource = None
+
+CARD_SIZE = (768, 1052)
+# Full-size RGBA images alive at once while drawing a card: the base, the layer being
+# composited onto it, the encoder's copy and one spare for the name or the QR code.
+# The holographic layers add a white canvas, the mask and the holo copy.
+_CARD_IMAGES = 4
+_HOLO_IMAGES = 3
+
+def current_rss() -> int | None:
+    """Measure the resident set size of this process.
+    Returns:
+        int | None: The size in bytes, or `None` if the platform does not report it.
+    """
+    try:
+        with open("/proc/self/statm", "r", encoding="ascii") as f:
+            return int(f.read().split()[1]) * _os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+def peak_rss(children: bool = False) -> int | None:
+    """Read the peak resident set size.
+    Params:
+        children (bool): Report the largest terminated child process instead, e.g. the
+            workers of a closed pool.
+    Returns:
+        int | None: The size in bytes, or `None` if the platform does not report it.
+    """
+    if _resource is None:
+        return None
+    usage = _resource.getrusage(_resource.RUSAGE_CHILDREN if children else _resource.RUSAGE_SELF)
+    # Linux reports kilobytes, macOS bytes.
+    return usage.ru_maxrss if _sys.platform == "darwin" else usage.ru_maxrss * 1024
+
+def card_footprint(args: _argparse.Namespace) -> int:
+    """Estimate the memory a card needs while it is being drawn.
+    Params:
+        args (argparse.Namespace): The parsed command line arguments of the card.
+    Returns:
+        int: The estimate in bytes.
+    """
+    images = _CARD_IMAGES + (_HOLO_IMAGES if args.holographic else 0)
+    if args.holographic and args.holo_frames:
+        # The frames and the copies the APNG encoder keeps of them.
+        images += 2 * args.holo_frames
+    return CARD_SIZE[0] * CARD_SIZE[1] * 4 * images
+
+class MemoryBudget:
+    """A limit on the estimated memory of the cards in flight. A card is always admitted
+    when nothing else is in flight, so a budget smaller than one card still makes progress."""
+
+    def __init__(self, limit: int) -> None:
+        """Create the budget.
+        Params:
+            limit (int): The limit in bytes.
+        """
+        self.limit = limit
+        self.used = 0
+        self.waits = 0
+        self._condition = _threading.Condition()
+
+    def acquire(self, size: int) -> None:
+        """Reserve memory for a card, blocking until enough is released.
+        Params:
+            size (int): The estimate in bytes, see `card_footprint`.
+        """
+        with self._condition:
+            if self.used and self.used + size > self.limit:
+                self.waits += 1
+                self._condition.wait_for(lambda: not self.used or self.used + size <= self.limit)
+            self.used += size
+
+    def release(self, size: int) -> None:
+        """Return the memory of a finished card.
+        Params:
+            size (int): The size passed to `acquire`.
+        """
+        with self._condition:
+            self.used -= size
+            self._condition.notify_all()
+
+class RssMonitor:
+    """Resident set size samples, taken as the cards finish."""
+
+    def __init__(self) -> None:
+        self.samples: list[int] = []
+        self._lock = _threading.Lock()
+
+    def sample(self, rss: int | None = None) -> int | None:
+        """Record a sample.
+        Params:
+            rss (int | None): The size in bytes, e.g. reported by a worker process.
+                The size of this process is measured if `None`.
+        Returns:
+            int | None: The recorded size, or `None` if the platform does not report it.
+        """
+        if rss is None:
+            rss = current_rss()
+        if rss is not None:
+            with self._lock:
+                self.samples.append(rss)
+        return rss
+
+    @property
+    def peak(self) -> int | None:
+        """int | None: The largest sample."""
+        return max(self.samples, default=None)
+
+    @property
+    def steady(self) -> int | None:
+        """int | None: The median of the second half of the samples, once the caches are warm."""
+        tail = sorted(self.samples[len(self.samples) // 2:])
+        return tail[len(tail) // 2] if tail else None
+
+def format_size(size: int | None) -> str:
+    """Format a size for the log.
+    Params:
+        size (int | None): The size in bytes.
+    Returns:
+        str: The size in MiB, or `-` if unknown.
+    """
+    return "-" if size is None else f"{size / 1048576:.1f} MiB"
@@ -0,0 +1,207 @@
+# /libs/metrics.py
+# -*- coding: utf-8 -*-
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Text measurement from per-glyph metrics, without laying out or rasterizing whole strings.
+
+The font has no kerning, so the width of a string is the advances of every character but the
+last, plus the right edge of the last one. The metrics of every codepoint of the font can be
+precomputed for all sizes into a table.
+
+Table layout:
+    magic (8 bytes) | codepoint count n (u32) | size count m (u32) | sizes (m * u16) |
+    codepoints (n * u32) | for each size: advances, right edges (2 * n * i16)
+"""
+from array import array as _array
+from collections.abc import Iterable as _Iterable
+import os as _os
+from random import Random as _Random
+import struct as _struct
+import sys as _sys
+import threading as _threading
+
+import PIL.ImageFont as _ImageFont
+
+from .log import logger as _logger
+
+METRICS_PATH = "resources/metrics.bin"
+METRIC_SIZES = tuple(range(10, 29))
+
+_MAGIC = b"DXPMTRC1"
+_HEADER = _struct.Struct("<8sII")
+
+def _read_array(typecode: str, data: bytes | memoryview) -> _array:
+    values = _array(typecode)
+    values.frombytes(data)
+    if _sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+def _write_array(f, values: _array) -> None:
+    if _sys.byteorder == "big":
+        values = _array(values.typecode, values)
+        values.byteswap()
+    values.tofile(f)
+
+class GlyphWidths:
+    """Glyph metrics of the font at one size. Characters missing from the table are measured
+    with FreeType once, on first use. Safe to share between threads."""
+
+    def __init__(self, font: _ImageFont.FreeTypeFont,
+                 table: tuple[dict[str, int], dict[str, int]] | None = None) -> None:
+        """Create the metrics.
+        Params:
+            font (PIL.ImageFont.FreeTypeFont): The font at the size to measure. It must not be
+                used elsewhere while the metrics are shared between threads.
+            table (tuple | None): The precomputed advances and right edges, see
+                `MetricsTable.get`. Everything is measured on demand if `None`.
+        """
+        self._font = font
+        self._advances, self._edges = table or ({}, {})
+        self._lock = _threading.Lock()
+
+    def _measure(self, char: str) -> None:
+        # `width` checks the advances without the lock, so the edge has to exist first.
+        self._edges[char] = self._font.getbbox(char, anchor="lt")[2]
+        self._advances[char] = int(self._font.getlength(char))
+
+    def width(self, text: str) -> int:
+        """Measure the text like `font.getbbox(text, anchor="lt")[2]`.
+        Params:
+            text (str): The text to measure.
+        Returns:
+            int: The width of the text in pixels.
+        """
+        if not text:
+            return 0
+        advances = self._advances
+        if missing := [char for char in text if char not in advances]:
+            with self._lock:
+                for char in missing:
+                    if char not in advances:
+                        self._measure(char)
+        width = 0
+        for char in text[:-1]:
+            width += advances[char]
+        return width + self._edges[text[-1]]
+
+def build_metrics(fonts: dict[int, _ImageFont.FreeTypeFont], codepoints: _Iterable[int],
+                  path: str = METRICS_PATH) -> int:
+    """Measure every codepoint at every size into a metrics table.
+    Params:
+        fonts (dict[int, PIL.ImageFont.FreeTypeFont]): The fonts, keyed by size.
+        codepoints (Iterable[int]): The codepoints of the font.
+        path (str): The output table path.
+    Returns:
+        int: The number of codepoints in the table.
+    """
+    codepoints = _array("I", sorted(codepoints))
+    chars = [chr(codepoint) for codepoint in codepoints]
+    sizes = _array("H", sorted(fonts))
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, len(codepoints), len(sizes)))
+        _write_array(f, sizes)
+        _write_array(f, codepoints)
+        for size in sizes:
+            font = fonts[size]
+            _write_array(f, _array("h", (int(font.getlength(char)) for char in chars)))
+            _write_array(f, _array("h", (font.getbbox(char, anchor="lt")[2] for char in chars)))
+    _os.replace(tmp_path, path)
+    return len(codepoints)
+
+class MetricsTable:
+    """A precomputed metrics table."""
+
+    def __init__(self, path: str = METRICS_PATH) -> None:
+        """Read the table. The metrics of a size are unpacked on first use.
+        Params:
+            path (str): The table path.
+        Raises:
+            ValueError: If the file is not a valid metrics table.
+        """
+        with open(path, "rb") as f:
+            data = f.read()
+        magic, count, size_count = _HEADER.unpack_from(data, 0)
+        if magic != _MAGIC:
+            raise ValueError(f"Invalid metrics table: {path}.")
+        offset = _HEADER.size
+        sizes = _read_array("H", data[offset:offset + size_count * 2])
+        offset += size_count * 2
+        self._chars = [chr(c) for c in _read_array("I", data[offset:offset + count * 4])]
+        offset += count * 4
+        if len(data) != offset + len(sizes) * count * 4:
+            raise ValueError(f"Invalid metrics table: {path}.")
+        self._data = data
+        self._offsets = {size: offset + i * count * 4 for i, size in enumerate(sizes)}
+
+    @property
+    def sizes(self) -> list[int]:
+        """list[int]: The sizes in the table."""
+        return list(self._offsets)
+
+    def get(self, size: int) -> tuple[dict[str, int], dict[str, int]] | None:
+        """Unpack the metrics of a size.
+        Params:
+            size (int): The font size.
+        Returns:
+            tuple | None: The advances and the right edges keyed by character, or `None`
+            if the size is not in the table.
+        """
+        offset = self._offsets.get(size)
+        if offset is None:
+            return None
+        length = len(self._chars) * 2
+        return tuple(
+            dict(zip(self._chars, _read_array("h", self._data[start:start + length])))
+            for start in (offset, offset + length)
+        )
+
+def load_metrics(path: str = METRICS_PATH) -> MetricsTable | None:
+    """Load the metrics table if it exists.
+    Params:
+        path (str): The table path.
+    Returns:
+        MetricsTable | None: The loaded table, or `None` if there is no usable table.
+    """
+    if not _os.path.exists(path):
+        return None
+    try:
+        return MetricsTable(path)
+    except (ValueError, _struct.error):
+        _logger.warning("字形宽度表 '%s' 已损坏，将直接测量文字宽度。请重新构建。", path)
+        return None
+
+def verify_metrics(table: MetricsTable, fonts: dict[int, _ImageFont.FreeTypeFont],
+                   codepoints: _Iterable[int], samples: int = 1000, seed: int = 0) -> dict[int, int]:
+    """Compare the table with FreeType's measurement of every glyph and of random strings.
+    Params:
+        table (MetricsTable): The table to verify.
+        fonts (dict[int, PIL.ImageFont.FreeTypeFont]): The fonts, keyed by size.
+        codepoints (Iterable[int]): The codepoints of the font.
+        samples (int): The number of random strings per size.
+        seed (int): The seed of the random strings.
+    Returns:
+        dict[int, int]: The largest width difference in pixels per size.
+    """
+    chars = [chr(codepoint) for codepoint in sorted(codepoints)]
+    rng = _Random(seed)
+    errors = {}
+    for size, font in sorted(fonts.items()):
+        metrics = GlyphWidths(font, table.get(size))
+        texts = chars + ["".join(rng.choices(chars, k=rng.randint(2, 16))) for _ in range(samples)]
+        error = 0
+        for text in texts:
+            error = max(error, abs(metrics.width(text) - font.getbbox(text, anchor="lt")[2]))
+        errors[size] = error
+    return errors
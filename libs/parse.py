@@ -15,17 +15,22 @@
 Parser of the command line input.
 """
 import argparse as _argparse
+import os as _os
 
 from .utils import text_validate as _text_validate
 from .consts import DXPass as _Pass, Icon as _Icon
+from .log import logger as _logger
 
-def argparser() -> _argparse.Namespace:
+def argparser(argv: list[str] | None = None, prog: str | None = None) -> _argparse.Namespace:
     """
     Parse the command line input.
+    Params:
+        argv (list[str] | None): The arguments to parse. `sys.argv[1:]` by default.
+        prog (str | None): The program name in the usage. `sys.argv[0]` by default.
     Returns:
         argparse.Namespace: The parsed arguments.
     """
-    print("解析命令行参数...")
+    _logger.debug("解析命令行参数...")
     def _parse_int_or_str(value: str) -> int | str:
         try:
             return int(value)
@@ -38,6 +43,15 @@ def argparser() -> _argparse.Namespace:
         except KeyError as e:
             raise ValueError(f"Invalid pass type: {value}") from e
 
+    def _parse_shard(value: str) -> tuple[int, int]:
+        try:
+            index, count = map(int, value.split("/"))
+        except ValueError as e:
+            raise ValueError(f"Invalid shard: {value}") from e
+        if not 1 <= index <= count:
+            raise ValueError(f"Invalid shard: {value}")
+        return index, count
+
     def _parse_icon_type(value: str) -> _Icon:
         try:
             return _Icon[value.upper()]
@@ -60,7 +74,7 @@ def argparser() -> _argparse.Namespace:
             setattr(namespace, "skip_friend_code", True)
             setattr(namespace, "skip_qr_code", True)
 
-    parser = _argparse.ArgumentParser(description="Generate a maimai DX pass image.")
+    parser = _argparse.ArgumentParser(prog=prog, description="Generate a maimai DX pass image.")
 
     parser.add_argument(
         "-l", "--pass-level",
@@ -114,6 +128,21 @@ def argparser() -> _argparse.Namespace:
         help="Holographic frame source.",
         default="resources/general/Laser.png"
     )
+    parser.add_argument(
+        "--holo-frames",
+        dest="holo_frames",
+        type=int,
+        help=("Render the holographic card as a looping animation of this many frames, the "
+              "holo shifting and changing hue. Saved as APNG (.png, .apng) or WebP (.webp)."),
+        default=None
+    )
+    parser.add_argument(
+        "--frame-duration",
+        dest="frame_duration",
+        type=int,
+        help="The display duration of an animation frame in milliseconds. 50 by default.",
+        default=50
+    )
 
 
     parser.add_argument(
@@ -306,4 +335,462 @@ def argparser() -> _argparse.Namespace:
         default=False
     )
 
+    parser.add_argument(
+        "--seed",
+        dest="seed",
+        type=int,
+        help=("The seed of the random character and background selection. In batch mode, "
+              "rows without their own seed use a seed derived from this and the row number."),
+        default=None
+    )
+    parser.add_argument(
+        "--now",
+        dest="now",
+        type=str,
+        help="Override the current date the default date is based on.",
+        default=None
+    )
+    parser.add_argument(
+        "--write-spec",
+        dest="write_spec",
+        action="store_true",
+        help=("Write the resolved arguments next to the output as a JSON manifest row. "
+              "Rendering it with --batch reproduces the same output."),
+        default=False
+    )
+
+    parser.add_argument(
+        "--no-cache",
+        dest="no_cache",
+        action="store_true",
+        help="Always render, neither reading nor writing the output cache.",
+        default=False
+    )
+    parser.add_argument(
+        "--cache-dir",
+        dest="cache_dir",
+        type=str,
+        help="The output cache directory. '.cache/output' by default.",
+        default=".cache/output"
+    )
+    parser.add_argument(
+        "--cache-size",
+        dest="cache_size",
+        type=int,
+        help="The size limit of the output cache in MiB. 512 by default.",
+        default=512
+    )
+    parser.add_argument(
+        "--numpy-compositor",
+        dest="numpy_compositor",
+        action="store_true",
+        help=("Composite the background, the character and the DX Pass with numpy in one pass. "
+              "The output is the same."),
+        default=False
+    )
+
+    parser.add_argument(
+        "--check",
+        dest="check",
+        action="store_true",
+        help="Only validate the arguments (every row in batch mode) without rendering.",
+        default=False
+    )
+    parser.add_argument(
+        "--quiet",
+        dest="quiet",
+        action="store_true",
+        help="Only log warnings and errors.",
+        default=False
+    )
+    parser.add_argument(
+        "--log-json",
+        dest="log_json",
+        action="store_true",
+        help="Log JSON lines carrying the card ID, the stage and the stage durations.",
+        default=False
+    )
+    parser.add_argument(
+        "--no-daemon",
+        dest="no_daemon",
+        action="store_true",
+        help="Render in this process even if a daemon (`tools.py daemon`) is running.",
+        default=False
+    )
+
+    parser.add_argument(
+        "--batch",
+        dest="batch",
+        type=str,
+        help=("Render every row of a CSV/JSONL manifest. Keys are the long option names above. "
+              "The outputs are named after -o/--output with the row number appended."),
+        default=None
+    )
+    parser.add_argument(
+        "-w", "--workers",
+        dest="workers",
+        type=int,
+        help="The number of render processes in batch mode. 1 by default.",
+        default=1
+    )
+    parser.add_argument(
+        "-t", "--threads",
+        dest="threads",
+        type=int,
+        help="The number of render threads of the batch pipeline, used with 1 worker. 1 by default.",
+        default=1
+    )
+    parser.add_argument(
+        "--memory-budget",
+        dest="memory_budget",
+        type=int,
+        help=("The memory budget of a batch in MiB. Fewer cards are kept in flight, or fewer "
+              "workers started, to stay within it. Unlimited by default."),
+        default=None
+    )
+    sink = parser.add_mutually_exclusive_group()
+    sink.add_argument(
+        "--archive",
+        dest="archive",
+        type=str,
+        help=("In batch mode, stream the outputs into a zip (.zip) or tar (.tar, .tar.gz) archive "
+              "instead of separate files, with a manifest of the members and their checksums."),
+        default=None
+    )
+    sink.add_argument(
+        "--sharded-dir",
+        dest="sharded_dir",
+        type=str,
+        help=("In batch mode, write the outputs into 256 subdirectories of this directory "
+              "instead of a single one, with a manifest of the files and their checksums."),
+        default=None
+    )
+    parser.add_argument(
+        "--shard",
+        dest="shard",
+        type=_parse_shard,
+        help=("In batch mode, only render the i-th of N shards of the manifest, e.g. 2/4. "
+              "Rows are dealt to the shards in turn."),
+        default=None
+    )
+    parser.add_argument(
+        "--checkpoint",
+        dest="checkpoint",
+        type=str,
+        help=("In batch mode, record the completed rows and the checksums of their outputs in "
+              "this file, and skip the rows it already holds. Not available with --archive."),
+        default=None
+    )
+
+    args = parser.parse_args(argv)
+    if args.checkpoint is not None and args.archive is not None:
+        parser.error("--checkpoint cannot resume an archive, use --sharded-dir instead.")
+    return args
+
+def spec_row(args: _argparse.Namespace) -> dict:
+    """
+    Convert the parsed arguments back into a manifest row, see `batch.row_to_argv`.
+    Params:
+        args (argparse.Namespace): The parsed arguments.
+    Returns:
+        dict: The row, keyed by long option names.
+    """
+    row = {
+        "pass-level": args.pass_type.name,
+        "chara" if isinstance(args.chara, int) else "chara-from": args.chara,
+        "background" if isinstance(args.background, int) else "background-from": args.background,
+        "holographic": args.holographic,
+        "holo-from": args.holo_from if args.holographic else None,
+        "holo-frames": args.holo_frames if args.holographic else None,
+        "frame-duration": args.frame_duration if args.holographic and args.holo_frames else None,
+        "name": args.chara_name,
+        "skip-name": args.skip_name,
+        "discard-comment": args.discard_comment,
+        "player-name": args.player_name,
+        "skip-player-name": args.skip_player_name,
+        "full-width" if args.full_width else "half-width": True,
+        "rating": args.rating,
+        "override-rating": args.override_rating,
+        "skip-rating": args.skip_rating,
+        "friend-code": args.friend_code,
+        "skip-friend-code": args.skip_friend_code,
+        "aime": args.aime,
+        "raw-aime": args.raw_aime,
+        "version": args.version,
+        "qr-code": args.qr_code,
+        "empty-qr-code": args.empty_qr_code,
+        "skip-qr-code": args.skip_qr_code,
+        "icon": args.icon and [icon.name.lower() for icon in args.icon],
+        "date": args.date,
+        "skip-date": args.skip_date,
+        "skip-name-date": args.skip_info_plate,
+        "seed": args.seed,
+        "now": args.now,
+        "output": args.output,
+    }
+    return {key: value for key, value in row.items() if value is not None and value is not False}
+
+def toolparser() -> _argparse.Namespace:
+    """
+    Parse the command line input of the maintenance tools.
+    Returns:
+        argparse.Namespace: The parsed arguments.
+    """
+    parser = _argparse.ArgumentParser(description="Maintenance tools of the DX pass generator.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    bundle = commands.add_parser("bundle", help="Compile the resources into a memory-mappable bundle.")
+    bundle.add_argument(
+        "--root",
+        dest="root",
+        type=str,
+        help="The resource directory. 'resources' by default.",
+        default="resources"
+    )
+    bundle.add_argument(
+        "-o", "--output",
+        dest="output",
+        type=str,
+        help="The bundle path. 'resources/assets.bundle' by default.",
+        default="resources/assets.bundle"
+    )
+    bundle.add_argument(
+        "--compress",
+        dest="compress",
+        action="store_true",
+        help="Compress the blobs with zlib. Smaller, but the images can no longer be zero-copy.",
+        default=False
+    )
+
+    atlas = commands.add_parser("atlas", help="Pack the small UI images into a sprite atlas.")
+    atlas.add_argument(
+        "--root",
+        dest="root",
+        type=str,
+        help="The directory of the images. 'resources/general' by default.",
+        default="resources/general"
+    )
+    atlas.add_argument(
+        "-o", "--output",
+        dest="output",
+        type=str,
+        help="The atlas image path. 'resources/atlas.png' by default.",
+        default="resources/atlas.png"
+    )
+    atlas.add_argument(
+        "--index",
+        dest="index",
+        type=str,
+        help="The coordinate index path. 'resources/atlas.json' by default.",
+        default="resources/atlas.json"
+    )
+
+    metrics = commands.add_parser("metrics", help="Precompute the glyph metrics of the font into a table.")
+    metrics.add_argument(
+        "-o", "--output",
+        dest="output",
+        type=str,
+        help="The table path. 'resources/metrics.bin' by default.",
+        default="resources/metrics.bin"
+    )
+    metrics.add_argument(
+        "--verify",
+        dest="verify",
+        action="store_true",
+        help="Verify the existing table against FreeType instead of building it.",
+        default=False
+    )
+    metrics.add_argument(
+        "--samples",
+        dest="samples",
+        type=int,
+        help="The number of random strings per size to verify. 1000 by default.",
+        default=1000
+    )
+
+    lint = commands.add_parser("lint", help="Check the text fields of a batch manifest without rendering.")
+    lint.add_argument(
+        "manifest",
+        type=str,
+        help="The CSV/JSONL manifest to check."
+    )
+    lint.add_argument(
+        "-o", "--output",
+        dest="output",
+        type=str,
+        help="The report path. Written as JSONL if it ends with '.jsonl', CSV otherwise. "
+             "'lint_report.csv' by default.",
+        default="lint_report.csv"
+    )
+    lint.add_argument(
+        "-w", "--workers",
+        dest="workers",
+        type=int,
+        help="The number of worker processes. The number of CPUs by default.",
+        default=_os.cpu_count() or 1
+    )
+
+    plates = commands.add_parser("plates", help="Prerender the names of the character index into a plate table.")
+    plates.add_argument(
+        "--index",
+        dest="index",
+        type=str,
+        help="The character name index. 'resources/index/chara.json' by default.",
+        default="resources/index/chara.json"
+    )
+    plates.add_argument(
+        "-o", "--output",
+        dest="output",
+        type=str,
+        help="The table path. 'resources/plates.bin' by default.",
+        default="resources/plates.bin"
+    )
+
+    stress = commands.add_parser(
+        "stress", help="Render cards from many threads and compare them with a single-threaded render.")
+    stress.add_argument(
+        "-t", "--threads",
+        dest="threads",
+        type=int,
+        help="The number of threads. 8 by default.",
+        default=8
+    )
+    stress.add_argument(
+        "--rounds",
+        dest="rounds",
+        type=int,
+        help="How many times every card is rendered concurrently. 4 by default.",
+        default=4
+    )
+
+    composite = commands.add_parser(
+        "composite", help="Compare the numpy compositor with Pillow on the background stack.")
+    composite.add_argument(
+        "-b", "--background",
+        dest="background",
+        type=int,
+        help="The background ID. 500001 by default.",
+        default=500001
+    )
+    composite.add_argument(
+        "-c", "--chara",
+        dest="chara",
+        type=int,
+        help="The character ID. 550105 by default.",
+        default=550105
+    )
+    composite.add_argument(
+        "-l", "--pass-level",
+        dest="pass_type",
+        type=str.upper,
+        choices=[pass_type.name for pass_type in _Pass],
+        help="The pass type. Gold by default.",
+        default=_Pass.GOLD.name
+    )
+    composite.add_argument(
+        "--rounds",
+        dest="rounds",
+        type=int,
+        help="How many times each compositor runs. 50 by default.",
+        default=50
+    )
+    composite.add_argument(
+        "--overhang",
+        dest="overhang",
+        action="store_true",
+        help="Add a layer overhanging the bottom right corner, to check the clipping.",
+        default=False
+    )
+
+    normalize = commands.add_parser("normalize", help="Rewrite the resource images that are not RGBA as RGBA.")
+    normalize.add_argument(
+        "--root",
+        dest="root",
+        type=str,
+        help="The resource directory. 'resources' by default.",
+        default="resources"
+    )
+    normalize.add_argument(
+        "--check",
+        dest="check",
+        action="store_true",
+        help="Only list the images that are not RGBA, and fail if there are any.",
+        default=False
+    )
+
+    watch = commands.add_parser("watch", help="Watch the resources and report the changes a renderer would reload.")
+    watch.add_argument(
+        "--root",
+        dest="root",
+        type=str,
+        help="The resource directory. 'resources' by default.",
+        default="resources"
+    )
+    watch.add_argument(
+        "--polling",
+        dest="polling",
+        action="store_true",
+        help="Scan the directory at an interval even if inotify is available.",
+        default=False
+    )
+    watch.add_argument(
+        "--interval",
+        dest="interval",
+        type=float,
+        help="The seconds between two scans when polling. 1 by default.",
+        default=1.0
+    )
+    watch.add_argument(
+        "--duration",
+        dest="duration",
+        type=float,
+        help="Stop after this many seconds. Runs until interrupted by default.",
+        default=None
+    )
+
+    daemon = commands.add_parser("daemon", help="Keep a warm renderer serving main.py on a Unix domain socket.")
+    daemon.add_argument(
+        "-t", "--threads",
+        dest="threads",
+        type=int,
+        help="The number of cards rendered at once. 2 by default.",
+        default=2
+    )
+    daemon.add_argument(
+        "--no-watch",
+        dest="watch",
+        action="store_false",
+        help="Do not reload the changed resources.",
+        default=True
+    )
+    daemon.add_argument(
+        "--polling",
+        dest="polling",
+        action="store_true",
+        help="Watch the resources by scanning them even if inotify is available.",
+        default=False
+    )
+
+    merge = commands.add_parser("merge", help="Combine the manifests of the shards of a batch.")
+    merge.add_argument(
+        "manifests",
+        type=str,
+        nargs="+",
+        help="The manifests written with --archive/--sharded-dir, or the --checkpoint files (.jsonl)."
+    )
+    merge.add_argument(
+        "-o", "--output",
+        dest="output",
+        type=str,
+        help="The combined manifest path. 'merged.manifest.csv' by default.",
+        default="merged.manifest.csv"
+    )
+    merge.add_argument(
+        "--rows",
+        dest="rows",
+        type=int,
+        help="The number of rows of the whole manifest, to report the rows no shard completed.",
+        default=None
+    )
+
     return parser.parse_args()
@@ -0,0 +1,283 @@
+# /libs/pipeline.py
+# -*- coding: utf-8 -*-
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Single-process batch pipeline. Each card goes through four stages connected by bounded queues:
+
+    prefetch (validate, decode the images) -> render -> encode -> write
+
+Decoding, zlib compression and file I/O release the GIL, so they overlap with compositing.
+The render stage may run several threads, all sharing one `render.Renderer`.
+"""
+import argparse as _argparse
+from collections import OrderedDict as _OrderedDict
+import queue as _queue
+import threading as _threading
+from time import perf_counter as _perf_counter
+from typing import Callable as _Callable
+
+import PIL.Image as _Image
+
+from .bundle import normalize_key as _normalize_key
+from .cache import OutputCache as _OutputCache, spec_key as _spec_key
+from .memory import MemoryBudget as _MemoryBudget, RssMonitor as _RssMonitor,\
+    card_footprint as _card_footprint
+from .log import logger as _logger, CardContext as _CardContext, attach_card as _attach_card
+from .render import Renderer as _Renderer, encode_card as _encode_card, spec_files as _spec_files
+from .utils import is_existing as _is_existing, open_image as _open_image
+from .validate import card_assets as _card_assets
+
+QUEUE_DEPTH = 4
+PREFETCH_BYTES = 128 * 1048576
+
+# Encoding is the slowest stage and zlib releases the GIL, so it gets two threads.
+_ENCODERS = 2
+
+class PrefetchStore:
+    """Decoded RGBA images, the least recently used ones dropped beyond a size limit.
+    Images are handed out read-only; Pillow copies them on first write."""
+
+    def __init__(self, max_bytes: int = PREFETCH_BYTES) -> None:
+        self.max_bytes = max_bytes
+        self._images: _OrderedDict[str, tuple[tuple[int, int], bytes]] = _OrderedDict()
+        self._bytes = 0
+        self._lock = _threading.Lock()
+
+    def __contains__(self, name: str) -> bool:
+        return _normalize_key(name) in self._images
+
+    def load(self, name: str) -> None:
+        """Decode an image into the store, unless it is already there.
+        Params:
+            name (str): The image path.
+        Raises:
+            OSError: If the image cannot be opened.
+        """
+        key = _normalize_key(name)
+        with self._lock:
+            if key in self._images:
+                self._images.move_to_end(key)
+                return
+        with _open_image(name) as image:
+            entry = (image.size, image.convert("RGBA").tobytes())
+        with self._lock:
+            self._images[key] = entry
+            self._bytes += len(entry[1])
+            while self._bytes > self.max_bytes and len(self._images) > 1:
+                _, (_, data) = self._images.popitem(last=False)
+                self._bytes -= len(data)
+
+    def get(self, name: str) -> _Image.Image | None:
+        """Get a decoded image.
+        Params:
+            name (str): The image path.
+        Returns:
+            PIL.Image.Image | None: A read-only RGBA image, or `None` if it is not in the store.
+        """
+        with self._lock:
+            entry = self._images.get(_normalize_key(name))
+        if entry is None:
+            return None
+        return _Image.frombuffer("RGBA", entry[0], entry[1], "raw", "RGBA", 0, 1)
+
+    def discard(self, name: str) -> bool:
+        """Drop a decoded image, e.g. one changed on the disk. It is decoded again on next load.
+        Params:
+            name (str): The image path.
+        Returns:
+            bool: True if the image was in the store.
+        """
+        with self._lock:
+            entry = self._images.pop(_normalize_key(name), None)
+            if entry is not None:
+                self._bytes -= len(entry[1])
+        return entry is not None
+
+class _MeteredQueue(_queue.Queue):
+    """A bounded queue sampling its depth on every put."""
+
+    def __init__(self, maxsize: int) -> None:
+        super().__init__(maxsize)
+        self.samples = 0
+        self.total_depth = 0
+        self.max_depth = 0
+
+    def _put(self, item) -> None:
+        # Called with the queue's own lock held.
+        super()._put(item)
+        depth = len(self.queue)
+        self.samples += 1
+        self.total_depth += depth
+        self.max_depth = max(self.max_depth, depth)
+
+class _Job: # pylint: disable=too-few-public-methods
+    __slots__ = ("index", "args", "card", "spec", "key", "image", "data", "error", "footprint")
+
+    def __init__(self, index: int, args: _argparse.Namespace) -> None:
+        self.index = index
+        self.args = args
+        self.footprint = _card_footprint(args)
+        self.card = _CardContext(index)
+        self.spec = self.key = self.image = self.data = None
+        self.error: str | None = None
+
+class _Stage:
+    """Threads taking jobs from one queue and putting them on the next."""
+
+    def __init__(self, name: str, func: _Callable[[_Job], None], inbox: _MeteredQueue,
+                 outbox: _MeteredQueue | None, threads: int = 1) -> None:
+        self.name = name
+        self.func = func
+        self.inbox = inbox
+        self.outbox = outbox
+        self.jobs = 0
+        self.busy = 0.0
+        self.failure: BaseException | None = None
+        self._running = threads
+        self._lock = _threading.Lock()
+        self._threads = [
+            _threading.Thread(target=self._run, name=f"pipeline-{name}-{i}", daemon=True)
+            for i in range(threads)
+        ]
+
+    def start(self) -> None:
+        for thread in self._threads:
+            thread.start()
+
+    def join(self) -> None:
+        for thread in self._threads:
+            thread.join()
+
+    def _run(self) -> None:
+        while (job := self.inbox.get()) is not None:
+            start = _perf_counter()
+            if job.error is None:
+                with _attach_card(job.card):
+                    job.card.enter(self.name)
+                    try:
+                        self.func(job)
+                    except (ValueError, OSError) as e:
+                        job.error = str(e)
+                    except Exception as e: # pylint: disable=broad-exception-caught
+                        self.failure = self.failure or e
+                        job.error = repr(e)
+                    job.card.enter("queue")
+            with self._lock:
+                self.jobs += 1
+                self.busy += _perf_counter() - start
+            if self.outbox is not None:
+                self.outbox.put(job)
+        # Hand the end marker to the sibling threads, the last one passes it on.
+        self.inbox.put(None)
+        with self._lock:
+            self._running -= 1
+            last = self._running == 0
+        if last and self.outbox is not None:
+            self.outbox.put(None)
+
+def run_pipeline(specs: list[tuple[int, _argparse.Namespace]], cache: _OutputCache | None = None,
+                 writer=None, threads: int = 1, budget: _MemoryBudget | None = None,
+                 monitor: _RssMonitor | None = None, checkpoint=None) -> list[tuple[int, str]]:
+    """Render the parsed rows through the pipeline.
+    Params:
+        specs (list[tuple[int, argparse.Namespace]]): The parsed rows.
+        cache (OutputCache | None): The output cache. `None` disables caching.
+        writer (sink.SinkWriter | None): The sink writer. `None` writes separate files.
+        threads (int): The number of render threads.
+        budget (MemoryBudget | None): The memory budget of the cards in flight. `None` only
+            bounds them by the queue depths.
+        monitor (RssMonitor | None): Sampled as every card finishes.
+        checkpoint (shard.Checkpoint | None): Records the files written without a sink writer.
+    Returns:
+        list[tuple[int, str]]: The `(row number, error)` pairs of the failed rows.
+    """
+    store = PrefetchStore()
+    renderer = _Renderer(cache, store)
+    errors = []
+
+    def prefetch(job: _Job) -> None:
+        if writer is None and job.args.no_override and _is_existing(job.args.output):
+            raise FileExistsError(f"Output file '{job.args.output}' already exists.")
+        job.spec = renderer.check(job.args)
+        if cache is not None:
+            job.key = _spec_key(job.spec)
+            job.data = cache.get(job.key)
+        if job.data is None:
+            for path in _card_assets(job.spec):
+                store.load(path)
+
+    def render(job: _Job) -> None:
+        if job.data is None:
+            job.image = renderer.render(job.spec)
+
+    def encode(job: _Job) -> None:
+        if job.data is None:
+            with job.image:
+                job.data = _encode_card(job.image, job.spec.output)
+            job.image = None
+            if cache is not None:
+                cache.put(job.key, job.data)
+
+    def write(job: _Job) -> None:
+        files = _spec_files(job.spec, job.data)
+        for path, data in files:
+            if writer is not None:
+                writer.put(job.index, path, data)
+            else:
+                with open(path, "wb") as f:
+                    f.write(data)
+        if writer is None and checkpoint is not None:
+            checkpoint.record_files(job.index, files)
+
+    def feed() -> None:
+        for index, args in specs:
+            job = _Job(index, args)
+            if budget is not None:
+                budget.acquire(job.footprint)
+            queues[0].put(job)
+        queues[0].put(None)
+
+    queues = [_MeteredQueue(QUEUE_DEPTH) for _ in range(4)]
+    done = _MeteredQueue(0)
+    stages = [
+        _Stage("prefetch", prefetch, queues[0], queues[1]),
+        _Stage("render", render, queues[1], queues[2], threads),
+        _Stage("encode", encode, queues[2], queues[3], _ENCODERS),
+        _Stage("write", write, queues[3], done),
+    ]
+    for stage in stages:
+        stage.start()
+    _threading.Thread(target=feed, name="pipeline-feed", daemon=True).start()
+    while (job := done.get()) is not None:
+        job.card.finish()
+        if budget is not None:
+            budget.release(job.footprint)
+        rss = monitor.sample() if monitor is not None else None
+        if job.error is not None:
+            errors.append((job.index, job.error))
+        else:
+            with _attach_card(job.card):
+                _logger.info("第 %d 行绘制完成，用时 %.2f 秒。", job.index, job.card.elapsed,
+                             extra={"durations": job.card.durations, "rss": rss})
+    for stage in stages:
+        stage.join()
+    for stage, inbox in zip(stages, queues):
+        _logger.info("流水线阶段 %s：%d 项，忙碌 %.2f 秒，输入队列平均深度 %.2f，最大 %d。",
+                     stage.name, stage.jobs, stage.busy,
+                     inbox.total_depth / max(inbox.samples, 1), inbox.max_depth)
+    if budget is not None:
+        _logger.info("内存预算 %d MiB：投放新卡片时等待了 %d 次。", budget.limit // 1048576, budget.waits)
+    for stage in stages:
+        if stage.failure is not None:
+            raise stage.failure
+    return errors
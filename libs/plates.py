@@ -0,0 +1,124 @@
+# /libs/plates.py
+# -*- coding: utf-8 -*-
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Prerendered character name plates: the names of the character index fitted and broken into
+lines like `draw.draw_chara_name`, kept as the coverage masks of their lines, so drawing a
+known name is a paste of at most two masks instead of fitting and rasterizing it.
+
+File layout:
+    magic (8 bytes) | index offset (u64) | index length (u64) | zlib-compressed masks | JSON index
+The index records the font the masks were rendered with, and for every name its lines as
+`[offset, length, width, height, x, y]`, `x` and `y` being the top left corner on the card.
+"""
+from collections.abc import Iterable as _Iterable
+import json as _json
+import os as _os
+import struct as _struct
+import zlib as _zlib
+
+import PIL.Image as _Image
+
+from .log import logger as _logger
+
+PLATES_PATH = "resources/plates.bin"
+
+_MAGIC = b"DXPPLAT1"
+_HEADER = _struct.Struct("<8sQQ")
+
+Plate = list[tuple[_Image.Image, tuple[int, int]]]
+
+def build_plates(plates: _Iterable[tuple[str, Plate]], font: str, path: str = PLATES_PATH) -> int:
+    """Write name plates into a plate table.
+    Params:
+        plates (Iterable[tuple[str, Plate]]): The name, as drawn, and its line masks with
+            their top left corners on the card.
+        font (str): Identifies the font the masks were rendered with, see `utils.FONT_ID`.
+        path (str): The output table path.
+    Returns:
+        int: The number of plates in the table.
+    """
+    index = {}
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, 0, 0))
+        for name, plate in plates:
+            lines = []
+            for mask, (x, y) in plate:
+                data = _zlib.compress(mask.tobytes(), 9)
+                lines.append([f.tell(), len(data), mask.width, mask.height, x, y])
+                f.write(data)
+            index[name] = lines
+        data = _json.dumps({"font": font, "plates": index}, ensure_ascii=False).encode("utf-8")
+        index_offset = f.tell()
+        f.write(data)
+        f.seek(0)
+        f.write(_HEADER.pack(_MAGIC, index_offset, len(data)))
+    _os.replace(tmp_path, path)
+    return len(index)
+
+class PlateTable:
+    """A loaded plate table."""
+
+    def __init__(self, path: str = PLATES_PATH) -> None:
+        """Read the table. The masks are decompressed on use.
+        Params:
+            path (str): The table path.
+        Raises:
+            ValueError: If the file is not a valid plate table.
+        """
+        with open(path, "rb") as f:
+            self._data = f.read()
+        magic, index_offset, index_length = _HEADER.unpack_from(self._data, 0)
+        if magic != _MAGIC:
+            raise ValueError(f"Invalid plate table: {path}.")
+        index = _json.loads(self._data[index_offset:index_offset + index_length].decode("utf-8"))
+        self.font: str = index["font"]
+        self.plates: dict[str, list[list[int]]] = index["plates"]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.plates
+
+    def get(self, name: str) -> Plate | None:
+        """Get the plate of a name.
+        Params:
+            name (str): The name as drawn, i.e. without the comment if it is discarded.
+        Returns:
+            Plate | None: The L masks of the lines and their top left corners on the card,
+            or `None` if the name is not in the table.
+        """
+        lines = self.plates.get(name)
+        if lines is None:
+            return None
+        return [(_Image.frombytes("L", (width, height), _zlib.decompress(self._data[offset:offset + length])),
+                 (x, y)) for offset, length, width, height, x, y in lines]
+
+def load_plates(font: str, path: str = PLATES_PATH) -> PlateTable | None:
+    """Load the plate table if it exists and was rendered with the current font.
+    Params:
+        font (str): Identifies the current font, see `utils.FONT_ID`.
+        path (str): The table path.
+    Returns:
+        PlateTable | None: The loaded table, or `None` if there is no usable table.
+    """
+    if not _os.path.exists(path):
+        return None
+    try:
+        table = PlateTable(path)
+    except (ValueError, KeyError, _struct.error):
+        _logger.warning("角色名牌表 '%s' 已损坏，将直接绘制角色名。请重新构建。", path)
+        return None
+    if table.font != font:
+        _logger.warning("角色名牌表 '%s' 与当前字体不匹配，将直接绘制角色名。请重新构建。", path)
+        return None
+    return table
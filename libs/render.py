@@ -0,0 +1,279 @@
+# /libs/render.py
+# -*- coding: utf-8 -*-
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+The full rendering pipeline of a single card. The functions keep no shared state: every card
+draws on images of its own, fonts are per thread and the shared caches are lock-protected,
+so cards can be rendered from several threads at once.
+"""
+import argparse as _argparse
+from io import BytesIO as _BIO
+import json as _json
+import os as _os
+from random import Random as _Random
+
+import PIL.Image as _Image
+
+from .utils import to_full_width as _to_full_width, random_background as _random_background,\
+    random_chara as _random_chara, date_process as _date_process, use_asset_store as _use_asset_store
+from .parse import spec_row as _spec_row
+from .log import logger as _logger, mark_stage as _mark_stage
+from .draw import draw_rating as _draw_rating, draw_name as _draw_name\
+    ,draw_friend_code as _draw_friend_code, draw_aime as _draw_aime, draw_version as _draw_version\
+    ,draw_qr_code as _draw_qr_code, draw_icon as _draw_icon, draw_basic as _draw_basic\
+    ,draw_chara_name as _draw_chara_name, draw_date as _draw_date\
+    ,draw_info_plate as _draw_info_plate, draw_basic_holographic as _draw_basic_holographic\
+    ,draw_holo_layers as _draw_holo_layers
+from .holo import HoloAnimation as _HoloAnimation
+from .cache import OutputCache as _OutputCache, spec_key as _spec_key
+from .validate import validate_spec as _validate_spec
+from .watch import ResourceWatcher as _ResourceWatcher, invalidate_resources as _invalidate_resources
+
+def resolve_spec(args: _argparse.Namespace) -> _argparse.Namespace:
+    """Resolve the random picks and the default date of the parsed arguments.
+    Params:
+        args (argparse.Namespace): The parsed arguments, see `parse.argparser`.
+    Returns:
+        argparse.Namespace: A copy of the arguments with the background, the character and
+        the default date decided. Resolving a resolved spec again changes nothing.
+    Raises:
+        ValueError: If the current date given by `--now` is invalid.
+    """
+    spec = _argparse.Namespace(**vars(args))
+    rng = _Random(args.seed) if args.seed is not None else None
+    spec.background = args.background or _random_background(rng)
+    spec.chara = args.chara or _random_chara(rng)
+    if not args.skip_date and args.date is None:
+        spec.date = _date_process(None, args.now)
+    return spec
+
+def render_card(args: _argparse.Namespace) -> _Image.Image | _HoloAnimation:
+    """Render a card from the parsed arguments.
+    Params:
+        args (argparse.Namespace): The parsed arguments, see `parse.argparser`.
+    Returns:
+        PIL.Image.Image | HoloAnimation: The rendered card, or its frames if `--holo-frames`
+        is given with `-H`. Both are saved with `save`.
+    Raises:
+        ValueError: If any part of the card is invalid.
+    """
+    args = resolve_spec(args)
+    if args.holographic and args.holo_frames:
+        under, overlay, mask, holo = _draw_holo_layers(args.background, args.chara, args.pass_type,
+                                                       holo=args.holo_from)
+        return _HoloAnimation(under, _draw_details(args, overlay), mask, holo,
+                              args.holo_frames, args.frame_duration)
+    if args.holographic:
+        result = _draw_basic_holographic(args.background, args.chara, args.pass_type, holo=args.holo_from)
+    else:
+        result = _draw_basic(args.background, args.chara, args.pass_type,
+                             numpy_compositor=args.numpy_compositor)
+    return _draw_details(args, result)
+
+def _draw_details(args: _argparse.Namespace, result: _Image.Image) -> _Image.Image: # pylint: disable=too-many-branches
+    """Draw everything over the DX Pass, from the rating to the date."""
+    chara = args.chara
+    if args.skip_rating:
+        _logger.info("跳过 DX Rating 绘制。", extra={"stage": 2})
+    else:
+        result = _draw_rating(args.rating, result, override=args.override_rating)
+    if args.skip_player_name:
+        _logger.info("跳过玩家名称绘制。", extra={"stage": 3})
+    else:
+        if args.full_width:
+            result = _draw_name(_to_full_width(args.player_name), result)
+        else:
+            result = _draw_name(args.player_name, result)
+    if args.skip_friend_code:
+        _logger.info("跳过好友码绘制。", extra={"stage": 4})
+    else:
+        result = _draw_friend_code(args.friend_code, result)
+    result = _draw_aime(args.aime, result, raw=args.raw_aime)
+    result = _draw_version(args.version, result)
+    if args.skip_qr_code:
+        _logger.info("跳过 QR 码绘制。", extra={"stage": 7})
+    else:
+        result = _draw_qr_code(args.qr_code, result, empty=args.empty_qr_code)
+    result = _draw_icon(args.icon, result, qr=not args.skip_qr_code)
+    if not args.skip_info_plate:
+        result = _draw_info_plate(result)
+    if args.skip_name:
+        _logger.info("跳过角色名称绘制。", extra={"stage": 9})
+    else:
+        if args.chara_name is not None:
+            result = _draw_chara_name(args.chara_name, result, discard=args.discard_comment)
+        elif isinstance(chara, int):
+            result = _draw_chara_name(chara, result, discard=args.discard_comment)
+        else:
+            _logger.error("自定义角色必须要指定 -n/--name。")
+            raise ValueError("Custom character name must be specified with -n/--name.")
+    if args.skip_date:
+        _logger.info("跳过日期绘制。", extra={"stage": 10})
+    else:
+        result = _draw_date(args.date, result)
+    return result
+
+def encode_card(image: _Image.Image | _HoloAnimation, output: str) -> bytes:
+    """Encode a card in the format implied by the output path.
+    Params:
+        image (PIL.Image.Image | HoloAnimation): The rendered card, see `render_card`.
+        output (str): The output path.
+    Returns:
+        bytes: The encoded image.
+    """
+    extension = _os.path.splitext(output)[1].lower()
+    with _BIO() as f:
+        image.save(f, format=_Image.registered_extensions().get(extension, "PNG"))
+        return f.getvalue()
+
+def check_card(args: _argparse.Namespace) -> _argparse.Namespace:
+    """Resolve the parsed arguments and validate them before any pixel work.
+    Params:
+        args (argparse.Namespace): The parsed arguments, see `parse.argparser`.
+    Returns:
+        argparse.Namespace: The resolved spec.
+    Raises:
+        ValueError: If any part of the card is invalid. All the problems are logged.
+    """
+    spec = resolve_spec(args)
+    errors = _validate_spec(spec)
+    for error in errors:
+        _logger.error("参数检查未通过：%s", error)
+    if errors:
+        raise ValueError(" ".join(errors))
+    if not spec.skip_date:
+        spec.date = _date_process(spec.date)
+    return spec
+
+def build_card(args: _argparse.Namespace, cache: _OutputCache | None = None) -> \
+        tuple[_argparse.Namespace, bytes, bool]:
+    """Render and encode a card, reusing the cached output if possible.
+    Params:
+        args (argparse.Namespace): The parsed arguments, see `parse.argparser`.
+        cache (OutputCache | None): The output cache. `None` disables caching.
+    Returns:
+        tuple[argparse.Namespace, bytes, bool]: The resolved spec, the encoded output and
+        whether the output came from the cache.
+    Raises:
+        ValueError: If any part of the card is invalid.
+    """
+    spec = check_card(args)
+    key = _spec_key(spec) if cache is not None else None
+    data = cache.get(key) if cache is not None else None
+    hit = data is not None
+    if not hit:
+        with render_card(spec) as result:
+            _mark_stage("encode")
+            data = encode_card(result, spec.output)
+        if cache is not None:
+            cache.put(key, data)
+    return spec, data, hit
+
+def card_files(args: _argparse.Namespace, cache: _OutputCache | None = None) -> \
+        tuple[list[tuple[str, bytes]], bool]:
+    """Render a card into the files `save_card` would write, without writing them.
+    Params:
+        args (argparse.Namespace): The parsed arguments, see `parse.argparser`.
+        cache (OutputCache | None): The output cache. `None` disables caching.
+    Returns:
+        tuple[list[tuple[str, bytes]], bool]: The `(path, content)` pairs, the output first
+        and the spec next to it if `args.write_spec`, and whether the output came from the cache.
+    Raises:
+        ValueError: If any part of the card is invalid.
+    """
+    spec, data, hit = build_card(args, cache)
+    return spec_files(spec, data), hit
+
+def spec_files(spec: _argparse.Namespace, data: bytes) -> list[tuple[str, bytes]]:
+    """List the files of a rendered card.
+    Params:
+        spec (argparse.Namespace): The resolved spec, see `check_card`.
+        data (bytes): The encoded output.
+    Returns:
+        list[tuple[str, bytes]]: The `(path, content)` pairs, the output first and the spec
+        next to it if `spec.write_spec`.
+    """
+    files = [(spec.output, data)]
+    if spec.write_spec:
+        row = _json.dumps(_spec_row(spec), ensure_ascii=False).encode("utf-8")
+        files.append((_os.path.splitext(spec.output)[0] + ".json", row))
+    return files
+
+def save_card(args: _argparse.Namespace, cache: _OutputCache | None = None) -> bool:
+    """Render a card and save it to `args.output`, reusing the cached output if possible.
+    Params:
+        args (argparse.Namespace): The parsed arguments, see `parse.argparser`.
+        cache (OutputCache | None): The output cache. `None` disables caching.
+    Returns:
+        bool: Whether the output came from the cache.
+    Raises:
+        ValueError: If any part of the card is invalid.
+    """
+    files, hit = card_files(args, cache)
+    for path, data in files:
+        with open(path, "wb") as f:
+            f.write(data)
+    return hit
+
+class Renderer:
+    """A reentrant card renderer holding the output cache and the asset store it uses.
+    No state of a card is kept on the renderer, so one renderer can serve several threads."""
+
+    def __init__(self, cache: _OutputCache | None = None, store=None) -> None:
+        """Create the renderer.
+        Params:
+            cache (OutputCache | None): The output cache. `None` disables caching.
+            store (shm.SharedAssetStore | pipeline.PrefetchStore | None): The asset store
+                to serve images from before the bundle and the disk.
+        """
+        self.cache = cache
+        self.store = store
+
+    def check(self, args: _argparse.Namespace) -> _argparse.Namespace:
+        """Resolve and validate the parsed arguments, see `check_card`."""
+        with _use_asset_store(self.store):
+            return check_card(args)
+
+    def render(self, args: _argparse.Namespace) -> _Image.Image | _HoloAnimation:
+        """Render a card without the output cache, see `render_card`."""
+        with _use_asset_store(self.store):
+            return render_card(args)
+
+    def build(self, args: _argparse.Namespace) -> tuple[_argparse.Namespace, bytes, bool]:
+        """Render and encode a card, see `build_card`."""
+        with _use_asset_store(self.store):
+            return build_card(args, self.cache)
+
+    def files(self, args: _argparse.Namespace) -> tuple[list[tuple[str, bytes]], bool]:
+        """Render a card into its files without writing them, see `card_files`."""
+        with _use_asset_store(self.store):
+            return card_files(args, self.cache)
+
+    def save(self, args: _argparse.Namespace) -> bool:
+        """Render a card and save it, see `save_card`."""
+        with _use_asset_store(self.store):
+            return save_card(args, self.cache)
+
+    def invalidate(self, paths: list[str]) -> list[str]:
+        """Forget the cached entries of changed resource files, see `watch.invalidate_resources`."""
+        return _invalidate_resources(paths, self.store)
+
+    def watch(self, root: str = "resources", **kwargs) -> _ResourceWatcher:
+        """Start invalidating the changed resource files as they change.
+        Params:
+            root (str): The resource directory.
+            **kwargs: The options of `watch.ResourceWatcher`.
+        Returns:
+            ResourceWatcher: The started watcher. Stop it before dropping the renderer.
+        """
+        return _ResourceWatcher(self.invalidate, root, **kwargs).start()
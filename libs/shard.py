@@ -0,0 +1,208 @@
+# /libs/shard.py
+# -*- coding: utf-8 -*-
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Splitting a batch across machines: manifest shards, resumable checkpoints and the merging of
+the shard manifests.
+
+A checkpoint is a JSONL file with one line per written file:
+    {"row": 1, "digest": "...", "files": 1, "path": "output1.png", "sha256": "...", "bytes": 123}
+`digest` identifies the row's arguments and `files` is the number of files the row writes.
+Lines are appended and flushed as the files are written, so an interrupted run loses at most
+the rows in flight.
+"""
+import argparse as _argparse
+import csv as _csv
+import hashlib as _hashlib
+import json as _json
+import os as _os
+import threading as _threading
+
+from .log import logger as _logger
+from .parse import spec_row as _spec_row
+from .sink import MANIFEST_COLUMNS as _MANIFEST_COLUMNS
+
+def in_shard(index: int, shard: tuple[int, int] | None) -> bool:
+    """Tell whether a row belongs to a shard. Rows are dealt round-robin, so every machine
+    gets the same share and appending rows to the manifest never moves the existing ones.
+    Params:
+        index (int): The row number, starting from 1.
+        shard (tuple[int, int] | None): The shard number, starting from 1, and the number of
+            shards. `None` means the whole manifest.
+    Returns:
+        bool: True if the row belongs to the shard.
+    """
+    return shard is None or (index - 1) % shard[1] == shard[0] - 1
+
+def row_digest(args: _argparse.Namespace) -> str:
+    """Identify the arguments of a row, so a changed row is rendered again on resume.
+    Params:
+        args (argparse.Namespace): The parsed row.
+    Returns:
+        str: The hex digest.
+    """
+    row = _json.dumps(_spec_row(args), ensure_ascii=False, sort_keys=True)
+    return _hashlib.sha256(row.encode("utf-8")).hexdigest()
+
+def _file_digest(path: str) -> str | None:
+    try:
+        with open(path, "rb") as f:
+            return _hashlib.file_digest(f, "sha256").hexdigest()
+    except FileNotFoundError:
+        return None
+
+class Checkpoint:
+    """The completed rows of a batch, recorded as their files are written. Safe to share
+    between threads."""
+
+    def __init__(self, path: str, root: str | None = None) -> None:
+        """Load the checkpoint if it exists.
+        Params:
+            path (str): The checkpoint path.
+            root (str | None): The directory the recorded paths are relative to, e.g. the
+                sharded output directory. `None` means the paths are the output paths.
+        """
+        self.path = path
+        self.root = root
+        self._done: dict[int, tuple[str, int, dict[str, tuple[str, int]]]] = {}
+        self._rows: dict[int, tuple[str, int]] = {}
+        self._lock = _threading.Lock()
+        self._file = None
+        if _os.path.exists(path):
+            self._load()
+
+    def _load(self) -> None:
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = _json.loads(line)
+                    index, digest, count = entry["row"], entry["digest"], entry["files"]
+                    file = (entry["path"], (entry["sha256"], entry["bytes"]))
+                except (ValueError, KeyError, TypeError):
+                    continue # A line cut short by the interruption.
+                done = self._done.get(index)
+                if done is None or done[0] != digest:
+                    done = self._done[index] = (digest, count, {})
+                done[2][file[0]] = file[1]
+
+    def _verify(self, files: dict[str, tuple[str, int]]) -> bool:
+        return all(
+            _file_digest(_os.path.join(self.root, path) if self.root else path) == sha256
+            for path, (sha256, _) in files.items()
+        )
+
+    def resume(self, specs: list[tuple[int, _argparse.Namespace]]) -> \
+            tuple[list[tuple[int, _argparse.Namespace]], list[tuple[int, str, str, int]]]:
+        """Skip the rows completed by an earlier run and start recording the others.
+        A row is skipped only if its arguments are unchanged and its files are still there
+        with the recorded checksums.
+        Params:
+            specs (list[tuple[int, argparse.Namespace]]): The parsed rows.
+        Returns:
+            tuple: The rows left to render, and the `(row, path, sha256, bytes)` entries of the
+            skipped ones.
+        """
+        remaining, skipped = [], []
+        for index, args in specs:
+            digest, count = row_digest(args), 2 if args.write_spec else 1
+            done = self._done.get(index)
+            if done is not None and done[:2] == (digest, count) and len(done[2]) == count \
+                    and self._verify(done[2]):
+                skipped += [(index, path, *file) for path, file in done[2].items()]
+                continue
+            self._rows[index] = (digest, count)
+            remaining.append((index, args))
+        if skipped:
+            _logger.info("检查点 '%s'：跳过 %d 个已完成的行。", self.path, len(specs) - len(remaining))
+        self._file = open(self.path, "a", encoding="utf-8") # pylint: disable=consider-using-with
+        if self._file.tell() and not self._ends_with_newline():
+            self._file.write("\n") # End the line cut short, so the next one is readable.
+        return remaining, skipped
+
+    def _ends_with_newline(self) -> bool:
+        with open(self.path, "rb") as f:
+            f.seek(-1, _os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def record(self, index: int, path: str, sha256: str, size: int) -> None:
+        """Record a written file.
+        Params:
+            index (int): The row number.
+            path (str): The path of the file, relative to the root if there is one.
+            sha256 (str): The hex SHA-256 of the content.
+            size (int): The size of the content in bytes.
+        """
+        digest, count = self._rows[index]
+        line = _json.dumps({"row": index, "digest": digest, "files": count, "path": path,
+                            "sha256": sha256, "bytes": size}, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def record_files(self, index: int, files: list[tuple[str, bytes]]) -> None:
+        """Record the files of a row written to their output paths.
+        Params:
+            index (int): The row number.
+            files (list[tuple[str, bytes]]): The `(path, content)` pairs.
+        """
+        for path, data in files:
+            self.record(index, path, _hashlib.sha256(data).hexdigest(), len(data))
+
+    def entries(self) -> list[tuple[int, str, str, int]]:
+        """List the files recorded by the earlier runs.
+        Returns:
+            list[tuple[int, str, str, int]]: The `(row, path, sha256, bytes)` entries.
+        """
+        return [(index, path, sha256, size)
+                for index, (_, _, files) in self._done.items()
+                for path, (sha256, size) in files.items()]
+
+    def close(self) -> None:
+        """Close the checkpoint file."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+def _read_entries(path: str) -> list[tuple[int, str, str, int]]:
+    if path.endswith(".jsonl"):
+        return Checkpoint(path).entries()
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        return [(int(row["row"]), row["member"], row["sha256"], int(row["bytes"]))
+                for row in _csv.DictReader(f)]
+
+def merge_manifests(paths: list[str], output: str, rows: int | None = None) -> \
+        tuple[int, list[int], list[tuple[int, str]]]:
+    """Combine the manifests of several shards into one.
+    Params:
+        paths (list[str]): The shard manifests (`.manifest.csv` or `manifest.csv` of a sink)
+            or checkpoints (`.jsonl`).
+        output (str): The combined manifest path, written with the columns of a sink manifest.
+        rows (int | None): The number of rows of the whole manifest. `None` skips the check
+            for missing rows.
+    Returns:
+        tuple: The number of entries, the missing row numbers and the `(row, member)` pairs
+        recorded with different checksums by different shards.
+    """
+    entries: dict[tuple[int, str], tuple[str, int]] = {}
+    conflicts = []
+    for path in paths:
+        for index, member, sha256, size in _read_entries(path):
+            previous = entries.setdefault((index, member), (sha256, size))
+            if previous != (sha256, size):
+                conflicts.append((index, member))
+    missing = sorted(set(range(1, rows + 1)) - {index for index, _ in entries}) if rows else []
+    with open(output, "w", encoding="utf-8", newline="") as f:
+        writer = _csv.writer(f)
+        writer.writerow(_MANIFEST_COLUMNS)
+        writer.writerows(sorted((index, member, *file) for (index, member), file in entries.items()))
+    return len(entries), missing, sorted(set(conflicts))
@@ -0,0 +1,161 @@
+# /libs/shm.py
+# -*- coding: utf-8 -*-
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Shared-memory asset store. The owner process decodes every image once into a single
+shared memory segment; worker processes attach to it and wrap the pixels read-only.
+
+Segment layout:
+    attached worker count (i64) | padding | blobs (64-byte aligned raw RGBA)
+"""
+import atexit as _atexit
+import os as _os
+import struct as _struct
+from multiprocessing import shared_memory as _shared_memory
+
+import PIL.Image as _Image
+
+from .bundle import normalize_key as _normalize_key
+from .log import logger as _logger
+
+_COUNTER = _struct.Struct("<q")
+_ALIGN = 64
+
+class SharedAssetStore:
+    """Decoded RGBA images living in one shared memory segment."""
+
+    def __init__(self, shm: _shared_memory.SharedMemory, manifest: dict, lock, *, owner: bool) -> None:
+        """Use `SharedAssetStore.create` or `SharedAssetStore.attach` instead."""
+        self._shm = shm
+        self._view = shm.buf.toreadonly()
+        self._lock = lock
+        self.manifest = manifest
+        self.owner = owner
+        self._closed = False
+
+    @classmethod
+    def create(cls, paths: list[str], lock) -> "SharedAssetStore":
+        """Decode the images into a new shared memory segment.
+        Params:
+            paths (list[str]): The image files to decode. Missing files are skipped.
+            lock (multiprocessing.Lock): The lock protecting the attachment counter.
+        Returns:
+            SharedAssetStore: The owning store. It unlinks the segment on `close` or at exit.
+        """
+        entries = {}
+        offset = _ALIGN
+        for path in dict.fromkeys(_normalize_key(p) for p in paths):
+            if not _os.path.exists(path):
+                continue
+            with _Image.open(path) as image:
+                size = image.size
+            entries[path] = {"offset": offset, "size": size, "mode": "RGBA"}
+            offset += -(-size[0] * size[1] * 4 // _ALIGN) * _ALIGN
+        shm = _shared_memory.SharedMemory(create=True, size=offset)
+        _COUNTER.pack_into(shm.buf, 0, 0)
+        for path, entry in entries.items():
+            with _Image.open(path) as image:
+                data = image.convert("RGBA").tobytes()
+            shm.buf[entry["offset"]:entry["offset"] + len(data)] = data
+        store = cls(shm, {"name": shm.name, "size": offset, "entries": entries}, lock, owner=True)
+        _atexit.register(store.close)
+        return store
+
+    @classmethod
+    def attach(cls, manifest: dict, lock) -> "SharedAssetStore":
+        """Attach to a store created by another process.
+        Params:
+            manifest (dict): The `manifest` of the owning store.
+            lock (multiprocessing.Lock): The lock passed to `SharedAssetStore.create`.
+        Returns:
+            SharedAssetStore: The attached store.
+        """
+        # Workers started by multiprocessing share the resource tracker of the owner,
+        # so registering the segment again on attach is harmless.
+        shm = _shared_memory.SharedMemory(name=manifest["name"])
+        store = cls(shm, manifest, lock, owner=False)
+        store._add_ref(1)
+        _atexit.register(store.close)
+        return store
+
+    def _add_ref(self, delta: int) -> int:
+        with self._lock:
+            count = _COUNTER.unpack_from(self._shm.buf, 0)[0] + delta
+            _COUNTER.pack_into(self._shm.buf, 0, count)
+        return count
+
+    @property
+    def attached(self) -> int:
+        """int: The number of worker processes currently attached."""
+        return _COUNTER.unpack_from(self._shm.buf, 0)[0]
+
+    @property
+    def nbytes(self) -> int:
+        """int: The size of the decoded pixels held in the store."""
+        return sum(e["size"][0] * e["size"][1] * 4 for e in self.manifest["entries"].values())
+
+    def __contains__(self, name: str) -> bool:
+        return _normalize_key(name) in self.manifest["entries"]
+
+    def get(self, name: str) -> _Image.Image | None:
+        """Get an image from the store.
+        Params:
+            name (str): The resource path of the image.
+        Returns:
+            PIL.Image.Image | None: A read-only RGBA view, or `None` if it is not in the store.
+        """
+        entry = self.manifest["entries"].get(_normalize_key(name))
+        if entry is None or self._closed:
+            return None
+        width, height = entry["size"]
+        blob = self._view[entry["offset"]:entry["offset"] + width * height * 4]
+        return _Image.frombuffer("RGBA", (width, height), blob, "raw", "RGBA", 0, 1)
+
+    def discard(self, name: str) -> bool:
+        """Stop serving an image in this process, e.g. one changed on the disk. The shared
+        pixels stay until the store is closed.
+        Params:
+            name (str): The resource path of the image.
+        Returns:
+            bool: True if the image was in the store.
+        """
+        return self.manifest["entries"].pop(_normalize_key(name), None) is not None
+
+    def report(self, workers: int) -> str:
+        """Describe the memory saved by sharing the decoded images.
+        Params:
+            workers (int): The number of worker processes.
+        Returns:
+            str: The human-readable report.
+        """
+        mib = self.nbytes / 1048576
+        return (f"共享内存中存放了 {len(self.manifest['entries'])} 张图片，共 {mib:.1f} MiB。"
+                f"每个工作进程节省 {mib:.1f} MiB，{workers} 个进程共节省 {mib * (workers - 1):.1f} MiB。")
+
+    def close(self) -> None:
+        """Detach from the segment. The owner also unlinks it."""
+        if self._closed:
+            return
+        self._closed = True
+        if not self.owner:
+            self._add_ref(-1)
+        elif self.attached > 0:
+            _logger.warning("仍有 %d 个工作进程连接到共享内存。", self.attached)
+        self._view.release()
+        try:
+            self._shm.close()
+        except BufferError:
+            # Images still referencing the segment keep the mapping alive until they are freed.
+            pass
+        if self.owner:
+            self._shm.unlink()
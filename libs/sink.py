@@ -0,0 +1,214 @@
+# /libs/sink.py
+# -*- coding: utf-8 -*-
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Batch output sinks: a tar or zip archive, or a sharded directory, fed by a writer thread.
+"""
+import csv as _csv
+import hashlib as _hashlib
+import io as _io
+import os as _os
+import queue as _queue
+import tarfile as _tarfile
+import threading as _threading
+import time as _time
+import zipfile as _zipfile
+
+from .bundle import normalize_key as _normalize_key
+from .log import logger as _logger
+
+MANIFEST_COLUMNS = ("row", "member", "sha256", "bytes")
+
+def member_name(path: str) -> str:
+    """Name the archive member of an output path.
+    Params:
+        path (str): The output path of a row.
+    Returns:
+        str: The relative member name. Paths outside the working directory keep their file name.
+    """
+    name = _normalize_key(path)
+    if _os.path.isabs(name) or name.startswith("../"):
+        return _os.path.basename(name)
+    return name
+
+class TarSink:
+    """Outputs streamed into a tar archive, gzip-compressed if the path ends with `.gz`/`.tgz`."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        mode = "w:gz" if path.endswith((".gz", ".tgz")) else "w"
+        self._tar = _tarfile.open(path, mode) # pylint: disable=consider-using-with
+
+    def write(self, name: str, data: bytes) -> str:
+        """Add a member to the archive.
+        Params:
+            name (str): The member name.
+            data (bytes): The content.
+        Returns:
+            str: The member name.
+        """
+        info = _tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = int(_time.time())
+        self._tar.addfile(info, _io.BytesIO(data))
+        return name
+
+    def close(self) -> None:
+        """Finish the archive."""
+        self._tar.close()
+
+class ZipSink:
+    """Outputs streamed into a zip archive. The images are already compressed, so members
+    are stored as-is."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._zip = _zipfile.ZipFile(path, "w", _zipfile.ZIP_STORED) # pylint: disable=consider-using-with
+
+    def write(self, name: str, data: bytes) -> str:
+        """Add a member to the archive.
+        Params:
+            name (str): The member name.
+            data (bytes): The content.
+        Returns:
+            str: The member name.
+        """
+        self._zip.writestr(_zipfile.ZipInfo(name, _time.localtime()[:6]), data)
+        return name
+
+    def close(self) -> None:
+        """Finish the archive."""
+        self._zip.close()
+
+class ShardedDirSink:
+    """Outputs spread over 256 subdirectories, named after the hash of the member name."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        _os.makedirs(path, exist_ok=True)
+
+    def write(self, name: str, data: bytes) -> str:
+        """Write a file into its shard.
+        Params:
+            name (str): The member name, see `member_name`. Its directories are kept, so
+                outputs with the same file name in different directories stay apart.
+            data (bytes): The content.
+        Returns:
+            str: The path of the file relative to the directory, e.g. `3f/output1.png` or
+            `a7/cards/output1.png`.
+        """
+        member = f"{_hashlib.sha256(name.encode('utf-8')).hexdigest()[:2]}/{name}"
+        path = _os.path.join(self.path, member)
+        _os.makedirs(_os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+        return member
+
+    def close(self) -> None:
+        """Nothing to finish."""
+
+def open_sink(archive: str | None = None, sharded_dir: str | None = None):
+    """Open the sink chosen on the command line.
+    Params:
+        archive (str | None): The archive path. `.zip` files are zip archives, anything else
+            is a tar archive.
+        sharded_dir (str | None): The sharded output directory.
+    Returns:
+        TarSink | ZipSink | ShardedDirSink | None: The sink, or `None` to write separate files.
+    """
+    if archive is not None:
+        return ZipSink(archive) if archive.endswith(".zip") else TarSink(archive)
+    if sharded_dir is not None:
+        return ShardedDirSink(sharded_dir)
+    return None
+
+def manifest_path(sink) -> str:
+    """Name the manifest of a sink.
+    Params:
+        sink (TarSink | ZipSink | ShardedDirSink): The sink.
+    Returns:
+        str: `manifest.csv` inside a sharded directory, or the archive path with its
+        extensions replaced by `.manifest.csv`.
+    """
+    if isinstance(sink, ShardedDirSink):
+        return _os.path.join(sink.path, "manifest.csv")
+    stem, extension = _os.path.splitext(sink.path)
+    if extension == ".gz":
+        stem = _os.path.splitext(stem)[0]
+    return stem + ".manifest.csv"
+
+class SinkWriter:
+    """A thread writing the outputs into a sink, so the I/O overlaps with the rendering."""
+
+    def __init__(self, sink, depth: int = 64, checkpoint=None) -> None:
+        """Start the writer thread.
+        Params:
+            sink (TarSink | ZipSink | ShardedDirSink): The sink to write into.
+            depth (int): The number of outputs that may wait for the writer.
+            checkpoint (shard.Checkpoint | None): Records every written output.
+        """
+        self.sink = sink
+        self.checkpoint = checkpoint
+        self.entries: list[tuple[int, str, str, int]] = []
+        self._queue: _queue.Queue = _queue.Queue(depth)
+        self._error: BaseException | None = None
+        self._thread = _threading.Thread(target=self._run, name="sink-writer", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while (item := self._queue.get()) is not None:
+            if self._error is not None:
+                continue # Keep draining so the producers never block.
+            index, name, data = item
+            try:
+                member = self.sink.write(member_name(name), data)
+            except OSError as e:
+                self._error = e
+                continue
+            entry = (index, member, _hashlib.sha256(data).hexdigest(), len(data))
+            self.entries.append(entry)
+            if self.checkpoint is not None:
+                self.checkpoint.record(*entry)
+
+    def put(self, index: int, name: str, data: bytes) -> None:
+        """Queue an output, blocking while the queue is full.
+        Params:
+            index (int): The row number.
+            name (str): The output path of the row.
+            data (bytes): The content.
+        Raises:
+            OSError: If writing an earlier output failed.
+        """
+        if self._error is not None:
+            raise self._error
+        self._queue.put((index, name, data))
+
+    def close(self) -> str:
+        """Wait for the queued outputs, finish the sink and write the manifest.
+        Returns:
+            str: The manifest path.
+        Raises:
+            OSError: If writing any output failed.
+        """
+        self._queue.put(None)
+        self._thread.join()
+        self.sink.close()
+        if self._error is not None:
+            raise self._error
+        path = manifest_path(self.sink)
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            writer = _csv.writer(f)
+            writer.writerow(MANIFEST_COLUMNS)
+            writer.writerows(sorted(self.entries))
+        _logger.info("已将 %d 个文件写入 '%s'，清单见 '%s'。", len(self.entries), self.sink.path, path)
+        return path
@@ -0,0 +1,64 @@
+# /libs/stress.py
+# -*- coding: utf-8 -*-
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Concurrency stress check: the same cards rendered from many threads at once must come out
+byte for byte identical to a single-threaded render.
+"""
+from concurrent.futures import ThreadPoolExecutor as _ThreadPoolExecutor
+import hashlib as _hashlib
+
+from .parse import argparser as _argparser
+from .render import Renderer as _Renderer
+
+# Command lines covering every drawing function, with the random picks and the date fixed.
+STRESS_CASES = (
+    ["-p", "AAAAAAAA", "-r", "15000", "-f", "1234567890", "-a", "12345678901234567890",
+     "-v", "[maimaiDX]1.55-0291", "-q", r"C:\7sRef\System256\metaverse\lasthope",
+     "-i", "level", "master", "rating", "-d", "20250826"],
+    ["-d", "20250826"],
+    ["--override-rating", "15000", "--half-width", "-a", "1234567890123456789012345",
+     "--raw-aime", "--empty-qr-code", "--skip-name-date"],
+    ["--skip-all", "-d", "20250826"],
+    ["-n", "ながいながいなまえのキャラクター[オンゲキ　コメントつき]", "-q", "hello", "-r", "10",
+     "--now", "20250101"],
+    ["-n", "ながいながいなまえのキャラクター[オンゲキ　コメントつき]", "--discard-comment",
+     "-d", "20250826", "-q", "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"],
+    ["-n", "みじかい", "-p", "ＡＢＣＤＥＦＧＨＩ", "-f", "ABCDEF", "-a", "42", "-v", "v1",
+     "-d", "2025-01-02", "-i", "freedom", "power1"],
+    ["-p", "Ｐｌａｙｅｒ１", "-r", "155", "--seed", "7", "-d", "20251231"],
+    ["-p", "Ｐｌａｙｅｒ１", "-C", "resources/character/CardChara0550105.png", "-n", "custom",
+     "-d", "20251231", "--numpy-compositor"],
+)
+
+def stress_render(threads: int = 8, rounds: int = 4, cases: tuple[list[str], ...] = STRESS_CASES) \
+        -> list[tuple[int, str, str]]:
+    """Render the cases single-threaded, then all rounds of them at once from a thread pool.
+    Params:
+        threads (int): The number of threads.
+        rounds (int): How many times every case is rendered concurrently.
+        cases (tuple[list[str], ...]): The command lines, see `parse.argparser`.
+    Returns:
+        list[tuple[int, str, str]]: The case number, the expected and the actual SHA-256 of
+        every concurrent render that differs. Empty if all of them match.
+    """
+    renderer = _Renderer()
+    specs = []
+    for argv in cases:
+        args = _argparser([*argv, "--seed", "0"] if "--seed" not in argv else argv)
+        specs.append(renderer.check(args))
+    expected = [_hashlib.sha256(renderer.build(spec)[1]).hexdigest() for spec in specs]
+    jobs = [i for _ in range(rounds) for i in range(len(specs))]
+    with _ThreadPoolExecutor(threads) as pool:
+        digests = pool.map(lambda i: _hashlib.sha256(renderer.build(specs[i])[1]).hexdigest(), jobs)
+        return [(i, expected[i], digest) for i, digest in zip(jobs, digests) if digest != expected[i]]
@@ -16,31 +16,50 @@ Some utility functions for image processing.
 """
 from time import time as _time
 import datetime as _datetime
+import hashlib as _hashlib
 import json as _json
 from io import BytesIO as _BIO, StringIO as _SIO
-from contextlib import redirect_stderr as _redirect_stderr
+from contextlib import contextmanager as _contextmanager, redirect_stderr as _redirect_stderr
+from contextvars import ContextVar as _ContextVar
 from math import ceil
 import os as _os
-from random import choice as _choice
+import random as _random
+from random import Random as _Random
+import threading as _threading
+from typing import Iterator as _Iterator
 
 import PIL.Image as _Image
 import PIL.ImageFont as _ImageFont
+import PIL.features as _features
 from fontTools.ttLib import TTFont as _TTFont
 
+from .log import logger as _logger
+from .bundle import load_bundle as _load_bundle
+from .atlas import load_atlas as _load_atlas
+from .metrics import GlyphWidths as _GlyphWidths, load_metrics as _load_metrics
+from .plates import Plate as _Plate, load_plates as _load_plates
+
 def not_found_err(file: str) -> None:
     """Create a FileNotFoundError with a custom message.
     Params:
         file (str): The file that was not found.
     """
-    print(f"[ERROR] 找不到文件 '{file}'。请检查资源文件完整性。")
+    _logger.error("找不到文件 '%s'。请检查资源文件完整性。", file)
 
 def open_image(image: str) -> _Image.Image:
     """Open an image file.
     Params:
         image (str): The image file name.
     Returns:
-        PIL.Image.Image: The opened image.
+        PIL.Image.Image: The opened image. Stored and bundled images are read-only RGBA views.
     """
+    store = _STORE.get()
+    if store is not None and (stored := store.get(image)) is not None:
+        return stored
+    if _BUNDLE is not None and (bundled := _BUNDLE.get(image)) is not None:
+        return bundled
+    if _ATLAS is not None and (sprite := _ATLAS.get(image)) is not None:
+        return sprite
     try:
         return _Image.open(image)
     except FileNotFoundError:
@@ -48,10 +67,30 @@ def open_image(image: str) -> _Image.Image:
         raise
 
 start = _time()
-print("绘制开始！正在进行准备...")
+_BUNDLE = _load_bundle()
+_ATLAS = _load_atlas()
+_METRICS = _load_metrics()
+_STORE: _ContextVar = _ContextVar("asset_store", default=None)
+
+@_contextmanager
+def use_asset_store(store) -> _Iterator:
+    """Serve images from an asset store before the bundle and the disk, in the current
+    thread and inside the block only.
+    Params:
+        store (shm.SharedAssetStore | pipeline.PrefetchStore | None): The store to use.
+    Returns:
+        Iterator: The block.
+    """
+    token = _STORE.set(store)
+    try:
+        yield
+    finally:
+        _STORE.reset(token)
+
 try:
     with open("resources/font/SEGA_MARUGOTHICDB.ttf", "rb") as _ttf:
-        _FONT_BINARY = _BIO(_ttf.read())
+        _FONT_BYTES = _ttf.read()
+        _FONT_BINARY = _BIO(_FONT_BYTES)
 except FileNotFoundError as e:
     not_found_err(e.filename)
     raise
@@ -62,6 +101,20 @@ with _SIO() as _stdout:
     with _redirect_stderr(_stdout):
         _FONT_CMAP = _TTFont(_FONT_BINARY).getBestCmap()
 
+# The font file and the rasterizer, identifying prerendered text.
+FONT_ID = f"{_hashlib.sha256(_FONT_BYTES).hexdigest()}-freetype{_features.version('freetype2')}"
+_PLATES = _load_plates(FONT_ID)
+
+def get_plate(name: str) -> _Plate | None:
+    """Get the prerendered plate of a character name, see `plates.PlateTable.get`.
+    Params:
+        name (str): The name as drawn, i.e. without the comment if it is discarded.
+    Returns:
+        Plate | None: The line masks and their positions, or `None` if the name is not
+        prerendered.
+    """
+    return None if _PLATES is None else _PLATES.get(name)
+
 def to_full_width(text: str) -> str:
     """Convert half-width characters to full-width characters.
     Params:
@@ -82,7 +135,7 @@ def find_rating_background(rating: int) -> int:
         ValueError: If the rating is negative.
     """
     if rating < 0:
-        print("[ERROR] DX Rating 值不可以是负数。")
+        _logger.error("DX Rating 值不可以是负数。")
         raise ValueError(f"Rating must be non-negative, but got {rating}.")
     thresholds = (1000, 2000, 4000, 7000, 10000, 12000, 13000, 14000, 14500, 15000)
     return 1 + sum(int(rating >= threshold) for threshold in thresholds)
@@ -96,10 +149,19 @@ def text_validate(text: str) -> str:
     """
     for char in text:
         if ord(char) not in _FONT_CMAP:
-            print(f"[ERROR] '{char}' (U+{ord(char):04X}) 无法被字体文件正常渲染。简体字的支持情况十分不乐观！")
+            _logger.error("'%s' (U+%04X) 无法被字体文件正常渲染。简体字的支持情况十分不乐观！", char, ord(char))
             raise ValueError(f"Invalid character '{char}' (U+{ord(char):04X}) found in text.")
     return text
 
+def missing_glyphs(text: str) -> list[str]:
+    """Find the characters the font cannot render, without logging.
+    Params:
+        text (str): The text to check.
+    Returns:
+        list[str]: The distinct characters missing from the font, in order of appearance.
+    """
+    return list(dict.fromkeys(char for char in text if ord(char) not in _FONT_CMAP))
+
 def aime_process(aime: int) -> str:
     """Process the Aime ID.
     Params:
@@ -110,22 +172,112 @@ def aime_process(aime: int) -> str:
         ValueError: If the Aime ID is too long (more than 20 digits).
     """
     if aime > 1e20 - 1:
-        print("[ERROR] Aime ID 不可超过 20 位。如果你确实想输入这一文本，使用 --raw-aime。")
+        _logger.error("Aime ID 不可超过 20 位。如果你确实想输入这一文本，使用 --raw-aime。")
         raise ValueError(f"Invalid Aime ID '{aime}' found. Use --raw-aime to prevent processing.")
     s = str(aime)
     if len(s) < 20:
         s = s.zfill(20)
     return '  '.join(s[i:i + 4] for i in range(0, 20, 4))
 
+_THREAD_FONTS = _threading.local()
+
 def get_font(size: int) -> _ImageFont.FreeTypeFont:
-    """Get the PIL font with given size.
+    """Get the PIL font with given size. Fonts are loaded once per size and thread, since a
+    FreeType face must not be used by several threads at once.
     Params:
         size (int): The font size.
     Returns:
         PIL.ImageFont.FreeTypeFont: The PIL font with the given size.
     """
-    _FONT_BINARY.seek(0)
-    return _ImageFont.truetype(_FONT_BINARY, size)
+    fonts = _THREAD_FONTS.__dict__.setdefault("fonts", {})
+    if size not in fonts:
+        fonts[size] = _ImageFont.truetype(_BIO(_FONT_BYTES), size)
+    return fonts[size]
+
+def font_cmap() -> dict[int, str]:
+    """Get the character map of the font.
+    Returns:
+        dict[int, str]: The glyph names, keyed by the codepoints the font covers. Shared, do
+        not modify it.
+    """
+    return _FONT_CMAP
+
+_GLYPH_WIDTHS: dict[int, _GlyphWidths] = {}
+_GLYPH_WIDTHS_LOCK = _threading.Lock()
+
+def glyph_widths(size: int) -> _GlyphWidths:
+    """Get the glyph metrics of the font with given size, from the metrics table if it exists.
+    The metrics are shared by all threads.
+    Params:
+        size (int): The font size.
+    Returns:
+        metrics.GlyphWidths: The glyph metrics with the given size.
+    """
+    with _GLYPH_WIDTHS_LOCK:
+        if size not in _GLYPH_WIDTHS:
+            # A font of its own, as it measures glyphs for every thread.
+            font = _ImageFont.truetype(_BIO(_FONT_BYTES), size)
+            _GLYPH_WIDTHS[size] = _GlyphWidths(font, _METRICS and _METRICS.get(size))
+        return _GLYPH_WIDTHS[size]
+
+def text_width(text: str, size: int) -> int:
+    """Measure the width of the text from the glyph metrics.
+    Params:
+        text (str): The text to measure.
+        size (int): The font size.
+    Returns:
+        int: The width of the text in pixels.
+    """
+    return glyph_widths(size).width(text)
+
+_CATALOG_LOCK = _threading.Lock()
+_CHARA_NAMES: dict[str, str] | None = None
+_RESOURCE_IDS: dict[str, set[str]] = {}
+# The listed directories and the length of the file name prefix before the ID.
+_ID_DIRECTORIES = {"resources/character": 9, "resources/background": 8}
+
+def _chara_names() -> dict[str, str]:
+    global _CHARA_NAMES # pylint: disable=global-statement
+    with _CATALOG_LOCK:
+        if _CHARA_NAMES is None:
+            with open("resources/index/chara.json", "r", encoding="utf-8") as f:
+                _CHARA_NAMES = _json.load(f)
+        return _CHARA_NAMES
+
+def _resource_ids(directory: str) -> list[str]:
+    with _CATALOG_LOCK:
+        if directory not in _RESOURCE_IDS:
+            prefix = _ID_DIRECTORIES[directory]
+            _RESOURCE_IDS[directory] = {f[prefix:-4] for f in _os.listdir(directory) if f.endswith(".png")}
+        return sorted(_RESOURCE_IDS[directory])
+
+def invalidate_catalog(paths: list[str]) -> list[str]:
+    """Forget the catalog entries of changed resource files: the character name index and the
+    IDs of the characters and backgrounds to pick from. They are read again on next use.
+    Params:
+        paths (list[str]): The changed paths, normalised, see `bundle.normalize_key`.
+    Returns:
+        list[str]: The changed entries, e.g. `resources/index/chara.json` or
+        `resources/character/0550105`.
+    """
+    global _CHARA_NAMES # pylint: disable=global-statement
+    changed = []
+    with _CATALOG_LOCK:
+        for path in paths:
+            directory, name = _os.path.split(path)
+            if path == "resources/index/chara.json":
+                if _CHARA_NAMES is not None:
+                    _CHARA_NAMES = None
+                    changed.append(path)
+            elif directory in _ID_DIRECTORIES and name.endswith(".png") and directory in _RESOURCE_IDS:
+                # Only the changed ID, instead of listing the whole directory again.
+                ids, entry = _RESOURCE_IDS[directory], name[_ID_DIRECTORIES[directory]:-4]
+                if _os.path.exists(path):
+                    ids.add(entry)
+                else:
+                    ids.discard(entry)
+                changed.append(f"{directory}/{entry}")
+    return changed
 
 def find_chara_name(chara_id: str | int) -> str:
     """Find the character name from the character ID.
@@ -135,20 +287,27 @@ def find_chara_name(chara_id: str | int) -> str:
         str: The character name. If not found, returns the original ID.
     """
     try:
-        with open("resources/index/chara.json", "r", encoding="utf-8") as f:
-            data = _json.load(f)
-            return data[str(chara_id).zfill(7)]
+        return _chara_names()[str(chara_id).zfill(7)]
     except KeyError as e:
-        print("[ERROR] 无法从角色名索引中找到给定的角色名。自定义的角色请使用 -n/--name 指定名称。")
+        _logger.error("无法从角色名索引中找到给定的角色名。自定义的角色请使用 -n/--name 指定名称。")
         raise ValueError(f"Character ID '{chara_id}' not found.") from e
     except FileNotFoundError as e:
         not_found_err(e.filename)
         raise
 
-def date_process(date_str: str | None) -> str:
+def _parse_date(date_str: str) -> _datetime.datetime | None:
+    for fmt in ("%Y%m%d", "%Y-%m-%d", "%Y/%m/%d"):
+        try:
+            return _datetime.datetime.strptime(date_str, fmt)
+        except ValueError:
+            pass
+    return None
+
+def date_process(date_str: str | None, now: str | None = None) -> str:
     """Process the input date.
     Params:
         date (str | None): The input date to process.
+        now (str | None): The current date used for the default. The real current date if None.
     Returns:
         str: The validated date in the format YYYY/MM/DD.
         If the input is None, returns the date 14 days ahead in the format YYYY/MM/DD.
@@ -156,32 +315,16 @@ def date_process(date_str: str | None) -> str:
         ValueError: If the date is not in the correct format.
     """
     if date_str is None:
-        print("[10/10] 将使用默认到期日期。")
-        return (_datetime.datetime.now().date() + _datetime.timedelta(days=14)).strftime("%Y/%m/%d")
-    valid = False
-    try:
-        date = _datetime.datetime.strptime(date_str, "%Y%m%d")
-        valid = True
-    except ValueError:
-        pass
-    try:
-        date = _datetime.datetime.strptime(date_str, "%Y-%m-%d")
-        valid = True
-    except ValueError:
-        pass
-    try:
-        date = _datetime.datetime.strptime(date_str, "%Y-%m-%d")
-        valid = True
-    except ValueError:
-        pass
-    try:
-        date = _datetime.datetime.strptime(date_str, "%Y/%m/%d")
-        valid = True
-    except ValueError:
-        pass
+        _logger.info("将使用默认到期日期。", extra={"stage": 10})
+        today = _datetime.datetime.now().date() if now is None else _parse_date(now)
+        if today is None:
+            _logger.error("无法解析当前日期，请使用 YYYYMMDD、YYYY-MM-DD 或 YYYY/MM/DD 格式。")
+            raise ValueError(f"Invalid date: {now}.")
+        return (today + _datetime.timedelta(days=14)).strftime("%Y/%m/%d")
 
-    if not valid:
-        print("[ERROR] 无法解析日期，请使用 YYYYMMDD、YYYY-MM-DD 或 YYYY/MM/DD 格式，并检查这一天是否真的存在。")
+    date = _parse_date(date_str)
+    if date is None:
+        _logger.error("无法解析日期，请使用 YYYYMMDD、YYYY-MM-DD 或 YYYY/MM/DD 格式，并检查这一天是否真的存在。")
         raise ValueError(f"Invalid date: {date_str}.")
 
     return date.strftime("%Y/%m/%d")
@@ -197,39 +340,63 @@ def text_width_validate(text: str, font: _ImageFont.FreeTypeFont, max_width: int
     Raises:
         ValueError: If the text is too wide.
     """
-
-    text_width = font.getbbox(text, anchor="lt")[2]
-    if text_width > max_width:
-        print(f"[ERROR] 文本过宽，超出限制值 {ceil(text_width) - max_width} 像素。")
-        raise ValueError(f"Text '{text}' is too wide (width: {ceil(text_width)}, max: {max_width})")
+    width = text_width(text, font.size)
+    if width > max_width:
+        _logger.error("文本过宽，超出限制值 %d 像素。", ceil(width) - max_width)
+        raise ValueError(f"Text '{text}' is too wide (width: {ceil(width)}, max: {max_width})")
     return text
 
-def random_chara() -> int:
+def random_chara(rng: _Random | None = None) -> int:
     """Randomly choose a character image.
+    Params:
+        rng (random.Random | None): The random generator. The global one if None.
     Returns:
         int: The ID of the randomly chosen character image.
     """
-    print("[1/10] 随机选取角色...")
-    files = [f[9:-4] for f in _os.listdir("resources/character/") if f.endswith((".png"))]
+    _logger.info("随机选取角色...", extra={"stage": 1})
+    files = _resource_ids("resources/character")
     if not files:
-        print("[ERROR] 随机选取角色失败。请检查资源文件完整性。")
+        _logger.error("随机选取角色失败。请检查资源文件完整性。")
         raise ValueError("No valid image files found in directory: resources/character/")
-    chosen_file = _choice(files)
+    chosen_file = (rng or _random).choice(files)
     return int(chosen_file)
 
-def random_background() -> int:
+def random_background(rng: _Random | None = None) -> int:
     """Randomly choose a background image.
+    Params:
+        rng (random.Random | None): The random generator. The global one if None.
     Returns:
         int: The ID of the randomly chosen background image.
     """
-    print("[1/10] 随机选取背景...")
-    files = [f[8:-4] for f in _os.listdir("resources/background/") if f.endswith((".png"))]
+    _logger.info("随机选取背景...", extra={"stage": 1})
+    files = _resource_ids("resources/background")
     if not files:
-        print("[ERROR] 随机选取背景失败。请检查资源文件完整性。")
+        _logger.error("随机选取背景失败。请检查资源文件完整性。")
         raise ValueError("No valid image files found in directory: resources/background/")
-    chosen_file = _choice(files)
+    chosen_file = (rng or _random).choice(files)
     return int(chosen_file)
 
+def invalidate_assets(paths: list[str]) -> list[str]:
+    """Stop serving changed resource files from the bundle and the atlas, so they are read
+    from the disk instead.
+    Params:
+        paths (list[str]): The changed paths, normalised, see `bundle.normalize_key`.
+    Returns:
+        list[str]: The paths that were served from the bundle or the atlas.
+    """
+    return [path for path in paths
+            if any([source is not None and source.discard(path) for source in (_BUNDLE, _ATLAS)])]
+
+def asset_exists(image: str) -> bool:
+    """Check if an image can be opened by `open_image`, without opening it.
+    Params:
+        image (str): The image file name.
+    Returns:
+        bool: True if the image is in the shared store, the bundle, the atlas or on the disk.
+    """
+    return any(source is not None and image in source for source in (_STORE.get(), _BUNDLE, _ATLAS))\
+        or _os.path.exists(image)
+
 def is_existing(file_path: str) -> bool:
     """Check if a file exists.
     Params:
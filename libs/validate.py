@@ -0,0 +1,132 @@
+# /libs/validate.py
+# -*- coding: utf-8 -*-
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Validation of a card spec without any pixel work.
+"""
+import argparse as _argparse
+from math import ceil
+import os as _os
+
+from .utils import to_full_width as _to_full_width, text_validate as _text_validate,\
+    aime_process as _aime_process, find_chara_name as _find_chara_name,\
+    date_process as _date_process, find_rating_background as _find_ra_bg,\
+    text_width as _text_width, asset_exists as _asset_exists
+from .draw import qr_version as _qr_version, max_icons as _max_icons,\
+    fit_chara_name as _fit_chara_name
+
+# APNG and WebP, the formats Pillow writes animations of in full color.
+ANIMATED_EXTENSIONS = (".png", ".apng", ".webp")
+
+def card_assets(args: _argparse.Namespace) -> list[str]:
+    """List the images drawing a resolved spec opens.
+    Params:
+        args (argparse.Namespace): The resolved spec, see `render.resolve_spec`.
+    Returns:
+        list[str]: The image paths.
+    """
+    if isinstance(args.background, int):
+        paths = [f"resources/background/CardBase{str(args.background).zfill(6)}.png"]
+    else:
+        paths = [args.background]
+    if isinstance(args.chara, int):
+        paths.append(f"resources/character/CardChara{str(args.chara).zfill(7)}.png")
+    else:
+        paths.append(args.chara)
+    if args.holographic:
+        paths += [args.holo_from, f"resources/holograph/CardCharaMask{str(args.chara).zfill(6)}.png"]
+    pass_image = args.pass_type.value[0]
+    paths += [pass_image, pass_image[:-4] + "Icon.png", "resources/general/SerialCode.png"]
+    if not args.skip_rating:
+        rating = args.override_rating or args.rating or 0
+        paths.append(f"resources/general/Ra{_find_ra_bg(max(rating, 0))}.png")
+        if args.rating is None:
+            paths.append("resources/general/Num-.png")
+        elif args.rating > 0:
+            paths += [f"resources/general/Num{digit}.png" for digit in sorted(set(str(args.rating)))]
+    if not args.skip_player_name:
+        paths.append("resources/general/Player.png")
+    if not args.skip_friend_code:
+        paths.append("resources/general/Friend.png")
+        if args.friend_code is None:
+            paths.append("resources/general/NoFriendCode.png")
+    if not args.skip_qr_code:
+        paths.append("resources/general/QRCodeBase.png")
+        if args.qr_code is None and not args.empty_qr_code:
+            paths.append("resources/general/DummyQRCode.png")
+    paths += [icon.value for icon in args.icon or ()]
+    if not args.skip_info_plate:
+        paths.append("resources/general/Name.png")
+    return list(dict.fromkeys(paths))
+
+def _check_width(text: str, size: int, max_width: int) -> None:
+    width = _text_width(text, size)
+    if width > max_width:
+        raise ValueError(f"Text '{text}' is too wide (width: {ceil(width)}, max: {max_width})")
+
+def validate_spec(args: _argparse.Namespace) -> list[str]:
+    """Run every check the drawing functions would run, without drawing.
+    Params:
+        args (argparse.Namespace): The resolved spec, see `render.resolve_spec`.
+    Returns:
+        list[str]: The error messages. Empty if the spec is valid.
+    """
+    errors = []
+    def check(func, *params, **options):
+        try:
+            func(*params, **options)
+        except (ValueError, FileNotFoundError) as e:
+            errors.append(str(e))
+
+    if not args.skip_date:
+        check(_date_process, args.date, args.now)
+    for text in (args.player_name, args.chara_name, args.friend_code, args.version):
+        if text is not None:
+            check(_text_validate, text)
+    if not args.skip_rating:
+        check(_find_ra_bg, args.rating or 0)
+        if args.override_rating:
+            check(_find_ra_bg, args.override_rating)
+    if not args.skip_player_name:
+        player_name = _to_full_width(args.player_name) if args.full_width else args.player_name
+        check(_check_width, player_name, 28, 273)
+    if not args.skip_friend_code:
+        check(_check_width, f"{args.friend_code}", 20, 195)
+    if isinstance(args.aime, int) and not args.raw_aime:
+        check(lambda: _check_width(_aime_process(args.aime), 16, 270))
+    else:
+        check(_check_width, str(args.aime), 16, 270)
+    check(_check_width, args.version, 16, 190)
+    if not args.skip_qr_code and not args.empty_qr_code and args.qr_code is not None:
+        check(_qr_version, args.qr_code)
+    if args.icon is not None and (count := len(args.icon)) > _max_icons(not args.skip_qr_code):
+        errors.append(f"Icons exceed the limit. {count} icons provided.")
+    if not args.skip_name:
+        if args.chara_name is not None:
+            check(_fit_chara_name, args.chara_name, discard=args.discard_comment)
+        elif isinstance(args.chara, int):
+            check(lambda: _fit_chara_name(_find_chara_name(args.chara), discard=args.discard_comment))
+        else:
+            errors.append("Custom character name must be specified with -n/--name.")
+    if args.holo_frames is not None:
+        if not args.holographic:
+            errors.append("--holo-frames requires -H/--holographic.")
+        if args.holo_frames < 2:
+            errors.append(f"An animation needs at least 2 frames, {args.holo_frames} given.")
+        if args.frame_duration <= 0:
+            errors.append(f"Invalid frame duration: {args.frame_duration} ms.")
+        if (extension := _os.path.splitext(args.output)[1].lower()) not in ANIMATED_EXTENSIONS:
+            errors.append(f"Animations are saved as {', '.join(ANIMATED_EXTENSIONS)}, not '{extension}'.")
+    if missing := [path for path in card_assets(args) if not _asset_exists(path)]:
+        errors.append(f"Missing assets: {', '.join(missing)}.")
+    return errors
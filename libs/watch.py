@@ -0,0 +1,246 @@
+# /libs/watch.py
+# -*- coding: utf-8 -*-
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Resource hot reload: a long-running renderer watches the resource directory and forgets only
+the cached entries of the files that changed, instead of restarting cold.
+
+Changes are reported by inotify on Linux. Elsewhere, or when inotify is unavailable, the
+directory is scanned at an interval and compared with the previous scan.
+"""
+import ctypes as _ctypes
+import ctypes.util as _ctypes_util
+import os as _os
+import select as _select
+import struct as _struct
+import sys as _sys
+import threading as _threading
+from typing import Callable as _Callable
+
+from .bundle import normalize_key as _normalize_key
+from .cache import forget_digests as _forget_digests
+from .composite import discard_layers as _discard_layers
+from .log import logger as _logger
+from .utils import invalidate_assets as _invalidate_assets, invalidate_catalog as _invalidate_catalog
+
+WATCH_INTERVAL = 1.0
+# Changes arriving within this delay are reported together, e.g. a file copied in chunks.
+_SETTLE = 0.05
+
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ISDIR = 0x40000000
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_WATCH_MASK = _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+# struct inotify_event without the trailing name.
+_EVENT = _struct.Struct("iIII")
+
+def _libc():
+    if not _sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = _ctypes.CDLL(_ctypes_util.find_library("c") or "libc.so.6", use_errno=True)
+    except OSError:
+        return None
+    return libc if hasattr(libc, "inotify_init1") else None
+
+def _scan(root: str) -> dict[str, tuple[int, int]]:
+    snapshot = {}
+    for directory, _, files in _os.walk(root):
+        for name in files:
+            path = _normalize_key(_os.path.join(directory, name))
+            try:
+                stat = _os.stat(path)
+            except FileNotFoundError:
+                continue
+            snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+    return snapshot
+
+def invalidate_resources(paths: list[str], store=None) -> list[str]:
+    """Forget the cached entries of changed resource files: the catalog, the bundled and atlas
+    images, the prepared layers, the memorized digests and the images of an asset store.
+    The normalised images of `assets.ASSETS` and the output cache are keyed by content and
+    need nothing.
+    Params:
+        paths (list[str]): The changed paths.
+        store (shm.SharedAssetStore | pipeline.PrefetchStore | None): The asset store of the
+            renderer, if any.
+    Returns:
+        list[str]: The entries that were cached, for the log.
+    """
+    paths = sorted({_normalize_key(path) for path in paths})
+    entries = set(_invalidate_catalog(paths)) | set(_invalidate_assets(paths))
+    _forget_digests(paths)
+    for path in paths:
+        if _discard_layers(path):
+            entries.add(path)
+        if store is not None and store.discard(path):
+            entries.add(path)
+    if "resources/font/SEGA_MARUGOTHICDB.ttf" in paths:
+        _logger.warning("字体文件已变更，需要重启才能生效。")
+    _logger.info("检测到 %d 个资源文件变更，清除了 %d 项缓存：%s", len(paths), len(entries), " ".join(paths))
+    return sorted(entries)
+
+class ResourceWatcher:
+    """Watches a directory tree from a background thread and passes the changed files to a
+    callback, a batch at a time."""
+
+    def __init__(self, callback: _Callable[[list[str]], object], root: str = "resources", *,
+                 interval: float = WATCH_INTERVAL, polling: bool = False) -> None:
+        """Start watching. The changes made after this are reported once the watcher is started.
+        Params:
+            callback (Callable[[list[str]], object]): Called from the watching thread with the
+                normalised paths of the changed files, e.g. `invalidate_resources`.
+            root (str): The directory to watch.
+            interval (float): The seconds between two scans when polling.
+            polling (bool): Scan the directory even if inotify is available.
+        """
+        self.callback = callback
+        self.root = root
+        self.interval = interval
+        self.backend = "polling"
+        self._fd: int | None = None
+        self._libc = None if polling else _libc()
+        self._watches: dict[int, str] = {}
+        self._stop = _threading.Event()
+        self._thread: _threading.Thread | None = None
+        if self._libc is not None:
+            try:
+                self._open_inotify()
+                self.backend = "inotify"
+            except OSError as e:
+                _logger.warning("无法使用 inotify 监视 '%s'（%s），将改为轮询。", root, e.strerror)
+                self._close_inotify()
+        # Kept by both backends: inotify rescans against it when it loses track of the events.
+        self._snapshot = _scan(root)
+
+    def _open_inotify(self) -> None:
+        self._fd = self._libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self._fd < 0:
+            self._fd = None
+            error = _ctypes.get_errno()
+            raise OSError(error, _os.strerror(error))
+        self._add_watches(self.root)
+
+    def _add_watches(self, root: str) -> None:
+        for directory, _, _ in _os.walk(root):
+            wd = self._libc.inotify_add_watch(self._fd, _os.fsencode(directory), _WATCH_MASK)
+            if wd < 0:
+                error = _ctypes.get_errno()
+                raise OSError(error, _os.strerror(error)) # e.g. ENOSPC, out of watches
+            self._watches[wd] = _normalize_key(directory)
+
+    def _close_inotify(self) -> None:
+        if self._fd is not None:
+            _os.close(self._fd)
+            self._fd = None
+        self._watches.clear()
+
+    def _rescan(self) -> set[str]:
+        snapshot = _scan(self.root)
+        changed = {path for path in self._snapshot.keys() | snapshot.keys()
+                   if self._snapshot.get(path) != snapshot.get(path)}
+        self._snapshot = snapshot
+        return changed
+
+    def _read_events(self) -> set[str]:
+        try:
+            data = _os.read(self._fd, 65536)
+        except BlockingIOError:
+            return set()
+        changed, rescan, offset = set(), False, 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            name = data[offset + _EVENT.size:offset + _EVENT.size + length].rstrip(b"\0")
+            offset += _EVENT.size + length
+            if mask & _IN_Q_OVERFLOW:
+                rescan = True # Events were dropped, compare with the snapshot instead.
+            elif mask & _IN_IGNORED:
+                self._watches.pop(wd, None)
+            elif (directory := self._watches.get(wd)) is not None and name:
+                path = f"{directory}/{_os.fsdecode(name)}"
+                if mask & _IN_ISDIR:
+                    if mask & (_IN_CREATE | _IN_MOVED_TO):
+                        self._add_watches(path)
+                    rescan = True # The files of a directory moved in or out come without events.
+                else:
+                    changed.add(path)
+        if rescan:
+            return changed | self._rescan()
+        for path in changed:
+            try:
+                stat = _os.stat(path)
+                self._snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+            except FileNotFoundError:
+                self._snapshot.pop(path, None)
+        return changed
+
+    def check(self, timeout: float = 0) -> list[str]:
+        """Look for changes once.
+        Params:
+            timeout (float): The seconds to wait for a change with inotify. Scans return at once.
+        Returns:
+            list[str]: The changed paths, sorted.
+        """
+        if self._fd is None:
+            return sorted(self._rescan())
+        changed = set()
+        if _select.select([self._fd], [], [], timeout)[0]:
+            changed = self._read_events()
+            while _select.select([self._fd], [], [], _SETTLE)[0]:
+                changed |= self._read_events()
+        return sorted(changed)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                if self._fd is None:
+                    if self._stop.wait(self.interval):
+                        break
+                    changed = self.check()
+                else:
+                    changed = self.check(self.interval)
+                if changed:
+                    self.callback(changed)
+            except Exception as e: # pylint: disable=broad-exception-caught
+                _logger.error("处理资源变更时出错：%s", e)
+
+    def start(self) -> "ResourceWatcher":
+        """Start the watching thread.
+        Returns:
+            ResourceWatcher: The watcher itself.
+        """
+        if self._thread is None:
+            self._thread = _threading.Thread(target=self._run, name="resource-watcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop the watching thread and release the inotify descriptor."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._close_inotify()
+
+    def __enter__(self) -> "ResourceWatcher":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
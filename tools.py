@@ -0,0 +1,212 @@
+# /tools.py
+# -*- coding: utf-8 -*-
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Entry point for the maintenance tools.
+"""
+import json as _json
+import logging as _logging
+import signal as _signal
+from threading import Event as _Event
+from time import time as _time
+
+from libs.parse import toolparser as _toolparser
+from libs.log import logger as _logger, setup_logging as _setup_logging
+from libs.bundle import build_bundle as _build_bundle
+from libs.atlas import build_atlas as _build_atlas
+from libs.lint import lint_manifest as _lint_manifest
+from libs.stress import stress_render as _stress_render
+from libs.composite import benchmark_stack as _benchmark_stack
+from libs.consts import DXPass as _Pass
+from libs.shard import merge_manifests as _merge_manifests
+from libs.assets import normalize_resources as _normalize_resources
+from libs.daemon import RenderDaemon as _RenderDaemon
+from libs.watch import ResourceWatcher as _ResourceWatcher, invalidate_resources as _invalidate_resources
+from libs.metrics import METRIC_SIZES as _METRIC_SIZES, build_metrics as _build_metrics,\
+    load_metrics as _load_metrics, verify_metrics as _verify_metrics
+from libs.plates import build_plates as _build_plates
+from libs.draw import chara_name_plate as _chara_name_plate, chara_name_text as _chara_name_text
+from libs.utils import get_font as _get_font, font_cmap as _font_cmap, FONT_ID as _FONT_ID
+
+def _bundle(args):
+    _logger.info("正在将 '%s' 编译为资源包...", args.root)
+    start = _time()
+    try:
+        count = _build_bundle(args.root, args.output, compress=args.compress)
+    except ValueError as e:
+        _logger.error("无法构建资源包：%s", e)
+        raise SystemExit(1) from e
+    _logger.info("资源包 '%s' 构建完成，共 %d 张图片，用时 %.2f 秒。", args.output, count, _time() - start)
+
+def _atlas(args):
+    _logger.info("正在将 '%s' 下的小图片打包为图集...", args.root)
+    start = _time()
+    try:
+        count = _build_atlas(args.root, args.output, args.index)
+    except ValueError as e:
+        _logger.error("无法构建图集：%s", e)
+        raise SystemExit(1) from e
+    _logger.info("图集 '%s' 构建完成，共 %d 张图片，用时 %.2f 秒。", args.output, count, _time() - start)
+
+def _metrics(args):
+    if args.verify:
+        table = _load_metrics(args.output)
+        if table is None:
+            _logger.error("找不到字形宽度表 '%s'。", args.output)
+            raise SystemExit(1)
+        _logger.info("正在与 FreeType 的测量结果比对...")
+        fonts = {size: _get_font(size) for size in table.sizes}
+        errors = _verify_metrics(table, fonts, _font_cmap(), args.samples)
+        for size, error in errors.items():
+            _logger.info("字号 %d：最大误差 %d 像素。", size, error)
+        if max(errors.values(), default=0) > 1:
+            _logger.error("字形宽度表误差超过 1 像素，请重新构建。")
+            raise SystemExit(1)
+        return
+    _logger.info("正在测量字形宽度...")
+    start = _time()
+    count = _build_metrics({size: _get_font(size) for size in _METRIC_SIZES}, _font_cmap(), args.output)
+    _logger.info("字形宽度表 '%s' 构建完成，共 %d 个字符，%d 个字号，用时 %.2f 秒。",
+                 args.output, count, len(_METRIC_SIZES), _time() - start)
+
+def _plates(args):
+    with open(args.index, "r", encoding="utf-8") as f:
+        names = _json.load(f)
+    _logger.info("正在预渲染 %d 个角色名（含去掉注释的版本）...", len(names))
+    start = _time()
+    plates, failures = {}, []
+    level = _logger.level
+    _logger.setLevel(_logging.CRITICAL) # Every name logs its fitting; failures are reported below.
+    try:
+        for chara_id, name in names.items():
+            for discard in (False, True):
+                text = _chara_name_text(name, discard=discard)
+                if text in plates:
+                    continue
+                try:
+                    plates[text] = _chara_name_plate(name, discard=discard)
+                except ValueError as e:
+                    failures.append((chara_id, discard, e))
+    finally:
+        _logger.setLevel(level)
+    count = _build_plates(plates.items(), _FONT_ID, args.output)
+    _logger.info("角色名牌表 '%s' 构建完成，共 %d 个名称，用时 %.2f 秒。", args.output, count, _time() - start)
+    for chara_id, discard, error in failures:
+        _logger.warning("角色 %s 的名称%s无法放入名牌：%s", chara_id, "（去掉注释后）" if discard else "", error)
+    if failures:
+        _logger.warning("%d 个名称无法放入名牌，绘制这些角色时请使用 --discard-comment 或 -n/--name。", len(failures))
+
+def _lint(args):
+    _logger.info("正在检查 '%s'，%d 个进程...", args.manifest, args.workers)
+    start = _time()
+    rows, failing = _lint_manifest(args.manifest, args.output, args.workers)
+    elapsed = _time() - start
+    _logger.info("检查完成，共 %d 行，用时 %.2f 秒（%.0f 行/秒）。", rows, elapsed, rows / max(elapsed, 1e-9))
+    if failing:
+        _logger.error("%d 行未通过检查，详见 '%s'。", failing, args.output)
+        raise SystemExit(1)
+
+def _stress(args):
+    _logger.info("正在以 %d 个线程并发绘制，共 %d 轮...", args.threads, args.rounds)
+    start = _time()
+    level = _logger.level
+    _logger.setLevel(_logging.WARNING) # The stages of hundreds of cards are only noise here.
+    try:
+        mismatches = _stress_render(args.threads, args.rounds)
+    finally:
+        _logger.setLevel(level)
+    for case, expected, actual in mismatches:
+        _logger.error("用例 %d 的并发绘制结果与单线程不一致：%s != %s", case + 1, actual, expected)
+    if mismatches:
+        raise SystemExit(1)
+    _logger.info("并发绘制结果与单线程完全一致，用时 %.2f 秒。", _time() - start)
+
+def _composite(args):
+    pass_type = _Pass[args.pass_type]
+    layers = [
+        (f"resources/character/CardChara{str(args.chara).zfill(7)}.png", (0, 0)),
+        (pass_type.value[0], (0, 0)),
+        (pass_type.value[0][:-4] + "Icon.png", pass_type.value[1]),
+        ("resources/general/SerialCode.png", (141, 1000)),
+    ]
+    if args.overhang:
+        # Past the bottom right corner, where both compositors clip the layer.
+        layers.append((pass_type.value[0][:-4] + "Icon.png", (700, 1000)))
+    pillow, fused, difference = _benchmark_stack(
+        f"resources/background/CardBase{str(args.background).zfill(6)}.png", layers, args.rounds)
+    _logger.info("Pillow 逐层合成：%.2f 毫秒；numpy 合成：%.2f 毫秒（%.2f 倍）。", pillow, fused, pillow / fused)
+    if difference > 1:
+        _logger.error("numpy 合成结果与 Pillow 相差 %d，超出 1。", difference)
+        raise SystemExit(1)
+    _logger.info("两者结果的最大差值为 %d。", difference)
+
+def _merge(args):
+    count, missing, conflicts = _merge_manifests(args.manifests, args.output, args.rows)
+    _logger.info("已合并 %d 份清单，共 %d 个文件，写入 '%s'。", len(args.manifests), count, args.output)
+    for index, member in conflicts:
+        _logger.error("第 %d 行的 '%s' 在不同分片中的校验值不一致。", index, member)
+    if missing:
+        _logger.error("%d 行没有完成：%s", len(missing), " ".join(map(str, missing)))
+    if conflicts or missing:
+        raise SystemExit(1)
+
+def _normalize(args):
+    paths = _normalize_resources(args.root, check=args.check)
+    for path in paths:
+        if args.check:
+            _logger.error("'%s' 不是 RGBA 图片。", path)
+        else:
+            _logger.info("已将 '%s' 转换为 RGBA。", path)
+    if args.check and paths:
+        _logger.error("%d 张图片需要转换，请运行 `py tools.py normalize`。", len(paths))
+        raise SystemExit(1)
+    _logger.info("'%s' 下的图片均为 RGBA。", args.root)
+
+def _watch(args):
+    watcher = _ResourceWatcher(_invalidate_resources, args.root, interval=args.interval, polling=args.polling)
+    _logger.info("正在监视 '%s'（%s），按 Ctrl+C 停止...", args.root, watcher.backend)
+    with watcher:
+        try:
+            _Event().wait(args.duration)
+        except KeyboardInterrupt:
+            pass
+    _logger.info("已停止监视。")
+
+def _daemon(args):
+    _signal.signal(_signal.SIGTERM, _signal.default_int_handler) # Stop like Ctrl+C, removing the socket.
+    try:
+        daemon = _RenderDaemon(threads=args.threads, watch=args.watch, polling=args.polling)
+    except OSError as e:
+        _logger.error("无法启动渲染守护进程：%s", e)
+        raise SystemExit(1) from e
+    daemon.serve_forever()
+
+def _main():
+    args = _toolparser()
+    _setup_logging()
+    {
+        "bundle": _bundle,
+        "atlas": _atlas,
+        "metrics": _metrics,
+        "plates": _plates,
+        "lint": _lint,
+        "stress": _stress,
+        "composite": _composite,
+        "merge": _merge,
+        "normalize": _normalize,
+        "watch": _watch,
+        "daemon": _daemon,
+    }[args.command](args)
+
+if __name__ == "__main__":
+    _main()